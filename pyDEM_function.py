@@ -1,9 +1,30 @@
+import cProfile
+import hashlib
+import json
+import multiprocessing
 import os
-import subprocess
+import re
+import resource
+import sys
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from concurrent.futures import wait
+from contextlib import contextmanager
+from itertools import islice
+from xml.sax.saxutils import escape
 
 import matplotlib.pyplot as plt
 import numpy as np
 from osgeo import gdal
+from osgeo import osr
 
 
 def get_file_names(file_path, file_type):
@@ -52,12 +73,50 @@ def get_dem_info(dem_data, if_print=False):
     return dem_row, dem_col, dem_band, dem_gt, dem_proj
 
 
-def write_dem(d_path, d_array, d_row, d_col, d_band, d_gt, d_proj, d_type=gdal.GDT_UInt16, d_frmt='GTiff'):
+def dem_creation_options(d_type=gdal.GDT_Int16, tiled=True, block_size=256, compress='DEFLATE', predictor=True,
+                         bigtiff='IF_SAFER', d_frmt='GTiff'):
+    '''Get the creation options of tiled, compressed GeoTIFF or Cloud-Optimized GeoTIFF (COG).
+
+    Parameters:
+        d_type <int> -- The data type of DEM (for choosing the predictor). Default is gdal.GDT_Int16.
+        tiled <bool> -- If use the tiled layout (GTiff only, COG is always tiled). Default is True.
+        block_size <int> -- The size of tiles. Default is 256.
+        compress <str> -- The compression ('DEFLATE', 'ZSTD', 'LZW' or None). Default is 'DEFLATE'.
+        predictor <bool> -- If use the floating-point (float DEM) or horizontal (integer DEM) predictor.
+            Default is True.
+        bigtiff <str> -- The BIGTIFF option ('YES', 'NO', 'IF_NEEDED' or 'IF_SAFER' for outputs over 4 GB).
+            Default is 'IF_SAFER'.
+        d_frmt <str> -- The data format ('GTiff' or 'COG'). Default is 'GTiff'.
+
+    Return:
+        d_options <list> -- The creation options (e.g., ['TILED=YES', 'COMPRESS=DEFLATE', ...]).
+    '''
+    if_float = d_type in (gdal.GDT_Float32, gdal.GDT_Float64)
+
+    d_options = ['BIGTIFF=' + bigtiff]
+    if d_frmt == 'COG':
+        d_options.append('BLOCKSIZE=%d' % block_size)
+    elif tiled:
+        d_options += ['TILED=YES', 'BLOCKXSIZE=%d' % block_size, 'BLOCKYSIZE=%d' % block_size]
+
+    if compress is not None:
+        d_options.append('COMPRESS=' + compress)
+        if predictor:
+            if d_frmt == 'COG':
+                d_options.append('PREDICTOR=' + ('FLOATING_POINT' if if_float else 'STANDARD'))
+            else:
+                d_options.append('PREDICTOR=' + ('3' if if_float else '2'))
+
+    return d_options
+
+
+def write_dem(d_path, d_array, d_row, d_col, d_band, d_gt, d_proj, d_type=gdal.GDT_UInt16, d_frmt='GTiff',
+              d_nodata=None, d_options=None, d_blocks=None, d_overviews=None, d_cog=False):
     '''Write data to a new DEM.
 
     Parameters:
         d_path <str> -- The path for saving new DEM.
-        d_array <numpy.ndarray> -- The data array.
+        d_array <numpy.ndarray> -- The data array (None if 'd_blocks' is given).
         d_row <int> -- The height of new DEM.
         d_col <int> -- The width of new DEM.
         d_band <int> -- The band number of new DEM.
@@ -65,139 +124,3495 @@ def write_dem(d_path, d_array, d_row, d_col, d_band, d_gt, d_proj, d_type=gdal.G
         d_proj <str> -- The GCS/PCS information of new DEM.
         d_type <str> -- The data type of new DEM. Default is gdal.GDT_UInt16.
         d_frmt <str> -- The data format of new DEM. Default is 'GTiff'.
+        d_nodata <float> -- The nodata value of new DEM. Default is None (not set).
+        d_options <list> -- The creation options of new DEM (see 'dem_creation_options'). Default is None.
+        d_blocks <iterable> -- The blocks (x_off, y_off, block_array) of data for writing huge DEM in pieces,
+            where block_array is in shape [row, col] or [band, row, col]. Default is None (write 'd_array').
+        d_overviews <list> -- The factors of internal overviews (e.g., [2, 4, 8, 16]). Default is None.
+        d_cog <bool> -- If write Cloud-Optimized GeoTIFF (COG, GDAL >= 3.1) with 'd_options' of COG.
+            Default is False.
 
     Return:
         0 <int> -- If writing to new DEM is completed.
     '''
-    if len(d_array.shape) == 3:
+    if d_array is None:
+        pass
+    elif len(d_array.shape) == 3:
         d_band, d_row, d_col = d_array.shape
     elif len(d_array.shape) == 2:
-        d_array = np.array([d_array])
+        d_array = d_array[np.newaxis]  # A view (not a copy) of the data array.
+        d_band, d_row, d_col = d_array.shape
     else:
         d_band, (d_row, d_col) = 1, d_array.shape
 
-    driver = gdal.GetDriverByName(d_frmt)
-    data = driver.Create(d_path, d_col, d_row, d_band, d_type)  # (col, row)
+    # COG is written through an intermediate tiled GeoTIFF and then translated with its overviews.
+    w_path = d_path + '.tmp.tif' if d_cog else d_path
+    w_frmt = 'GTiff' if d_cog else d_frmt
+    w_options = ['TILED=YES', 'BIGTIFF=IF_SAFER'] if d_cog else (d_options or [])
+
+    driver = gdal.GetDriverByName(w_frmt)
+    data = driver.Create(w_path, d_col, d_row, d_band, d_type, options=w_options)  # (col, row)
     if(data is not None):
         data.SetGeoTransform(d_gt)
         data.SetProjection(d_proj)
     for i in range(d_band):
-        data.GetRasterBand(i + 1).WriteArray(d_array[i])
+        if d_nodata is not None:
+            data.GetRasterBand(i + 1).SetNoDataValue(d_nodata)
+        if d_array is not None:
+            data.GetRasterBand(i + 1).WriteArray(d_array[i])
+
+    if d_blocks is not None:
+        for x_off, y_off, block_array in d_blocks:
+            if len(block_array.shape) == 2:
+                block_array = block_array[np.newaxis]
+            for i in range(d_band):
+                data.GetRasterBand(i + 1).WriteArray(block_array[i], x_off, y_off)
+
+    if d_overviews is not None and not d_cog:
+        data.BuildOverviews('AVERAGE', list(d_overviews))
     del data
 
+    if d_cog:
+        cog_options = list(d_options or [])
+        if d_overviews is not None:
+            cog_options.append('OVERVIEWS=AUTO')
+        gdal.Translate(d_path, w_path, options=gdal.TranslateOptions(format='COG', creationOptions=cog_options))
+        os.remove(w_path)
+
     return 0
 
 
-def show_2d_dem(dem_path, dem_name, img_path, img_name, img_frmt='.png', img_dpi=100):
-    '''Display and save 2D DEM image.
+def file_fingerprint(file_path, if_hash=False):
+    '''Get the fingerprint of a file (or of all files in a folder).
 
     Parameters:
-        dem_path <str> -- The path of DEM (in PCS) for display.
-        dem_name <str> -- The name of DEM (with extension).
-        img_path <str> -- The path for saving image.
-        img_name <str> -- The name of image.
-        img_frmt <str> -- The format of image. Default is '.png'.
-        img_dpi <int> -- The resolution of image. Default is 100.
+        file_path <str> -- The path of file or folder.
+        if_hash <bool> -- If include the SHA-1 hash of file content. Default is False (size and mtime only).
 
     Return:
-        0 <int> -- If display and saving image are completed.
+        fingerprint <dict> -- The fingerprint of file (None if the file does not exist).
     '''
-    gdal_data = gdal.Open(dem_path + dem_name)
-    gdal_array = gdal_data.ReadAsArray().astype(np.float)
+    if os.path.isdir(file_path):
+        return {name: file_fingerprint(os.path.join(file_path, name), if_hash=if_hash)
+                for name in sorted(os.listdir(file_path))}
+    if os.path.isfile(file_path) is False:
+        return None
+
+    file_stat = os.stat(file_path)
+    fingerprint = {'size': file_stat.st_size, 'mtime': file_stat.st_mtime_ns}
+    if if_hash:
+        sha1 = hashlib.sha1()
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                sha1.update(chunk)
+        fingerprint['sha1'] = sha1.hexdigest()
+
+    return fingerprint
+
+
+class DEMManifest(object):
+    '''Manifest of artifacts (e.g., reformed tiles, mosaics, warped DEMs and images).
+
+    Each artifact records the fingerprints of its inputs and outputs and the options it is built with,
+    so that re-runs only rebuild the artifacts whose inputs or options are changed.
+
+    Parameters:
+        manifest_path <str> -- The path of manifest file (JSON).
+        if_hash <bool> -- If fingerprint files by SHA-1 hash of content. Default is False (size and mtime).
+    '''
+
+    def __init__(self, manifest_path, if_hash=False):
+        self.manifest_path = manifest_path
+        self.if_hash = if_hash
+        self.records = {}
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, 'r') as file:
+                self.records = json.load(file)
+
+    @staticmethod
+    def _normalize(params):
+        '''Normalize the options of artifact to comparable JSON values.'''
+        return json.loads(json.dumps(params, sort_keys=True, default=str))
+
+    def _fingerprints(self, files):
+        return {file: file_fingerprint(file, if_hash=self.if_hash) for file in files}
+
+    def is_current(self, key, inputs, outputs, params=None):
+        '''Check if an artifact is up to date (so that building it can be skipped).
+
+        Parameters:
+            key <str> -- The unique key of artifact.
+            inputs <list> -- The paths of input files/folders.
+            outputs <list> -- The paths of output files/folders.
+            params <dict> -- The options of building artifact (e.g., EPSG codes). Default is None.
+
+        Return:
+            <bool> -- If the artifact is up to date.
+        '''
+        record = self.records.get(key)
+        if record is None:
+            return False
+        if any(os.path.exists(output) is False for output in outputs):
+            return False
+
+        return (record['params'] == self._normalize(params) and
+                record['inputs'] == self._normalize(self._fingerprints(inputs)) and
+                record['outputs'] == self._normalize(self._fingerprints(outputs)))
+
+    def update(self, key, inputs, outputs, params=None):
+        '''Record an artifact after building it (the manifest is saved by 'save').'''
+        self.records[key] = self._normalize({
+            'params': params,
+            'inputs': self._fingerprints(inputs),
+            'outputs': self._fingerprints(outputs),
+        })
+
+    def save(self):
+        '''Save the manifest file (write to a temporary file and then replace).'''
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(self.records, file, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+
+def _worker_pool(max_workers=None):
+    '''Get a process pool, or a thread pool inside a daemonic process.
+
+    A daemonic process (e.g., a stage of 'run_pipeline' on Python < 3.9) can not start worker processes,
+    then threads are used (GDAL releases the GIL when reading and writing DEMs).
+    '''
+    if multiprocessing.current_process().daemon:
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+    return ProcessPoolExecutor(max_workers=max_workers)
+
+
+# The default memory budget of a chunk of DEM read by 'iter_dem_blocks' in bytes.
+DEM_CHUNK_BUDGET = 64 * 1024 * 1024
+
+
+def dem_chunk_shape(dem_data, band=1, halo=0, mem_budget=None, itemsize=None, window=None):
+    '''Get the shape of chunks of DEM aligned to its native block size within a memory budget.
+
+    Chunks span the whole width of the window (in multiples of the block height) if a stripe of one block
+    height fits the budget, otherwise chunks are in multiples of the block width.
+
+    Parameters:
+        dem_data <osgeo.gdal.Dataset> -- The input DEM.
+        band <int> -- The band of DEM. Default is 1.
+        halo <int> -- The number of overlapped pixels on each side of chunks. Default is 0.
+        mem_budget <int> -- The memory budget of a chunk in bytes. Default is None (DEM_CHUNK_BUDGET).
+        itemsize <int> -- The bytes per pixel of chunks. Default is None (the native data type of DEM).
+        window <tuple> -- The window (x_off, y_off, x_size, y_size) of DEM. Default is None (the whole DEM).
+
+    Return:
+        chunk_row <int> -- The height of chunks (without halo).
+        chunk_col <int> -- The width of chunks (without halo).
+    '''
+    gdal_band = dem_data.GetRasterBand(band)
+    b_col, b_row = gdal_band.GetBlockSize()
+    if itemsize is None:
+        itemsize = max(1, gdal.GetDataTypeSize(gdal_band.DataType) // 8)
+    if mem_budget is None:
+        mem_budget = DEM_CHUNK_BUDGET
+    w_col = dem_data.RasterXSize if window is None else window[2]
+    w_row = dem_data.RasterYSize if window is None else window[3]
+
+    max_pixels = max(1, mem_budget // itemsize)
+    if (w_col + 2 * halo) * (b_row + 2 * halo) <= max_pixels:
+        chunk_col = w_col
+        chunk_row = max(b_row, (max_pixels // (w_col + 2 * halo) - 2 * halo) // b_row * b_row)
+    else:
+        chunk_row = b_row
+        chunk_col = max(b_col, (max_pixels // (b_row + 2 * halo) - 2 * halo) // b_col * b_col)
+
+    return min(chunk_row, w_row), min(chunk_col, w_col)
+
+
+# The default depth of the read-ahead queue and number of reader threads of prefetching readers.
+PREFETCH_DEPTH = 4
+PREFETCH_WORKERS = 2
+
+# The DEMs opened by each reader thread (GDAL datasets must not be shared by threads).
+_THREAD_DEMS = threading.local()
+
+
+def _thread_state():
+    '''Get the DEMs and block cache of the current thread (the ones inherited by a forked process are dropped).'''
+    if getattr(_THREAD_DEMS, 'pid', None) != os.getpid():
+        _THREAD_DEMS.pid = os.getpid()
+        _THREAD_DEMS.dems = {}
+        _THREAD_DEMS.block_cache = None
+
+    return _THREAD_DEMS
+
+
+def _file_id(dem_file):
+    '''Get the identity (modification time, size) of a DEM file (None if it is not a file, e.g., in memory).'''
+    try:
+        file_stat = os.stat(dem_file)
+    except (OSError, ValueError):
+        return None
+
+    return file_stat.st_mtime_ns, file_stat.st_size
+
+
+def _thread_dem(dem_file):
+    '''Open DEM once per thread (reopened if the file is rewritten).
+
+    The DEMs of reader threads and worker threads/processes are closed when they end, the DEMs opened in
+    the thread of caller are closed when leaving 'thread_dem_scope'.
+    '''
+    dems = _thread_state().dems
+    file_id = _file_id(dem_file)
+    if dem_file not in dems or dems[dem_file][0] != file_id:
+        dems[dem_file] = (file_id, open_dem(dem_file))
+
+    return dems[dem_file][1]
+
+
+@contextmanager
+def thread_dem_scope():
+    '''Close the DEMs opened by '_thread_dem' in the current thread within the scope when leaving it.'''
+    dems = _thread_state().dems
+    opened = set(dems)
+    try:
+        yield
+    finally:
+        for dem_file in [dem_file for dem_file in dems if dem_file not in opened]:
+            del dems[dem_file]
+
+
+def submit_iter(items, submit_func, depth):
+    '''Submit items to a pool with a bounded number of items in flight and yield their results in order.
+
+    At most 'depth' items are submitted ahead of the item being yielded, so the memory is bounded by
+    'depth' results regardless of the number of items.
+
+    Parameters:
+        items <iterable> -- The items to submit (e.g., windows or chunks).
+        submit_func <function> -- The function submitting an item to a pool (returns a <Future>).
+        depth <int> -- The number of items in flight (e.g., two per worker).
+
+    Return:
+        <generator> -- The items and their results (item, result) in the order of items.
+    '''
+    items = iter(items)
+    pending = deque((item, submit_func(item)) for item in islice(items, max(1, depth)))
+    while len(pending) > 0:
+        item, future = pending.popleft()
+        result = future.result()
+        for next_item in islice(items, 1):
+            pending.append((next_item, submit_func(next_item)))
+        yield item, result
+
+
+def prefetch_iter(items, read_func, depth=None, max_workers=None):
+    '''Read items ahead in a bounded thread pool while the current item is processed.
+
+    At most 'depth' items are read ahead, so the memory is bounded by 'depth' read results. The results
+    are yielded in the order of items. GDAL releases the GIL when decoding, so the reads of the next
+    items overlap the processing of the current item.
+
+    Parameters:
+        items <iterable> -- The items to read (e.g., tiles or windows).
+        read_func <function> -- The function reading an item (called in reader threads).
+        depth <int> -- The number of items read ahead. Default is None (PREFETCH_DEPTH). 0 reads in order
+            without threads.
+        max_workers <int> -- The number of reader threads. Default is None (PREFETCH_WORKERS).
+
+    Return:
+        <generator> -- The items and their read results (item, result).
+    '''
+    depth = PREFETCH_DEPTH if depth is None else depth
+    max_workers = PREFETCH_WORKERS if max_workers is None else max_workers
+    if depth <= 0 or max_workers <= 0:
+        with thread_dem_scope():
+            for item in items:
+                yield item, read_func(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for item, result in submit_iter(items, lambda item: pool.submit(read_func, item), depth):
+            yield item, result
+
+
+def read_dem_window(dem_file, window, band=None):
+    '''Read a window of DEM in a reader thread (see 'prefetch_iter').
+
+    Parameters:
+        dem_file <str> -- The path of DEM.
+        window <tuple> -- The window (x_off, y_off, x_size, y_size) of DEM.
+        band <int> -- The band of DEM. Default is None (all bands).
+
+    Return:
+        dem_array <numpy.ndarray> -- The window in the native data type, in shape [row, col] (one band)
+            or [band, row, col].
+    '''
+    dem_data = _thread_dem(dem_file)
+    if band is None:
+        return dem_data.ReadAsArray(*window)
+
+    return dem_data.GetRasterBand(band).ReadAsArray(*window)
+
+
+def read_dem_chunk(dem_data, window, band=1, halo=0, if_nan=False):
+    '''Read a window of DEM with a halo (padded with the edge values outside DEM).
+
+    Parameters:
+        dem_data <osgeo.gdal.Dataset> -- The input DEM.
+        window <tuple> -- The window (x_off, y_off, x_size, y_size) of DEM (without halo).
+        band <int> -- The band of DEM. Default is 1.
+        halo <int> -- The number of overlapped pixels on each side of window. Default is 0.
+        if_nan <bool> -- If read as float64 with nodata replaced by NaN. Default is False (native type).
+
+    Return:
+        chunk <numpy.ndarray> -- The window in shape [y_size + 2 * halo, x_size + 2 * halo].
+    '''
+    x_off, y_off, c_col, c_row = window
+    r_y0, r_x0 = max(0, y_off - halo), max(0, x_off - halo)
+    r_y1, r_x1 = min(dem_data.RasterYSize, y_off + c_row + halo), min(dem_data.RasterXSize, x_off + c_col + halo)
+
+    gdal_band = dem_data.GetRasterBand(band)
+    chunk = gdal_band.ReadAsArray(r_x0, r_y0, r_x1 - r_x0, r_y1 - r_y0)
+    if if_nan:
+        chunk = chunk.astype(np.float64)
+        nodataval = gdal_band.GetNoDataValue()
+        if nodataval is not None:
+            chunk[chunk == nodataval] = np.nan
+
+    # Pad the halo outside DEM.
+    pad = ((r_y0 - (y_off - halo), (y_off + c_row + halo) - r_y1),
+           (r_x0 - (x_off - halo), (x_off + c_col + halo) - r_x1))
+    if halo > 0 and any(p > 0 for p in pad[0] + pad[1]):
+        chunk = np.pad(chunk, pad, mode='edge')
+
+    return chunk
+
+
+def iter_dem_blocks(dem_data, band=1, halo=0, mem_budget=None, window=None, if_nan=False, prefetch_depth=None,
+                    prefetch_workers=None):
+    '''Iterate over the chunks of DEM (aligned to its native block size) with an optional halo.
+
+    Only one chunk (and the chunks read ahead) is held in memory at a time, so the peak memory is bounded
+    by the budget regardless of the size of DEM. The halo is read from the neighbouring pixels of DEM, and
+    padded with the edge values outside DEM, so each chunk has 'halo' pixels on every side (e.g., 1 for
+    3 x 3 kernels). The next chunks of DEM files are read ahead by a prefetching reader.
+
+    Parameters:
+        dem_data <osgeo.gdal.Dataset> -- The input DEM.
+        band <int> -- The band of DEM. Default is 1.
+        halo <int> -- The number of overlapped pixels on each side of chunks. Default is 0.
+        mem_budget <int> -- The memory budget of a chunk in bytes. Default is None (DEM_CHUNK_BUDGET).
+        window <tuple> -- The window (x_off, y_off, x_size, y_size) of DEM. Default is None (the whole DEM).
+        if_nan <bool> -- If read chunks as float64 with nodata replaced by NaN. Default is False (native type).
+        prefetch_depth <int> -- The number of chunks read ahead (see 'prefetch_iter'). Default is None
+            (PREFETCH_DEPTH). Chunks of in-memory DEMs are not read ahead.
+        prefetch_workers <int> -- The number of reader threads. Default is None (PREFETCH_WORKERS).
+
+    Return:
+        <generator> -- The chunks (x_off, y_off, chunk), where (x_off, y_off) is the offset of the chunk without
+            halo in DEM and chunk <numpy.ndarray> is in shape [row + 2 * halo, col + 2 * halo].
+    '''
+    d_row, d_col = dem_data.RasterYSize, dem_data.RasterXSize
+    w_x, w_y, w_col, w_row = (0, 0, d_col, d_row) if window is None else window
+    chunk_row, chunk_col = dem_chunk_shape(dem_data, band=band, halo=halo, mem_budget=mem_budget,
+                                           itemsize=8 if if_nan else None, window=(w_x, w_y, w_col, w_row))
+
+    chunks = [(x_off, y_off, min(chunk_col, w_x + w_col - x_off), min(chunk_row, w_y + w_row - y_off))
+              for y_off in range(w_y, w_y + w_row, chunk_row) for x_off in range(w_x, w_x + w_col, chunk_col)]
+
+    dem_file = dem_data.GetDescription()
+    if isinstance(dem_data, RawDEM) or os.path.isfile(dem_file) is False:
+        prefetch_depth = 0  # In-memory (or memory-mapped) DEM, read in order by the given dataset.
+
+        def read_chunk(chunk_window):
+            return read_dem_chunk(dem_data, chunk_window, band=band, halo=halo, if_nan=if_nan)
+    else:
+        def read_chunk(chunk_window):
+            return read_dem_chunk(_thread_dem(dem_file), chunk_window, band=band, halo=halo, if_nan=if_nan)
+
+    for (x_off, y_off, c_col, c_row), chunk in prefetch_iter(chunks, read_chunk, depth=prefetch_depth,
+                                                             max_workers=prefetch_workers):
+        yield x_off, y_off, chunk
+
+
+def _iter_dataset_blocks(dem_data, window=None, mem_budget=None, prefetch_depth=None, prefetch_workers=None):
+    '''Iterate over the chunks (x_off, y_off, chunk) of all bands of DEM in the native data type.
+
+    The chunk is in shape [row, col] for DEM of one band, or [band, row, col] (see 'write_dem').
+    '''
+    band_blocks = [iter_dem_blocks(dem_data, band=i + 1, mem_budget=mem_budget, window=window,
+                                   prefetch_depth=prefetch_depth, prefetch_workers=prefetch_workers)
+                   for i in range(dem_data.RasterCount)]
+    for blocks in zip(*band_blocks):
+        x_off, y_off, chunk = blocks[0]
+        yield x_off, y_off, chunk if len(blocks) == 1 else np.stack([block[2] for block in blocks])
+
+
+def _moments(values):
+    '''Get the mergeable moments [count, mean, m2, min, max, sum_abs] of a 1D array of values.'''
+    if values.size == 0:
+        return np.array([0.0, 0.0, 0.0, np.inf, -np.inf, 0.0])
+    v_mean = values.mean()
+
+    return np.array([values.size, v_mean, ((values - v_mean) ** 2).sum(), values.min(), values.max(),
+                     np.abs(values).sum()])
+
+
+def _merge_moments(moments_a, moments_b):
+    '''Merge the moments of two sets of values (Chan et al.), accurate for any number of values.'''
+    n_a, n_b = moments_a[0], moments_b[0]
+    if n_b == 0:
+        return moments_a
+    if n_a == 0:
+        return moments_b
+    delta = moments_b[1] - moments_a[1]
+    n_ab = n_a + n_b
+
+    return np.array([n_ab, moments_a[1] + delta * n_b / n_ab,
+                     moments_a[2] + moments_b[2] + delta ** 2 * n_a * n_b / n_ab,
+                     min(moments_a[3], moments_b[3]), max(moments_a[4], moments_b[4]), moments_a[5] + moments_b[5]])
+
+
+def dem_statistics(dem_data, band=1, mem_budget=None):
+    '''Get the statistics of valid (not nodata) elevation of DEM by streaming over chunks.
+
+    Parameters:
+        dem_data <osgeo.gdal.Dataset> -- The input DEM.
+        band <int> -- The band of DEM. Default is 1.
+        mem_budget <int> -- The memory budget of a chunk in bytes. Default is None (DEM_CHUNK_BUDGET).
+
+    Return:
+        dem_stats <dict> -- The 'count', 'nodata_count', 'min', 'max', 'mean' and 'std' of elevation.
+    '''
+    nodata_count = 0
+    moments = _moments(np.zeros(0))
+    for x_off, y_off, chunk in iter_dem_blocks(dem_data, band=band, mem_budget=mem_budget, if_nan=True):
+        valid = chunk[~np.isnan(chunk)]
+        nodata_count += chunk.size - valid.size
+        # Combine the mean and sum of squared deviations of chunks, accurate for large DEMs.
+        moments = _merge_moments(moments, _moments(valid))
+
+    count = int(moments[0])
+    dem_stats = {
+        'count': count,
+        'nodata_count': nodata_count,
+        'min': float(moments[3]) if count > 0 else np.nan,
+        'max': float(moments[4]) if count > 0 else np.nan,
+        'mean': float(moments[1]) if count > 0 else np.nan,
+        'std': float(np.sqrt(moments[2] / count)) if count > 0 else np.nan,
+    }
+
+    return dem_stats
+
+
+def reform_dem_tile(tile_file, reform_file, trim=1, prefetch_depth=None, prefetch_workers=None):
+    '''Remove the overlapped elements (the last rows and columns) of a DEM tile.
+
+    The tile is read in chunks through a window without the overlapped elements, and written in its native
+    data type (e.g., Int16) with its nodata value, so negative elevation and nodata are kept.
+
+    Parameters:
+        tile_file <str> -- The path of source tile.
+        reform_file <str> -- The path of reformed tile.
+        trim <int> -- The number of overlapped bottom rows/right columns to remove. Default is 1.
+        prefetch_depth <int> -- The number of chunks read ahead (see 'prefetch_iter'). Default is None
+            (PREFETCH_DEPTH).
+        prefetch_workers <int> -- The number of reader threads. Default is None (PREFETCH_WORKERS).
+
+    Return:
+        0 <int> -- If reforming DEM tile is completed.
+    '''
+    gdal_data = gdal.Open(tile_file)
+    i_row, i_col, i_band, i_gt, i_proj = get_dem_info(gdal_data)
     gdal_band = gdal_data.GetRasterBand(1)
-    nodataval = gdal_band.GetNoDataValue()
-    if np.any(gdal_array == nodataval):
-        gdal_array[gdal_array == nodataval] = np.nan
-    print('\nThe shape of DEM is: [%d, %d]' % (gdal_array.shape[0], gdal_array.shape[1]))
 
-    # Create the path for saving 2D DEM image.
-    if os.path.exists(img_path) is False:
-            os.mkdir(img_path)
+    # Read the window in chunks (native data type), so the memory is bounded for any size of tile.
+    dem_blocks = _iter_dataset_blocks(gdal_data, window=(0, 0, i_col - trim, i_row - trim),
+                                      prefetch_depth=prefetch_depth, prefetch_workers=prefetch_workers)
 
-    fig = plt.figure(dpi=img_dpi)
-    plt.title('2D DEM Image of ' + img_name)
-    plt.imshow(gdal_array)
-    plt.show()
-    fig.savefig(img_path + img_name + img_frmt)
+    if os.path.isfile(reform_file) is True:
+        os.remove(reform_file)
+    write_dem(reform_file, None, i_row - trim, i_col - trim, i_band, i_gt, i_proj,
+              d_type=gdal_band.DataType, d_nodata=gdal_band.GetNoDataValue(), d_blocks=dem_blocks)
 
     return 0
 
 
-def get_elevation(dem_gcs, site_latlng):
-    '''Get the elevation of given locations from DEM in GCS.
+def reform_dem_tiles(tile_path, tile_names, reform_path, manifest_path=None, max_workers=None, prefetch_depth=None,
+                     prefetch_workers=None):
+    '''Remove the overlapped elements (the last row and column) of DEM tiles in parallel.
 
     Parameters:
-        dem_gcs <osgeo.gdal.Dataset> -- The input DEM (in GCS).
-        site_latlng <numpy.ndarray> -- The latitude and longitude of given locations.
+        tile_path <str> -- The path of source tiles.
+        tile_names <list> -- The name of source tiles (with extension).
+        reform_path <str> -- The path for saving reformed tiles (with the same names).
+        manifest_path <str> -- The path of manifest of reformed tiles. Unchanged tiles are skipped.
+            Default is None (reform all tiles).
+        max_workers <int> -- The number of worker processes. Default is None (the number of CPUs).
+        prefetch_depth <int> -- The number of chunks read ahead in each worker. Default is None (PREFETCH_DEPTH).
+        prefetch_workers <int> -- The number of reader threads of each worker. Default is None
+            (PREFETCH_WORKERS).
 
     Return:
-        site_ele <numpy.ndarray> -- The elevation and other information of given locations.
+        0 <int> -- If reforming DEM tiles is completed.
     '''
-    gdal_data = dem_gcs
-    gdal_array = gdal_data.ReadAsArray().astype(np.float)
-    gdal_band = gdal_data.GetRasterBand(1)
-    nodataval = gdal_band.GetNoDataValue()
-    if np.any(gdal_array == nodataval):
-        gdal_array[gdal_array == nodataval] = np.nan
+    manifest = DEMManifest(manifest_path) if manifest_path is not None else None
+    if os.path.exists(reform_path) is False:
+        os.mkdir(reform_path)
 
-    gt = gdal_data.GetGeoTransform()
-    print('\nThe 6 GeoTransform parameters of DEM are:\n', gt)
+    tile_jobs = {}
+    for file_name in tile_names:
+        tile_key = 'reform:' + file_name
+        tile_io = ([tile_path + file_name], [reform_path + file_name])
+        if manifest is not None and manifest.is_current(tile_key, *tile_io):
+            print('\n>>> Skip the DEM (unchanged): %s' % file_name)
+            continue
+        tile_jobs[file_name] = (tile_key, tile_io)
 
-    N_site = site_latlng.shape[0]
-    Xgeo = site_latlng[:, 1]  # longitude
-    Ygeo = site_latlng[:, 0]  # latitude
+    t_start = time.time()
+    with _worker_pool(max_workers) as pool:
+        futures = {pool.submit(reform_dem_tile, tile_path + file_name, reform_path + file_name,
+                               prefetch_depth=prefetch_depth, prefetch_workers=prefetch_workers): file_name
+                   for file_name in tile_jobs}
+        for future in as_completed(futures):
+            file_name = futures[future]
+            future.result()
+            print('\n>>> Write the reformed DEM to:', file_name)
 
-    site_ele = np.zeros((N_site, 6))
-    for i in range(N_site):
-        # Note:
-        #     Xgeo = gt[0] + Xpixel * gt[1] + Yline * gt[2]
-        #     Ygeo = gt[3] + Xpixel * gt[4] + Yline * gt[5]
-        #
-        #     Xpixel - Pixel/column of DEM
-        #     Yline - Line/row of DEM
-        #
-        #     Xgeo - Longitude
-        #     Ygeo - Latitude
-        #
-        #     [0] = Longitude of left-top pixel
-        #     [3] = Latitude of left-top pixel
-        #
-        #     [1] = + Pixel width
-        #     [5] = - Pixel height
-        #
-        #     [2] = 0 for north up DEM
-        #     [4] = 0 for north up DEM
-
-        Xpixel = int(round((Xgeo[i] - gt[0]) / gt[1]))
-        Yline = int(round((Ygeo[i] - gt[3]) / gt[5]))
-
-        site_ele[i, 0] = int(i)  # The serial number of i-th location.
-        site_ele[i, 1] = Ygeo[i]  # latitude
-        site_ele[i, 2] = Xgeo[i]  # longitude
-        site_ele[i, 3] = Yline  # cow
-        site_ele[i, 4] = Xpixel  # column
-        site_ele[i, 5] = gdal_array[Yline, Xpixel]  # The elevation of i-th location.
+            if manifest is not None:
+                tile_key, tile_io = tile_jobs[file_name]
+                manifest.update(tile_key, *tile_io)
+                manifest.save()
+    t_total = time.time() - t_start
 
-    return site_ele
+    if len(tile_jobs) > 0:
+        print('\n*==> The number of reformed DEMs is: %d (%.2f s, %.2f tiles/s)' % (
+            len(tile_jobs), t_total, len(tile_jobs) / max(t_total, 1e-9)))
+
+    return 0
 
 
-def transprojcnvt_dem(dem_in, epsg_in, dem_out, epsg_out):
-    '''Transform, project, or convert the coordinate system of DEM.
+def parse_aster_tile_name(file_name):
+    '''Parse the latitude and longitude of the lower-left corner from the name of ASTER-GDEM tile.
 
     Parameters:
-        dem_in <str>   -- The path of input DEM.
-        epsg_in <int>  -- The EPSG code of input DEM.
-        dem_out <str>  -- The path of output DEM.
-        epsg_out <int> -- The EPSG code of output DEM.
+        file_name <str> -- The name of tile (e.g., 'ASTGTM2_N51W001_dem.tif').
 
     Return:
-        0 <int> -- If transformation, projection, or conversion is completed.
+        tile_lat <int> -- The latitude of the lower-left corner of tile (e.g., 51).
+        tile_lng <int> -- The longitude of the lower-left corner of tile (e.g., -1).
+    '''
+    match = re.search(r'([NS])(\d{2})([EW])(\d{3})', os.path.basename(file_name))
+    if match is None:
+        raise ValueError('Invalid name of ASTER-GDEM tile: %s' % file_name)
+
+    tile_lat = int(match.group(2)) * (1 if match.group(1) == 'N' else -1)
+    tile_lng = int(match.group(4)) * (1 if match.group(3) == 'E' else -1)
+
+    return tile_lat, tile_lng
+
+
+def _read_tile_header(tile_file):
+    '''Read the size, GeoTransform parameters, GCS/PCS information, data type and nodata value of a tile.'''
+    dem_data = open_dem(tile_file)
+    t_row, t_col, t_band, t_gt, t_proj = get_dem_info(dem_data)
+    gdal_band = dem_data.GetRasterBand(1)
+    header = {
+        'row': t_row, 'col': t_col, 'band': t_band, 'gt': list(t_gt), 'proj': t_proj,
+        'type': gdal_band.DataType, 'nodata': gdal_band.GetNoDataValue(),
+    }
+    del dem_data
+
+    return header
+
+
+class DEMTileCatalog(object):
+    '''Persistent catalog of DEM tiles with a grid-hash spatial index.
+
+    The catalog keeps the header (size, GeoTransform parameters, GCS/PCS information, data type and nodata
+    value) and bounds of each tile, so tiles are routed by location without opening them. Re-scanning a
+    folder only opens the new and changed tiles (by size and mtime). The tiles are in the same GCS/PCS.
+
+    Parameters:
+        catalog_path <str> -- The path of catalog file (JSON). Default is None (the catalog is not saved).
+    '''
+
+    def __init__(self, catalog_path=None):
+        self.catalog_path = catalog_path
+        self.records = {}
+        if catalog_path is not None and os.path.isfile(catalog_path):
+            with open(catalog_path, 'r') as file:
+                self.records = json.load(file)
+        self._build_index()
+
+    def scan(self, tile_path, file_type, recursive=True):
+        '''Add the tiles in a folder (tree) to the catalog and remove the deleted tiles of the folder.
+
+        Parameters:
+            tile_path <str> -- The path of folder of tiles.
+            file_type <str> -- The extension of tiles (e.g., '.tif' or '.npy').
+            recursive <bool> -- If scan the sub-folders. Default is True.
+
+        Return:
+            tile_names <list> -- The name of tiles (relative to 'tile_path', with extension).
+        '''
+        tile_names = []
+        for root, dirs, files in os.walk(tile_path):
+            dirs.sort()
+            for file in sorted(files):
+                if file.endswith(file_type):
+                    tile_names.append(os.path.relpath(os.path.join(root, file), tile_path))
+            if recursive is False:
+                break
+
+        n_open = 0
+        tile_files = set(tile_path + tile_name for tile_name in tile_names)
+        for tile_file in sorted(tile_files):
+            fingerprint = file_fingerprint(tile_file)
+            record = self.records.get(tile_file)
+            if record is not None and record['fingerprint'] == fingerprint:
+                continue
+            record = _read_tile_header(tile_file)
+            record['fingerprint'] = fingerprint
+            self.records[tile_file] = record
+            n_open += 1
+
+        for tile_file in list(self.records):
+            if tile_file.startswith(tile_path) and tile_file not in tile_files:
+                del self.records[tile_file]
+
+        self._build_index()
+        print('\n*==> The number of catalogued tiles is: %d (%d read)' % (len(tile_names), n_open))
+
+        return tile_names
+
+    def save(self):
+        '''Save the catalog file (write to a temporary file and then replace).'''
+        tmp_path = self.catalog_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(self.records, file, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.catalog_path)
+
+    def header(self, tile_file):
+        '''Get the header of a tile (read it if the tile is not catalogued).'''
+        record = self.records.get(tile_file)
+        if record is None:
+            record = _read_tile_header(tile_file)
+
+        return record
+
+    def _build_index(self):
+        '''Build the grid-hash index (cells of the median tile size) of the bounds of tiles.'''
+        self.files = sorted(self.records)
+        self.bounds = np.zeros((len(self.files), 4))
+        for i, tile_file in enumerate(self.files):
+            record = self.records[tile_file]
+            t_gt, t_row, t_col = record['gt'], record['row'], record['col']
+            x_corner = [t_gt[0] + col * t_gt[1] + row * t_gt[2] for row in (0, t_row) for col in (0, t_col)]
+            y_corner = [t_gt[3] + col * t_gt[4] + row * t_gt[5] for row in (0, t_row) for col in (0, t_col)]
+            self.bounds[i] = (min(x_corner), min(y_corner), max(x_corner), max(y_corner))
+
+        self.index = {}
+        if len(self.files) == 0:
+            self.cell_x = self.cell_y = 1.0
+            return
+        self.cell_x = max(float(np.median(self.bounds[:, 2] - self.bounds[:, 0])), 1e-12)
+        self.cell_y = max(float(np.median(self.bounds[:, 3] - self.bounds[:, 1])), 1e-12)
+        for i, (left, bottom, right, top) in enumerate(self.bounds):
+            for ix in range(int(np.floor(left / self.cell_x)), int(np.ceil(right / self.cell_x))):
+                for iy in range(int(np.floor(bottom / self.cell_y)), int(np.ceil(top / self.cell_y))):
+                    self.index.setdefault((ix, iy), []).append(i)
+
+    def query(self, bounds):
+        '''Get the tiles overlapping a bounding box.
+
+        Parameters:
+            bounds <tuple> -- The bounding box (left, bottom, right, top) in the GCS/PCS of tiles.
+
+        Return:
+            tile_files <list> -- The path of tiles overlapping the bounding box.
+        '''
+        left, bottom, right, top = bounds
+        candidates = set()
+        for ix in range(int(np.floor(left / self.cell_x)), int(np.floor(right / self.cell_x)) + 1):
+            for iy in range(int(np.floor(bottom / self.cell_y)), int(np.floor(top / self.cell_y)) + 1):
+                candidates.update(self.index.get((ix, iy), []))
+
+        return [self.files[i] for i in sorted(candidates)
+                if self.bounds[i, 0] < right and self.bounds[i, 2] > left and
+                self.bounds[i, 1] < top and self.bounds[i, 3] > bottom]
+
+    def locate(self, x_geo, y_geo):
+        '''Get the tile containing each location (the first tile in the catalog order if tiles overlap).
+
+        Parameters:
+            x_geo <numpy.ndarray> -- The X coordinates of locations in the GCS/PCS of tiles.
+            y_geo <numpy.ndarray> -- The Y coordinates of locations in the GCS/PCS of tiles.
+
+        Return:
+            tile_ids <numpy.ndarray> -- The index of tile in 'files' of each location (-1 if outside tiles).
+        '''
+        x_geo = np.atleast_1d(np.asarray(x_geo, dtype=np.float64))
+        y_geo = np.atleast_1d(np.asarray(y_geo, dtype=np.float64))
+        tile_ids = np.full(x_geo.shape[0], -1, dtype=np.int64)
+        finite = np.flatnonzero(np.isfinite(x_geo) & np.isfinite(y_geo))
+        if finite.shape[0] == 0 or len(self.files) == 0:
+            return tile_ids
+
+        # Group the locations by grid cell, then test only the tiles registered in each cell.
+        cell_ix = np.floor(x_geo[finite] / self.cell_x).astype(np.int64)
+        cell_iy = np.floor(y_geo[finite] / self.cell_y).astype(np.int64)
+        iy_min, iy_num = cell_iy.min(), cell_iy.max() - cell_iy.min() + 1
+        cell_ids = (cell_ix - cell_ix.min()) * iy_num + (cell_iy - iy_min)
+        order = np.argsort(cell_ids, kind='stable')
+        unique_ids, starts = np.unique(cell_ids[order], return_index=True)
+        ends = np.append(starts[1:], order.shape[0])
+        for cell_id, start, end in zip(unique_ids, starts, ends):
+            idx = finite[order[start:end]]
+            ix, iy = cell_id // iy_num + cell_ix.min(), cell_id % iy_num + iy_min
+            for i in self.index.get((int(ix), int(iy)), []):
+                left, bottom, right, top = self.bounds[i]
+                inside = ((tile_ids[idx] < 0) & (x_geo[idx] >= left) & (x_geo[idx] < right) &
+                          (y_geo[idx] > bottom) & (y_geo[idx] <= top))
+                tile_ids[idx[inside]] = i
+
+        return tile_ids
+
+
+def _mosaic_layout(tile_files, trim=0, catalog=None):
+    '''Compute the GeoTransform, size and tile placements of the mosaic of (north up) tiles.
+
+    The trailing (bottom/right) 'trim' rows and columns of each tile are excluded, e.g., trim=1
+    removes the one-pixel overlap of source ASTER-GDEM tiles. The headers of catalogued tiles are
+    taken from the catalog (the tiles are not opened).
+    '''
+    tiles = []
+    for tile_file in tile_files:
+        header = catalog.header(tile_file) if catalog is not None else _read_tile_header(tile_file)
+        t_gt = tuple(header['gt'])
+        if t_gt[2] != 0 or t_gt[4] != 0:
+            raise ValueError('The tile is not north up: %s' % tile_file)
+        tiles.append((tile_file, header['row'] - trim, header['col'] - trim, header['band'], t_gt, header['proj'],
+                      header['type'], header['nodata']))
+
+    if len(tiles) == 0:
+        raise ValueError('No tile is given for the mosaic.')
+
+    res_x, res_y = tiles[0][4][1], tiles[0][4][5]
+    for tile in tiles:
+        if not (np.isclose(tile[4][1], res_x) and np.isclose(tile[4][5], res_y)):
+            raise ValueError('The resolution of tile is different: %s' % tile[0])
+
+    # The left-top corner of the mosaic is given by the whole tile set (not the first tile).
+    m_gt = (min(tile[4][0] for tile in tiles), res_x, 0.0, max(tile[4][3] for tile in tiles), 0.0, res_y)
+
+    placements = []
+    for tile_file, t_row, t_col, t_band, t_gt, t_proj, t_type, t_nodata in tiles:
+        x_off = int(round((t_gt[0] - m_gt[0]) / res_x))
+        y_off = int(round((t_gt[3] - m_gt[3]) / res_y))
+        placements.append((y_off, x_off, t_row, t_col, tile_file))
+    placements.sort()  # N -> S, W -> E
+
+    layout = {
+        'gt': m_gt,
+        'row': max(y_off + t_row for y_off, x_off, t_row, t_col, tile_file in placements),
+        'col': max(x_off + t_col for y_off, x_off, t_row, t_col, tile_file in placements),
+        'band': tiles[0][3],
+        'proj': tiles[0][5],
+        'type': tiles[0][6],
+        'nodata': tiles[0][7],
+        'tiles': placements,
+    }
+
+    return layout
+
+
+def build_mosaic(tile_path, tile_names, dem_out, trim=0, d_frmt='GTiff', d_options=None, catalog=None,
+                 prefetch_depth=None, prefetch_workers=None):
+    '''Merge a grid of (N x M) DEM tiles into a mosaic by writing tiles one by one into the output.
+
+    The output is created once with the GeoTransform computed from the whole tile set. Tiles are
+    written chunk by chunk in the order of tile rows (N -> S, W -> E), so the memory is bounded by one chunk
+    (and the chunks read ahead while the current chunk is written).
+
+    Parameters:
+        tile_path <str> -- The path of tiles.
+        tile_names <list> -- The name of tiles (with extension), e.g., ASTER-GDEM tiles 'ASTGTM2_N51W001_dem.tif'.
+        dem_out <str> -- The path of output DEM.
+        trim <int> -- The number of overlapped bottom rows/right columns of tiles to exclude. Default is 0.
+        d_frmt <str> -- The data format of output DEM. Default is 'GTiff'.
+        d_options <list> -- The creation options of output DEM (see 'dem_creation_options'). Default is None.
+        catalog <DEMTileCatalog> -- The catalog of tiles (headers are not read again). Default is None.
+        prefetch_depth <int> -- The number of chunks read ahead (see 'prefetch_iter'). Default is None
+            (PREFETCH_DEPTH).
+        prefetch_workers <int> -- The number of reader threads. Default is None (PREFETCH_WORKERS).
+
+    Return:
+        0 <int> -- If merging DEM tiles is completed.
     '''
-    # Check if the output file exists. If so, delete it for overwriting.
+    tile_files = [tile_path + tile_name for tile_name in tile_names]
+    layout = _mosaic_layout(tile_files, trim=trim, catalog=catalog)
+
+    # Report the grid of ASTER-GDEM tiles (if the tiles are named by their lat/lng).
+    try:
+        tile_latlng = [parse_aster_tile_name(tile_name) for tile_name in tile_names]
+        print('\n*==> The grid of tiles is: [%d, %d] (lat %d ~ %d, lng %d ~ %d)' % (
+            len(set(lat for lat, lng in tile_latlng)), len(set(lng for lat, lng in tile_latlng)),
+            min(lat for lat, lng in tile_latlng), max(lat for lat, lng in tile_latlng),
+            min(lng for lat, lng in tile_latlng), max(lng for lat, lng in tile_latlng)))
+    except ValueError:
+        pass
+    print('\n*==> The shape of the merged DEM is: [%d, %d]' % (layout['row'], layout['col']))
+
     if os.path.isfile(dem_out) is True:
         os.remove(dem_out)
 
-    cmd = 'gdalwarp -s_srs EPSG:' + str(epsg_in) + ' -t_srs EPSG:' + str(epsg_out) + ' ' + dem_in + ' ' + dem_out
-    subprocess.call(cmd, shell=True)
+    def read_tiles():
+        for y_off, x_off, t_row, t_col, tile_file in layout['tiles']:
+            gdal_data = open_dem(tile_file)
+            for c_x_off, c_y_off, chunk in _iter_dataset_blocks(gdal_data, window=(0, 0, t_col, t_row),
+                                                                prefetch_depth=prefetch_depth,
+                                                                prefetch_workers=prefetch_workers):
+                yield x_off + c_x_off, y_off + c_y_off, chunk
+            del gdal_data
+
+    # The area not covered by tiles is filled with nodata.
+    write_dem(dem_out, None, layout['row'], layout['col'], layout['band'], layout['gt'], layout['proj'],
+              d_type=layout['type'], d_frmt=d_frmt, d_nodata=layout['nodata'], d_options=d_options,
+              d_blocks=read_tiles())
+
+    return 0
+
+
+def build_mosaic_vrt(tile_path, tile_names, vrt_out, trim=0, catalog=None):
+    '''Build a virtual mosaic (VRT) of a grid of (N x M) DEM tiles without writing the merged DEM.
+
+    Each tile is referenced through a source window, so the overlapped bottom rows/right columns of
+    source tiles (e.g., trim=1 for ASTER-GDEM) are excluded without reforming tiles. The VRT can be
+    used as the input of 'transprojcnvt_dem', 'get_elevation' and 'show_2d_dem'.
+
+    Parameters:
+        tile_path <str> -- The path of tiles.
+        tile_names <list> -- The name of tiles (with extension).
+        vrt_out <str> -- The path of output VRT (e.g., 'ASTGDEMv20_EPSG4326.vrt').
+        trim <int> -- The number of overlapped bottom rows/right columns of tiles to exclude. Default is 0.
+        catalog <DEMTileCatalog> -- The catalog of tiles (headers are not read again). Default is None.
+
+    Return:
+        0 <int> -- If building the virtual mosaic is completed.
+    '''
+    tile_files = [tile_path + tile_name for tile_name in tile_names]
+    layout = _mosaic_layout(tile_files, trim=trim, catalog=catalog)
+    print('\n*==> The shape of the merged DEM is: [%d, %d]' % (layout['row'], layout['col']))
+
+    vrt_dir = os.path.dirname(os.path.abspath(vrt_out))
+    type_name = gdal.GetDataTypeName(layout['type'])
+
+    lines = ['<VRTDataset rasterXSize="%d" rasterYSize="%d">' % (layout['col'], layout['row'])]
+    lines.append('  <SRS>%s</SRS>' % escape(layout['proj']))
+    lines.append('  <GeoTransform>%s</GeoTransform>' % ', '.join('%.17g' % p for p in layout['gt']))
+    for i in range(layout['band']):
+        lines.append('  <VRTRasterBand dataType="%s" band="%d">' % (type_name, i + 1))
+        if layout['nodata'] is not None:
+            lines.append('    <NoDataValue>%.17g</NoDataValue>' % layout['nodata'])
+        for y_off, x_off, t_row, t_col, tile_file in layout['tiles']:
+            lines.append('    <SimpleSource>')
+            lines.append('      <SourceFilename relativeToVRT="1">%s</SourceFilename>' % escape(
+                os.path.relpath(os.path.abspath(tile_file), vrt_dir)))
+            lines.append('      <SourceBand>%d</SourceBand>' % (i + 1))
+            lines.append('      <SrcRect xOff="0" yOff="0" xSize="%d" ySize="%d"/>' % (t_col, t_row))
+            lines.append('      <DstRect xOff="%d" yOff="%d" xSize="%d" ySize="%d"/>' % (x_off, y_off, t_col, t_row))
+            lines.append('    </SimpleSource>')
+        lines.append('  </VRTRasterBand>')
+    lines.append('</VRTDataset>')
+
+    with open(vrt_out, 'w') as vrt_file:
+        vrt_file.write('\n'.join(lines) + '\n')
 
     return 0
+
+
+def merge_dem_folder(tile_path, file_type, dem_out, if_vrt=False, trim=0, d_options=None, catalog_path=None,
+                     bounds=None, prefetch_depth=None, prefetch_workers=None):
+    '''Merge all DEM tiles in a folder (or the tiles overlapping a bounding box) into a mosaic (GeoTIFF or VRT).
+
+    Parameters:
+        tile_path <str> -- The path of folder of tiles.
+        file_type <str> -- The type of tiles (e.g., '.tif').
+        dem_out <str> -- The path of output DEM.
+        if_vrt <bool> -- If build a virtual mosaic (VRT). Default is False (write the merged DEM).
+        trim <int> -- The number of overlapped bottom rows/right columns of tiles to exclude. Default is 0.
+        d_options <list> -- The creation options of merged DEM (not for VRT). Default is None.
+        catalog_path <str> -- The path of tile catalog (see 'DEMTileCatalog'). Only new and changed tiles are
+            opened to update the catalog. Default is None (no catalog, all tiles are opened).
+        bounds <tuple> -- The bounding box (left, bottom, right, top) of tiles to merge, in the GCS/PCS of tiles.
+            Default is None (all tiles).
+        prefetch_depth <int> -- The number of chunks read ahead (not for VRT). Default is None (PREFETCH_DEPTH).
+        prefetch_workers <int> -- The number of reader threads (not for VRT). Default is None (PREFETCH_WORKERS).
+
+    Return:
+        0 <int> -- If merging DEM tiles is completed.
+    '''
+    catalog = None
+    if catalog_path is not None or bounds is not None:
+        catalog = DEMTileCatalog(catalog_path)
+        tile_names = catalog.scan(tile_path, file_type, recursive=False)
+        if catalog_path is not None:
+            catalog.save()
+        if bounds is not None:
+            tile_names = [os.path.relpath(tile_file, tile_path) for tile_file in catalog.query(bounds)
+                          if tile_file.startswith(tile_path)]
+    else:
+        tile_names = get_file_names(tile_path, file_type)
+    print('\n*==> The number of DEMs is: %d' % len(tile_names))
+
+    out_path = os.path.dirname(dem_out)
+    if out_path != '' and os.path.exists(out_path) is False:
+        os.mkdir(out_path)
+
+    if if_vrt:
+        return build_mosaic_vrt(tile_path, tile_names, dem_out, trim=trim, catalog=catalog)
+
+    return build_mosaic(tile_path, tile_names, dem_out, trim=trim, d_options=d_options, catalog=catalog,
+                        prefetch_depth=prefetch_depth, prefetch_workers=prefetch_workers)
+
+
+def build_dem_overviews(dem_file, min_size=256, resample='AVERAGE'):
+    '''Build the overviews (pyramid) of DEM if it has none (external .ovr file for read-only DEM).
+
+    The external overviews older than DEM (e.g., left by a previous DEM rewritten by warping) are stale, so they
+    are removed and rebuilt.
+
+    Parameters:
+        dem_file <str> -- The path of DEM.
+        min_size <int> -- The minimum size of the coarsest overview. Default is 256.
+        resample <str> -- The resampling method of overviews. Default is 'AVERAGE'.
+
+    Return:
+        ovr_num <int> -- The number of overview levels of DEM.
+    '''
+    ovr_file = dem_file + '.ovr'
+    if os.path.isfile(ovr_file) is True and os.path.getmtime(ovr_file) < os.path.getmtime(dem_file):
+        os.remove(ovr_file)
+
+    gdal_data = gdal.Open(dem_file)
+    ovr_num = gdal_data.GetRasterBand(1).GetOverviewCount()
+    if ovr_num == 0:
+        factors = []
+        factor = 2
+        while max(gdal_data.RasterYSize, gdal_data.RasterXSize) // factor >= min_size:
+            factors.append(factor)
+            factor *= 2
+        if len(factors) > 0:
+            gdal_data.BuildOverviews(resample, factors)
+        ovr_num = len(factors)
+    del gdal_data
+
+    return ovr_num
+
+
+def read_dem_decimated(gdal_data, max_row, max_col, band=1):
+    '''Read DEM decimated to fit the given size (GDAL reads from the matching overview if any).
+
+    Parameters:
+        gdal_data <osgeo.gdal.Dataset> -- The input DEM.
+        max_row <int> -- The maximum height of decimated DEM.
+        max_col <int> -- The maximum width of decimated DEM.
+        band <int> -- The band of DEM. Default is 1.
+
+    Return:
+        gdal_array <numpy.ndarray> -- The decimated DEM (float64, NaN for nodata).
+    '''
+    dem_row, dem_col = gdal_data.RasterYSize, gdal_data.RasterXSize
+    scale = max(dem_row / float(max_row), dem_col / float(max_col), 1.0)
+    buf_row = max(1, int(round(dem_row / scale)))
+    buf_col = max(1, int(round(dem_col / scale)))
+
+    gdal_band = gdal_data.GetRasterBand(band)
+    gdal_array = gdal_band.ReadAsArray(0, 0, dem_col, dem_row, buf_xsize=buf_col, buf_ysize=buf_row).astype(np.float64)
+    nodataval = gdal_band.GetNoDataValue()
+    if nodataval is not None:
+        gdal_array[gdal_array == nodataval] = np.nan
+
+    return gdal_array
+
+
+def show_2d_dem(dem_path, dem_name, img_path, img_name, img_frmt='.png', img_dpi=100, img_show=True,
+                if_overviews=True):
+    '''Display and save 2D DEM image.
+
+    Only the decimated DEM matching the size of image is read, so the cost scales with image pixels.
+
+    Parameters:
+        dem_path <str> -- The path of DEM (in PCS) for display.
+        dem_name <str> -- The name of DEM (with extension).
+        img_path <str> -- The path for saving image.
+        img_name <str> -- The name of image.
+        img_frmt <str> -- The format of image. Default is '.png'.
+        img_dpi <int> -- The resolution of image. Default is 100.
+        img_show <bool> -- If display image. Default is True (False for headless batch mode).
+        if_overviews <bool> -- If build (or reuse) the overviews of DEM. Default is True.
+
+    Return:
+        0 <int> -- If display and saving image are completed.
+    '''
+    if if_overviews:
+        build_dem_overviews(dem_path + dem_name)
+
+    fig = plt.figure(dpi=img_dpi)
+    fig_col, fig_row = fig.get_size_inches() * img_dpi  # The size of image in pixels.
+
+    gdal_data = gdal.Open(dem_path + dem_name)
+    print('\nThe shape of DEM is: [%d, %d]' % (gdal_data.RasterYSize, gdal_data.RasterXSize))
+    gdal_array = read_dem_decimated(gdal_data, int(fig_row), int(fig_col))
+    print('The shape of the displayed DEM is: [%d, %d]' % (gdal_array.shape[0], gdal_array.shape[1]))
+
+    # Create the path for saving 2D DEM image.
+    if os.path.exists(img_path) is False:
+        os.mkdir(img_path)
+
+    plt.title('2D DEM Image of ' + img_name)
+    plt.imshow(gdal_array)
+    fig.savefig(img_path + img_name + img_frmt)
+    if img_show:
+        plt.show()
+    plt.close(fig)
+
+    return 0
+
+
+# The half width of Pseudo Mercator PCS (EPSG 3857) in meters.
+MERC_HALF_WIDTH = 20037508.342789244
+
+
+def xyz_tile_bounds(tile_z, tile_x, tile_y):
+    '''Get the bounds of an XYZ (z/x/y) web tile in Pseudo Mercator PCS.
+
+    Parameters:
+        tile_z <int> -- The zoom level of tile.
+        tile_x <int> -- The column of tile (W -> E).
+        tile_y <int> -- The row of tile (N -> S).
+
+    Return:
+        tile_bounds <tuple> -- The bounds (min_x, min_y, max_x, max_y) of tile in meters.
+    '''
+    span = 2 * MERC_HALF_WIDTH / 2 ** tile_z
+    min_x = -MERC_HALF_WIDTH + tile_x * span
+    max_y = MERC_HALF_WIDTH - tile_y * span
+
+    return min_x, max_y - span, min_x + span, max_y
+
+
+def xyz_tiles_in_bounds(bounds, tile_z):
+    '''Get the XYZ web tiles (z, x, y) intersecting the bounds (min_x, min_y, max_x, max_y) in Pseudo Mercator PCS.'''
+    span = 2 * MERC_HALF_WIDTH / 2 ** tile_z
+    n_tile = 2 ** tile_z
+    x_min = int(np.clip(np.floor((bounds[0] + MERC_HALF_WIDTH) / span), 0, n_tile - 1))
+    x_max = int(np.clip(np.ceil((bounds[2] + MERC_HALF_WIDTH) / span) - 1, 0, n_tile - 1))
+    y_min = int(np.clip(np.floor((MERC_HALF_WIDTH - bounds[3]) / span), 0, n_tile - 1))
+    y_max = int(np.clip(np.ceil((MERC_HALF_WIDTH - bounds[1]) / span) - 1, 0, n_tile - 1))
+
+    return [(tile_z, tile_x, tile_y) for tile_y in range(y_min, y_max + 1) for tile_x in range(x_min, x_max + 1)]
+
+
+def horn_gradient(dem_halo, res_x, res_y):
+    '''Compute the gradient of DEM with the 3 x 3 kernel of Horn (1981).
+
+    Parameters:
+        dem_halo <numpy.ndarray> -- The DEM with a one-pixel halo on each side (NaN for nodata).
+        res_x <float> -- The pixel width of DEM.
+        res_y <float> -- The pixel height of DEM (positive).
+
+    Return:
+        dz_dx <numpy.ndarray> -- The gradient eastward, in shape [row - 2, col - 2].
+        dz_dy <numpy.ndarray> -- The gradient southward (the rows of DEM are N -> S), in shape [row - 2, col - 2].
+    '''
+    z = dem_halo
+    dz_dx = ((z[:-2, 2:] + 2 * z[1:-1, 2:] + z[2:, 2:]) - (z[:-2, :-2] + 2 * z[1:-1, :-2] + z[2:, :-2])) / (8 * res_x)
+    dz_dy = ((z[2:, :-2] + 2 * z[2:, 1:-1] + z[2:, 2:]) - (z[:-2, :-2] + 2 * z[:-2, 1:-1] + z[:-2, 2:])) / (8 * res_y)
+
+    return dz_dx, dz_dy
+
+
+def _shade(dz_dx, dz_dy, azimuth=315.0, altitude=45.0):
+    '''Compute the hillshade (0 ~ 1) from the gradient of DEM.'''
+    slope = np.arctan(np.hypot(dz_dx, dz_dy))
+    aspect = np.arctan2(dz_dy, -dz_dx)  # The rows of DEM are N -> S (dz_dy is positive southward).
+    zenith = np.radians(90.0 - altitude)
+    azimuth = np.radians(360.0 - azimuth + 90.0)
+    shade = np.cos(zenith) * np.cos(slope) + np.sin(zenith) * np.sin(slope) * np.cos(azimuth - aspect)
+
+    return np.clip(shade, 0.0, 1.0)
+
+
+def hillshade(dem_array, res_x, res_y, azimuth=315.0, altitude=45.0, z_factor=1.0):
+    '''Compute the hillshade (0 ~ 1) of DEM in PCS.
+
+    Parameters:
+        dem_array <numpy.ndarray> -- The DEM (NaN for nodata).
+        res_x <float> -- The pixel width of DEM.
+        res_y <float> -- The pixel height of DEM (positive).
+        azimuth <float> -- The azimuth of light source in degrees (clockwise from north). Default is 315.
+        altitude <float> -- The altitude of light source in degrees. Default is 45.
+        z_factor <float> -- The factor of elevation. Default is 1.
+
+    Return:
+        shade <numpy.ndarray> -- The hillshade of DEM.
+    '''
+    dz_dx, dz_dy = horn_gradient(np.pad(dem_array * z_factor, 1, mode='edge'), res_x, res_y)
+
+    return _shade(dz_dx, dz_dy, azimuth=azimuth, altitude=altitude)
+
+
+# The data type and nodata value of terrain derivatives written by 'dem_derivatives'.
+DERIVATIVE_TYPES = {
+    'slope': (gdal.GDT_Float32, -9999.0),  # degrees
+    'aspect': (gdal.GDT_Float32, -9999.0),  # degrees clockwise from north (-1 for flat)
+    'hillshade': (gdal.GDT_Byte, 0),  # 1 ~ 255
+}
+
+
+def terrain_derivatives(dem_halo, res_x, res_y, products=('slope', 'aspect', 'hillshade'), azimuth=315.0,
+                        altitude=45.0, z_factor=1.0):
+    '''Compute the slope, aspect and hillshade of a chunk of DEM (with a one-pixel halo).
+
+    Parameters:
+        dem_halo <numpy.ndarray> -- The DEM with a one-pixel halo on each side (NaN for nodata).
+        res_x <float> -- The pixel width of DEM.
+        res_y <float> -- The pixel height of DEM (positive).
+        products <tuple> -- The derivatives to compute ('slope', 'aspect' and/or 'hillshade').
+        azimuth <float> -- The azimuth of light source in degrees (clockwise from north). Default is 315.
+        altitude <float> -- The altitude of light source in degrees. Default is 45.
+        z_factor <float> -- The factor of elevation. Default is 1.
+
+    Return:
+        derivatives <dict> -- The derivatives in shape [row - 2, col - 2] (see 'DERIVATIVE_TYPES'), with the
+            nodata value where any of 3 x 3 neighbours is nodata.
+    '''
+    dz_dx, dz_dy = horn_gradient(dem_halo * z_factor, res_x, res_y)
+    invalid = np.isnan(dz_dx) | np.isnan(dz_dy)
+
+    derivatives = {}
+    for product in products:
+        if product == 'slope':
+            value = np.degrees(np.arctan(np.hypot(dz_dx, dz_dy)))
+        elif product == 'aspect':
+            # The direction the slope faces: downslope vector (east, north) = (-dz_dx, dz_dy).
+            value = np.mod(np.degrees(np.arctan2(-dz_dx, dz_dy)), 360.0)
+            value[(dz_dx == 0) & (dz_dy == 0)] = -1.0
+        elif product == 'hillshade':
+            value = 1.0 + np.rint(254.0 * _shade(dz_dx, dz_dy, azimuth=azimuth, altitude=altitude))
+        else:
+            raise ValueError('Unknown terrain derivative: %s' % product)
+        value[invalid] = DERIVATIVE_TYPES[product][1]
+        derivatives[product] = value
+
+    return derivatives
+
+
+def _derivative_chunk(dem_file, window, res_x, res_y, products, azimuth, altitude, z_factor):
+    '''Compute the terrain derivatives of a chunk of DEM (in a worker process).'''
+    dem_halo = read_dem_chunk(_thread_dem(dem_file), window, halo=1, if_nan=True)
+
+    return terrain_derivatives(dem_halo, res_x, res_y, products=products, azimuth=azimuth, altitude=altitude,
+                               z_factor=z_factor)
+
+
+def dem_derivatives(dem_file, out_files, azimuth=315.0, altitude=45.0, z_factor=1.0, mem_budget=None,
+                    max_workers=None, d_options=None):
+    '''Compute the slope, aspect and hillshade of DEM in PCS in chunks with a process pool.
+
+    Each chunk is read with a one-pixel halo, so the result is the same (seam free) for any chunk size.
+    The outputs are created by 'write_dem' (e.g., tiled and compressed GeoTIFFs), and the chunks are written
+    as they are completed. At most two chunks per worker are in flight, so the memory is bounded.
+
+    Parameters:
+        dem_file <str> -- The path of DEM in PCS (north up, e.g., BNG or LAEA).
+        out_files <dict> -- The paths of derivatives {'slope': ..., 'aspect': ..., 'hillshade': ...} (any subset).
+        azimuth <float> -- The azimuth of light source in degrees (clockwise from north). Default is 315.
+        altitude <float> -- The altitude of light source in degrees. Default is 45.
+        z_factor <float> -- The factor of elevation (e.g., to convert feet to meters). Default is 1.
+        mem_budget <int> -- The memory budget of a chunk in bytes. Default is None (DEM_CHUNK_BUDGET).
+        max_workers <int> -- The number of worker processes. Default is None (the number of CPUs).
+        d_options <list> -- The creation options of derivatives. Default is None (tiled, compressed GeoTIFFs
+            from 'dem_creation_options' for the data type of each derivative).
+
+    Return:
+        0 <int> -- If computing the derivatives is completed.
+    '''
+    gdal_data = gdal.Open(dem_file)
+    d_row, d_col, d_band, d_gt, d_proj = get_dem_info(gdal_data)
+    if d_gt[2] != 0 or d_gt[4] != 0:
+        raise ValueError('The DEM is not north up: %s' % dem_file)
+    res_x, res_y = d_gt[1], -d_gt[5]
+
+    # The chunks are aligned to the blocks of DEM, sized for the temporary arrays of kernels (float64).
+    chunk_row, chunk_col = dem_chunk_shape(gdal_data, halo=1, mem_budget=mem_budget, itemsize=8 * 8)
+    windows = [(x_off, y_off, min(chunk_col, d_col - x_off), min(chunk_row, d_row - y_off))
+               for y_off in range(0, d_row, chunk_row) for x_off in range(0, d_col, chunk_col)]
+    del gdal_data
+    print('\n*==> The number of chunks of DEM is: %d ([%d, %d] per chunk)' % (len(windows), chunk_row, chunk_col))
+
+    products = tuple(out_files)
+    out_data = {}
+    for product, out_file in out_files.items():
+        if os.path.isfile(out_file) is True:
+            os.remove(out_file)
+        d_type, d_nodata = DERIVATIVE_TYPES[product]
+        w_options = d_options if d_options is not None else dem_creation_options(d_type)
+        write_dem(out_file, None, d_row, d_col, 1, d_gt, d_proj, d_type=d_type, d_nodata=d_nodata,
+                  d_options=w_options)
+        out_data[product] = gdal.Open(out_file, gdal.GA_Update)
+
+    n_workers = max_workers if max_workers is not None else os.cpu_count()
+    t_start = time.time()
+    with _worker_pool(max_workers) as pool:
+        def submit_chunk(window):
+            return pool.submit(_derivative_chunk, dem_file, window, res_x, res_y, products, azimuth, altitude,
+                               z_factor)
+
+        for (x_off, y_off, _, _), values in submit_iter(windows, submit_chunk, 2 * n_workers):
+            for product, value in values.items():
+                out_data[product].GetRasterBand(1).WriteArray(value, x_off, y_off)
+    for product in products:
+        out_data[product].FlushCache()
+    del out_data
+
+    print('\n*==> The derivatives (%s) are computed in %.2f s' % (', '.join(products), time.time() - t_start))
+
+    return 0
+
+
+def render_xyz_tile(dem_file, tile_z, tile_x, tile_y, tile_dir, tile_size=256, cmap='terrain', vmin=0.0, vmax=1000.0,
+                    if_hillshade=False, img_frmt='png'):
+    '''Render an XYZ web tile (tile_dir/z/x/y.png) from DEM in Pseudo Mercator PCS.
+
+    Parameters:
+        dem_file <str> -- The path of DEM in Pseudo Mercator PCS (north up).
+        tile_z <int> -- The zoom level of tile.
+        tile_x <int> -- The column of tile.
+        tile_y <int> -- The row of tile.
+        tile_dir <str> -- The path for saving tiles.
+        tile_size <int> -- The size of tile in pixels. Default is 256.
+        cmap <str> -- The colormap of elevation. Default is 'terrain'.
+        vmin <float> -- The elevation of the lowest color. Default is 0.
+        vmax <float> -- The elevation of the highest color. Default is 1000.
+        if_hillshade <bool> -- If blend the hillshade with colors. Default is False.
+        img_frmt <str> -- The format of tile ('png' or 'webp'). Default is 'png'.
+
+    Return:
+        tile_file <str> -- The path of tile (None if the tile is empty or all nodata and is skipped).
+    '''
+    gdal_data = gdal.Open(dem_file)
+    gt = gdal_data.GetGeoTransform()
+    dem_row, dem_col = gdal_data.RasterYSize, gdal_data.RasterXSize
+    min_x, min_y, max_x, max_y = xyz_tile_bounds(tile_z, tile_x, tile_y)
+
+    # The window of tile in DEM (fractional pixel/line) and the scale of tile pixels per DEM pixel.
+    px_0, px_1 = (min_x - gt[0]) / gt[1], (max_x - gt[0]) / gt[1]
+    py_0, py_1 = (max_y - gt[3]) / gt[5], (min_y - gt[3]) / gt[5]
+    scale_x, scale_y = tile_size / (px_1 - px_0), tile_size / (py_1 - py_0)
+
+    win_x0, win_x1 = int(max(np.floor(px_0), 0)), int(min(np.ceil(px_1), dem_col))
+    win_y0, win_y1 = int(max(np.floor(py_0), 0)), int(min(np.ceil(py_1), dem_row))
+    if win_x1 <= win_x0 or win_y1 <= win_y0:
+        return None
+
+    # The part of tile covered by the window.
+    out_x0 = int(np.clip(round((win_x0 - px_0) * scale_x), 0, tile_size - 1))
+    out_x1 = int(np.clip(round((win_x1 - px_0) * scale_x), out_x0 + 1, tile_size))
+    out_y0 = int(np.clip(round((win_y0 - py_0) * scale_y), 0, tile_size - 1))
+    out_y1 = int(np.clip(round((win_y1 - py_0) * scale_y), out_y0 + 1, tile_size))
+
+    gdal_band = gdal_data.GetRasterBand(1)
+    win_array = gdal_band.ReadAsArray(win_x0, win_y0, win_x1 - win_x0, win_y1 - win_y0,
+                                      buf_xsize=out_x1 - out_x0, buf_ysize=out_y1 - out_y0).astype(np.float64)
+    nodataval = gdal_band.GetNoDataValue()
+    if nodataval is not None:
+        win_array[win_array == nodataval] = np.nan
+    if np.all(np.isnan(win_array)):
+        return None
+
+    tile_array = np.full((tile_size, tile_size), np.nan)
+    tile_array[out_y0:out_y1, out_x0:out_x1] = win_array
+
+    tile_rgba = plt.get_cmap(cmap)(np.clip((tile_array - vmin) / float(vmax - vmin), 0.0, 1.0))
+    if if_hillshade:
+        tile_res = (max_x - min_x) / tile_size
+        shade = np.nan_to_num(hillshade(tile_array, tile_res, tile_res), nan=1.0)
+        tile_rgba[..., :3] *= (0.4 + 0.6 * shade)[..., np.newaxis]
+    tile_rgba[..., 3] = np.where(np.isnan(tile_array), 0.0, 1.0)  # Nodata is transparent.
+
+    tile_file = os.path.join(tile_dir, str(tile_z), str(tile_x), '%d.%s' % (tile_y, img_frmt))
+    os.makedirs(os.path.dirname(tile_file), exist_ok=True)
+    plt.imsave(tile_file, tile_rgba, format=img_frmt)
+
+    return tile_file
+
+
+def render_xyz_tiles(dem_file, tile_dir, tile_zooms, tile_size=256, cmap='terrain', if_hillshade=False, img_frmt='png',
+                     vmin=None, vmax=None, bounds=None, bounds_epsg=None, max_workers=None):
+    '''Render the XYZ web tile pyramid (tile_dir/z/x/y.png) from DEM in Pseudo Mercator PCS in parallel.
+
+    Parameters:
+        dem_file <str> -- The path of DEM in Pseudo Mercator PCS (e.g., 'ASTGDEMv20_EPSG3857.tif').
+        tile_dir <str> -- The path for saving tiles.
+        tile_zooms <list> -- The zoom levels of tiles (e.g., [8, 9, 10]).
+        tile_size <int> -- The size of tile in pixels. Default is 256.
+        cmap <str> -- The colormap of elevation. Default is 'terrain'.
+        if_hillshade <bool> -- If blend the hillshade with colors. Default is False.
+        img_frmt <str> -- The format of tiles ('png' or 'webp'). Default is 'png'.
+        vmin <float> -- The elevation of the lowest color. Default is None (2nd percentile of DEM).
+        vmax <float> -- The elevation of the highest color. Default is None (98th percentile of DEM).
+        bounds <tuple> -- The bounds (min_x, min_y, max_x, max_y) for rebuilding only the tiles under them
+            (e.g., the bounds of a changed source tile). Default is None (the bounds of DEM).
+        bounds_epsg <int> -- The EPSG code of 'bounds' (e.g., 4326). Default is None (in Pseudo Mercator PCS).
+        max_workers <int> -- The number of worker processes. Default is None (the number of CPUs).
+
+    Return:
+        tile_num <int> -- The number of rendered tiles (empty or all nodata tiles are skipped).
+    '''
+    gdal_data = gdal.Open(dem_file)
+    gt = gdal_data.GetGeoTransform()
+    dem_bounds = (gt[0], gt[3] + gdal_data.RasterYSize * gt[5], gt[0] + gdal_data.RasterXSize * gt[1], gt[3])
+
+    # The same color range is used by all tiles.
+    if vmin is None or vmax is None:
+        dem_overview = read_dem_decimated(gdal_data, 1024, 1024)
+        vmin = np.nanpercentile(dem_overview, 2) if vmin is None else vmin
+        vmax = np.nanpercentile(dem_overview, 98) if vmax is None else vmax
+
+    if bounds is None:
+        bounds = dem_bounds
+    elif bounds_epsg is not None:
+        x_geo, y_geo = transform_points([bounds[0], bounds[0], bounds[2], bounds[2]],
+                                        [bounds[1], bounds[3], bounds[1], bounds[3]],
+                                        bounds_epsg, gdal_data.GetProjection())
+        bounds = (x_geo.min(), y_geo.min(), x_geo.max(), y_geo.max())
+    bounds = (max(bounds[0], dem_bounds[0]), max(bounds[1], dem_bounds[1]),
+              min(bounds[2], dem_bounds[2]), min(bounds[3], dem_bounds[3]))
+    del gdal_data
+
+    tiles = []
+    if bounds[0] < bounds[2] and bounds[1] < bounds[3]:
+        for tile_z in tile_zooms:
+            tiles += xyz_tiles_in_bounds(bounds, tile_z)
+    print('\n*==> The number of XYZ tiles is: %d' % len(tiles))
+
+    # At most two tiles per worker are in flight, so the memory is bounded at any zoom level.
+    tile_num = 0
+    n_workers = max_workers if max_workers is not None else os.cpu_count()
+    t_start = time.time()
+    with _worker_pool(max_workers) as pool:
+        def submit_tile(tile):
+            return pool.submit(render_xyz_tile, dem_file, *tile, tile_dir, tile_size=tile_size, cmap=cmap,
+                               vmin=vmin, vmax=vmax, if_hillshade=if_hillshade, img_frmt=img_frmt)
+
+        for tile, tile_file in submit_iter(tiles, submit_tile, 2 * n_workers):
+            tile_num += tile_file is not None
+    t_total = time.time() - t_start
+
+    print('*==> The number of rendered XYZ tiles is: %d (%d skipped, %.2f s, %.2f tiles/s)' % (
+        tile_num, len(tiles) - tile_num, t_total, len(tiles) / max(t_total, 1e-9)))
+
+    return tile_num
+
+
+def dem_geo_to_pixel(dem_gt, x_geo, y_geo):
+    '''Convert the coordinates of locations to the fractional pixel/line positions in DEM.
+
+    Parameters:
+        dem_gt <tuple> -- The 6 GeoTransform parameters of DEM.
+        x_geo <numpy.ndarray> -- The X coordinates (e.g., longitude) of locations.
+        y_geo <numpy.ndarray> -- The Y coordinates (e.g., latitude) of locations.
+
+    Return:
+        x_pixel <numpy.ndarray> -- The fractional pixel/column positions of locations.
+        y_line <numpy.ndarray> -- The fractional line/row positions of locations.
+    '''
+    # Note:
+    #     Xgeo = gt[0] + Xpixel * gt[1] + Yline * gt[2]
+    #     Ygeo = gt[3] + Xpixel * gt[4] + Yline * gt[5]
+    #
+    #     Invert the affine transform so that rotated (gt[2], gt[4] != 0) DEMs are also supported.
+    gt = dem_gt
+    x_off = np.asarray(x_geo, dtype=np.float64) - gt[0]
+    y_off = np.asarray(y_geo, dtype=np.float64) - gt[3]
+    det = gt[1] * gt[5] - gt[2] * gt[4]
+    x_pixel = (gt[5] * x_off - gt[2] * y_off) / det
+    y_line = (gt[1] * y_off - gt[4] * x_off) / det
+
+    return x_pixel, y_line
+
+
+# The GDAL data types of NumPy data types (for the raw DEM store).
+_GDAL_TYPES = {
+    'uint8': gdal.GDT_Byte, 'uint16': gdal.GDT_UInt16, 'int16': gdal.GDT_Int16, 'uint32': gdal.GDT_UInt32,
+    'int32': gdal.GDT_Int32, 'float32': gdal.GDT_Float32, 'float64': gdal.GDT_Float64,
+}
+
+
+def export_raw_dem(dem_file, raw_file, band=1, chunk_bytes=64 * 1024 * 1024):
+    '''Export a band of DEM to the raw store (uncompressed .npy file with a JSON sidecar).
+
+    The raw DEM is written in the native data type of DEM (C order, aligned header), so it can be opened
+    with 'np.memmap' (see 'RawDEM') and shared by many processes through the page cache without decoding.
+    The sidecar ('<raw_file>.json') keeps the GeoTransform parameters, GCS/PCS information and nodata value.
+
+    Parameters:
+        dem_file <str> -- The path of DEM (any format readable by GDAL, e.g., TIF or VRT).
+        raw_file <str> -- The path of raw DEM (with '.npy' extension).
+        band <int> -- The band of DEM to export. Default is 1.
+        chunk_bytes <int> -- The memory budget of a chunk read at once in bytes. Default is 64 MB.
+
+    Return:
+        0 <int> -- If exporting DEM is completed.
+    '''
+    gdal_data = gdal.Open(dem_file)
+    d_row, d_col, d_band, d_gt, d_proj = get_dem_info(gdal_data)
+    gdal_band = gdal_data.GetRasterBand(band)
+
+    d_dtype = gdal_band.ReadAsArray(0, 0, 1, 1).dtype
+
+    # Write to a temporary file first, so a partial raw DEM is never left at 'raw_file'.
+    raw_tmp = raw_file[:-len('.npy')] + '.tmp.npy' if raw_file.endswith('.npy') else raw_file + '.tmp.npy'
+    raw_array = np.lib.format.open_memmap(raw_tmp, mode='w+', dtype=d_dtype, shape=(d_row, d_col))
+    for x_off, y_off, chunk in iter_dem_blocks(gdal_data, band=band, mem_budget=chunk_bytes):
+        raw_array[y_off:y_off + chunk.shape[0], x_off:x_off + chunk.shape[1]] = chunk
+    raw_array.flush()
+    del raw_array
+    os.replace(raw_tmp, raw_file)
+
+    raw_meta = {
+        'shape': [d_row, d_col],
+        'dtype': d_dtype.name,
+        'geotransform': list(d_gt),
+        'projection': d_proj,
+        'nodata': gdal_band.GetNoDataValue(),
+        'source': os.path.abspath(dem_file),
+    }
+    with open(raw_file + '.json', 'w') as f:
+        json.dump(raw_meta, f, indent=1)
+    del gdal_data
+
+    return 0
+
+
+def export_raw_dems(dem_path, dem_names, raw_path, max_workers=None):
+    '''Export DEMs (e.g., reformed tiles) to the raw store in parallel.
+
+    Parameters:
+        dem_path <str> -- The path of DEMs.
+        dem_names <list> -- The name of DEMs (with extension).
+        raw_path <str> -- The path for saving raw DEMs (with '.npy' extension).
+        max_workers <int> -- The number of worker processes. Default is None (the number of CPUs).
+
+    Return:
+        0 <int> -- If exporting DEMs is completed.
+    '''
+    if os.path.exists(raw_path) is False:
+        os.mkdir(raw_path)
+
+    with _worker_pool(max_workers) as pool:
+        futures = {pool.submit(export_raw_dem, dem_path + dem_name,
+                               raw_path + os.path.splitext(dem_name)[0] + '.npy'): dem_name for dem_name in dem_names}
+        for future in as_completed(futures):
+            future.result()
+            print('\n>>> Write the raw DEM of:', futures[future])
+
+    return 0
+
+
+class RawDEMBand(object):
+    '''The band of raw DEM (the subset of <osgeo.gdal.Band> used by the sampling and stats functions).'''
+
+    def __init__(self, raw_dem):
+        self.raw_dem = raw_dem
+        self.XSize = raw_dem.RasterXSize
+        self.YSize = raw_dem.RasterYSize
+        self.DataType = _GDAL_TYPES.get(raw_dem.array.dtype.name, gdal.GDT_Unknown)
+
+    def GetNoDataValue(self):
+        return self.raw_dem.nodata
+
+    def GetBlockSize(self):
+        # Blocks of whole rows (about 1 MB), as the raw DEM is stored row by row.
+        return [self.XSize, max(1, min(self.YSize, (1 << 20) // max(1, self.raw_dem.array.strides[0])))]
+
+    def GetOverviewCount(self):
+        return 0
+
+    def ReadAsArray(self, xoff=0, yoff=0, win_xsize=None, win_ysize=None, buf_xsize=None, buf_ysize=None):
+        return self.raw_dem.ReadAsArray(xoff, yoff, win_xsize, win_ysize, buf_xsize, buf_ysize)
+
+
+class RawDEM(object):
+    '''Memory-mapped raw DEM (see 'export_raw_dem'), used in place of <osgeo.gdal.Dataset> of one band.
+
+    Opening a raw DEM only maps the file, and the cells are read from the page cache shared by all
+    processes (zero copy). Pickling a raw DEM (e.g., for worker processes) passes its path only.
+
+    Parameters:
+        raw_file <str> -- The path of raw DEM (with '.npy' extension).
+    '''
+
+    def __init__(self, raw_file):
+        self.raw_file = raw_file
+        with open(raw_file + '.json') as f:
+            self.meta = json.load(f)
+        self.array = np.load(raw_file, mmap_mode='r')
+        self.nodata = self.meta['nodata']
+        self.RasterYSize, self.RasterXSize = self.array.shape
+        self.RasterCount = 1
+
+    def __reduce__(self):
+        return RawDEM, (self.raw_file,)
+
+    def GetGeoTransform(self):
+        return tuple(self.meta['geotransform'])
+
+    def GetProjection(self):
+        return self.meta['projection']
+
+    def GetDescription(self):
+        return self.raw_file
+
+    def GetRasterBand(self, band):
+        if band != 1:
+            raise ValueError('The raw DEM has only one band: %s' % self.raw_file)
+        return RawDEMBand(self)
+
+    def ReadAsArray(self, xoff=0, yoff=0, xsize=None, ysize=None, buf_xsize=None, buf_ysize=None):
+        '''Read a window of DEM into a new array (decimated by the nearest cells if the buffer size is given).'''
+        xsize = self.RasterXSize - xoff if xsize is None else xsize
+        ysize = self.RasterYSize - yoff if ysize is None else ysize
+        if buf_xsize is None and buf_ysize is None:
+            return np.array(self.array[yoff:yoff + ysize, xoff:xoff + xsize])
+
+        buf_xsize = xsize if buf_xsize is None else buf_xsize
+        buf_ysize = ysize if buf_ysize is None else buf_ysize
+        rows = yoff + ((np.arange(buf_ysize) + 0.5) * ysize / buf_ysize).astype(np.int64)
+        cols = xoff + ((np.arange(buf_xsize) + 0.5) * xsize / buf_xsize).astype(np.int64)
+        return self.array[rows[:, np.newaxis], cols[np.newaxis, :]]
+
+
+def open_dem(dem_file):
+    '''Open DEM with GDAL, or map the raw DEM (with '.npy' extension).
+
+    Parameters:
+        dem_file <str> -- The path of DEM.
+
+    Return:
+        dem_data <osgeo.gdal.Dataset/RawDEM> -- The opened DEM.
+    '''
+    if dem_file.endswith('.npy'):
+        return RawDEM(dem_file)
+
+    dem_data = gdal.Open(dem_file)
+    if dem_data is None:
+        raise RuntimeError('Failed to open DEM: %s' % dem_file)
+
+    return dem_data
+
+
+class DEMBlockCache(object):
+    '''Bounded LRU cache of DEM blocks read through GDAL band reads.
+
+    Blocks are aligned to the native block size of the band and are kept across calls, so
+    repeated queries on the same DEM file do not read the DEM again. Blocks are keyed on the path,
+    modification time and size of the DEM file, so the blocks of a rewritten file (e.g., re-warped)
+    are never returned and are removed. Blocks of in-memory DEMs (e.g., MEM or /vsimem/ datasets) are keyed
+    on a token of the dataset object, so they are cached while the dataset is alive (the blocks of a
+    dataset modified in place are not updated, call 'clear' after writing to it).
+
+    Parameters:
+        max_bytes <int> -- The maximum size of cached blocks in bytes. Default is 256 MB.
+    '''
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.blocks = OrderedDict()
+        self.files = {}  # The (modification time, size) of cached DEM files.
+        self.tokens = weakref.WeakKeyDictionary()  # The tokens of in-memory DEMs.
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+
+    def get_block(self, dem_data, band, x_block, y_block):
+        '''Get a block of DEM (read it if not cached).
+
+        Parameters:
+            dem_data <osgeo.gdal.Dataset> -- The input DEM.
+            band <int> -- The band of DEM.
+            x_block <int> -- The column index of block.
+            y_block <int> -- The row index of block.
+
+        Return:
+            block <numpy.ndarray> -- The block in the native data type of DEM.
+            x_off <int> -- The pixel/column offset of block.
+            y_off <int> -- The line/row offset of block.
+        '''
+        gdal_band = dem_data.GetRasterBand(band)
+        b_col, b_row = gdal_band.GetBlockSize()
+        x_off, y_off = x_block * b_col, y_block * b_row
+
+        key = self._key(dem_data, band, x_block, y_block)
+        block = self.blocks.get(key)
+        if block is not None:
+            self.blocks.move_to_end(key)
+            self.hits += 1
+            return block, x_off, y_off
+
+        win_col, win_row = self.block_window(dem_data, band, x_block, y_block)[2:]
+        block = gdal_band.ReadAsArray(x_off, y_off, win_col, win_row)
+        self.put_block(dem_data, band, x_block, y_block, block)
+
+        return block, x_off, y_off
+
+    def _key(self, dem_data, band, x_block, y_block):
+        '''Get the key of a block, and remove the blocks of a rewritten DEM file.'''
+        dem_file = dem_data.GetDescription()
+        file_id = _file_id(dem_file)
+        if file_id is None:
+            token = self.tokens.get(dem_data)
+            if token is None:
+                token = self.tokens[dem_data] = uuid.uuid4().hex
+            return token, None, band, x_block, y_block
+
+        if self.files.get(dem_file, file_id) != file_id:
+            for key in [key for key in self.blocks if key[0] == dem_file]:
+                self.cached_bytes -= self.blocks.pop(key).nbytes
+        self.files[dem_file] = file_id
+
+        return dem_file, file_id, band, x_block, y_block
+
+    @staticmethod
+    def block_window(dem_data, band, x_block, y_block):
+        '''Get the window (x_off, y_off, x_size, y_size) of a block (clipped at the edges of DEM).'''
+        b_col, b_row = dem_data.GetRasterBand(band).GetBlockSize()
+        x_off, y_off = x_block * b_col, y_block * b_row
+
+        return x_off, y_off, min(b_col, dem_data.RasterXSize - x_off), min(b_row, dem_data.RasterYSize - y_off)
+
+    def contains(self, dem_data, band, x_block, y_block):
+        '''Check if a block of DEM is cached.'''
+        return self._key(dem_data, band, x_block, y_block) in self.blocks
+
+    def put_block(self, dem_data, band, x_block, y_block, block):
+        '''Add a block read outside the cache (e.g., by a prefetching reader) to the cache.'''
+        key = self._key(dem_data, band, x_block, y_block)
+        self.misses += 1
+        self.bytes_read += block.nbytes
+        if key in self.blocks:
+            self.cached_bytes -= self.blocks.pop(key).nbytes
+
+        self.blocks[key] = block
+        self.cached_bytes += block.nbytes
+        while self.cached_bytes > self.max_bytes and len(self.blocks) > 1:
+            _, old_block = self.blocks.popitem(last=False)
+            self.cached_bytes -= old_block.nbytes
+
+    def clear(self):
+        '''Remove all cached blocks.'''
+        self.blocks.clear()
+        self.files.clear()
+        self.tokens.clear()
+        self.cached_bytes = 0
+
+
+# The block cache shared by sampling functions (persists across calls).
+DEM_BLOCK_CACHE = DEMBlockCache()
+
+
+def _read_dem_cells(dem_data, rows, cols, band=1, read_mode='block', block_cache=None, prefetch_depth=None,
+                    prefetch_workers=None):
+    '''Read the values of given cells (inside DEM) with nodata replaced by NaN.
+
+    In 'block' mode, only the blocks containing the cells are read (through the block cache), and the
+    blocks not cached are read ahead by a prefetching reader (DEM files only).
+    In 'full' mode, the whole band is read. The cells of raw DEM are read from its memory map.
+    '''
+    gdal_band = dem_data.GetRasterBand(band)
+    nodataval = gdal_band.GetNoDataValue()
+
+    if isinstance(dem_data, RawDEM):
+        # The raw DEM is memory-mapped, the cells are read from the page cache in either mode.
+        values = dem_data.array[rows, cols].astype(np.float64)
+    elif read_mode == 'full':
+        values = gdal_band.ReadAsArray()[rows, cols].astype(np.float64)
+    elif read_mode == 'block':
+        if block_cache is None:
+            block_cache = DEM_BLOCK_CACHE
+        b_col, b_row = gdal_band.GetBlockSize()
+        n_x_block = (dem_data.RasterXSize + b_col - 1) // b_col
+        block_ids = (rows // b_row) * n_x_block + cols // b_col
+        if n_x_block * ((dem_data.RasterYSize + b_row - 1) // b_row) <= np.iinfo(np.uint16).max:
+            block_ids = block_ids.astype(np.uint16)  # Stable sort of 16-bit integers is a radix sort.
+
+        # Group the cells by block so that each touched block is visited once.
+        order = np.argsort(block_ids, kind='stable')
+        unique_ids, starts = np.unique(block_ids[order], return_index=True)
+        ends = np.append(starts[1:], order.shape[0])
+
+        # Read the blocks not cached ahead (in reader threads) while the cells of current block are gathered.
+        dem_file = dem_data.GetDescription()
+        groups = [(int(block_id % n_x_block), int(block_id // n_x_block), start, end)
+                  for block_id, start, end in zip(unique_ids, starts, ends)]
+        if os.path.isfile(dem_file) and len(groups) > 1:
+            cached = set((x_block, y_block) for x_block, y_block, start, end in groups
+                         if block_cache.contains(dem_data, band, x_block, y_block))
+
+            def read_block(group):
+                if group[:2] in cached:
+                    return None
+                return read_dem_window(dem_file, block_cache.block_window(dem_data, band, *group[:2]), band=band)
+        else:
+            prefetch_depth = 0
+
+            def read_block(group):
+                return None
+
+        values = np.empty(rows.shape[0], dtype=np.float64)
+        for (x_block, y_block, start, end), block in prefetch_iter(groups, read_block, depth=prefetch_depth,
+                                                                   max_workers=prefetch_workers):
+            idx = order[start:end]
+            if block is None:
+                block, x_off, y_off = block_cache.get_block(dem_data, band, x_block, y_block)
+            else:
+                x_off, y_off = block_cache.block_window(dem_data, band, x_block, y_block)[:2]
+                block_cache.put_block(dem_data, band, x_block, y_block, block)
+            values[idx] = block[rows[idx] - y_off, cols[idx] - x_off]
+    else:
+        raise ValueError('Unknown read mode: %s' % read_mode)
+
+    if nodataval is not None:
+        values[values == nodataval] = np.nan
+
+    return values
+
+
+# The coordinate transformations cached by (EPSG code of locations, GCS/PCS information of DEM).
+_COORD_TRANSFORMS = {}
+
+
+def transform_points(x_geo, y_geo, epsg_in, dem_proj):
+    '''Transform the coordinates of a batch of locations to the GCS/PCS of DEM.
+
+    Parameters:
+        x_geo <numpy.ndarray> -- The X coordinates (longitude in GCS) of locations.
+        y_geo <numpy.ndarray> -- The Y coordinates (latitude in GCS) of locations.
+        epsg_in <int> -- The EPSG code of locations.
+        dem_proj <str> -- The GCS/PCS information (WKT) of DEM.
+
+    Return:
+        x_dem <numpy.ndarray> -- The X coordinates of locations in the GCS/PCS of DEM.
+        y_dem <numpy.ndarray> -- The Y coordinates of locations in the GCS/PCS of DEM.
+    '''
+    key = (epsg_in, dem_proj)
+    coord_transform = _COORD_TRANSFORMS.get(key)
+    if coord_transform is None:
+        srs_in = osr.SpatialReference()
+        srs_in.ImportFromEPSG(int(epsg_in))
+        srs_out = osr.SpatialReference()
+        srs_out.ImportFromWkt(dem_proj)
+        # Keep the (X, Y) = (lng, lat) order of GCSs in GDAL >= 3.
+        if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER'):
+            srs_in.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            srs_out.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        coord_transform = osr.CoordinateTransformation(srs_in, srs_out)
+        _COORD_TRANSFORMS[key] = coord_transform
+
+    x_geo = np.atleast_1d(np.asarray(x_geo, dtype=np.float64))
+    y_geo = np.atleast_1d(np.asarray(y_geo, dtype=np.float64))
+    if x_geo.shape[0] == 0:
+        return x_geo.copy(), y_geo.copy()
+
+    points = np.array(coord_transform.TransformPoints(np.column_stack((x_geo, y_geo)).tolist()), dtype=np.float64)
+
+    return points[:, 0], points[:, 1]
+
+
+def _cubic_weights(t):
+    '''Get the weights of cubic convolution (Keys, a = -0.5) of 4 neighbours at offsets -1, 0, 1, 2.'''
+    a = -0.5
+    dist = np.stack([1.0 + t, t, 1.0 - t, 2.0 - t])
+    weights = np.where(dist <= 1.0,
+                       (a + 2.0) * dist ** 3 - (a + 3.0) * dist ** 2 + 1.0,
+                       a * dist ** 3 - 5.0 * a * dist ** 2 + 8.0 * a * dist - 4.0 * a)
+
+    return weights
+
+
+def _interpolate_dem_cells(dem_data, x_pixel, y_line, method='bilinear', band=1, read_mode='block', block_cache=None,
+                           prefetch_depth=None, prefetch_workers=None):
+    '''Interpolate the elevation at fractional pixel/line positions (inside DEM) with nodata replaced by NaN.
+
+    The neighbours are clamped at the edges of DEM. Bilinear weights are renormalized over nodata neighbours,
+    bicubic interpolation falls back to bilinear if any of its 4 x 4 neighbours is nodata, and the result is
+    NaN if the pixel containing the location is nodata.
+    '''
+    n_row, n_col = dem_data.RasterYSize, dem_data.RasterXSize
+    n_site = x_pixel.shape[0]
+
+    # The centers of pixels are at (i + 0.5, j + 0.5).
+    x_center, y_center = x_pixel - 0.5, y_line - 0.5
+    j_0, i_0 = np.floor(x_center).astype(np.int64), np.floor(y_center).astype(np.int64)
+    f_x, f_y = x_center - j_0, y_center - i_0
+
+    offsets = np.array([-1, 0, 1, 2]) if method == 'bicubic' else np.array([0, 1])
+    k = offsets.shape[0]
+    rows = np.clip(i_0 + offsets[:, np.newaxis], 0, n_row - 1)  # [k, n_site]
+    cols = np.clip(j_0 + offsets[:, np.newaxis], 0, n_col - 1)
+
+    # Read all neighbours and the containing pixels at once, so each touched block is visited once.
+    cell_rows = np.concatenate((np.repeat(rows, k, axis=0).ravel(), np.floor(y_line).astype(np.int64)))
+    cell_cols = np.concatenate((np.tile(cols, (k, 1)).ravel(), np.floor(x_pixel).astype(np.int64)))
+    values = _read_dem_cells(dem_data, cell_rows, cell_cols, band=band, read_mode=read_mode, block_cache=block_cache,
+                             prefetch_depth=prefetch_depth, prefetch_workers=prefetch_workers)
+    center = values[k * k * n_site:]
+    values = values[:k * k * n_site].reshape(k, k, n_site)  # [row offset, column offset, location]
+
+    # Bilinear interpolation of the central 2 x 2 neighbours.
+    c = 1 if method == 'bicubic' else 0
+    quad = values[c:c + 2, c:c + 2]
+    w_quad = np.stack([1.0 - f_y, f_y])[:, np.newaxis] * np.stack([1.0 - f_x, f_x])[np.newaxis, :]
+    valid = ~np.isnan(quad)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        elevation = np.where(valid, w_quad * quad, 0.0).sum(axis=(0, 1)) / np.where(valid, w_quad, 0.0).sum(axis=(0, 1))
+
+    if method == 'bicubic':
+        w_cubic = _cubic_weights(f_y)[:, np.newaxis] * _cubic_weights(f_x)[np.newaxis, :]
+        cubic = (w_cubic * values).sum(axis=(0, 1))
+        elevation = np.where(np.isnan(cubic), elevation, cubic)
+
+    elevation[np.isnan(center)] = np.nan
+
+    return elevation
+
+
+def sample_elevation(dem_data, x_geo, y_geo, band=1, read_mode='block', block_cache=None, epsg_in=None,
+                     method='nearest', prefetch_depth=None, prefetch_workers=None):
+    '''Sample the elevation of a batch of locations from DEM.
+
+    Parameters:
+        dem_data <osgeo.gdal.Dataset/RawDEM> -- The input DEM (GDAL dataset or memory-mapped raw DEM).
+        x_geo <numpy.ndarray> -- The X coordinates (longitude in GCS) of locations.
+        y_geo <numpy.ndarray> -- The Y coordinates (latitude in GCS) of locations.
+        band <int> -- The band of DEM for sampling. Default is 1.
+        read_mode <str> -- The mode of reading DEM. Default is 'block'.
+            'block' -- Read only the blocks containing the locations (through the block cache).
+            'full' -- Read the whole band of DEM.
+        block_cache <DEMBlockCache> -- The block cache for 'block' mode. Default is None (DEM_BLOCK_CACHE).
+        epsg_in <int> -- The EPSG code of locations. Default is None (in the GCS/PCS of DEM).
+        method <str> -- The method of sampling. Default is 'nearest'.
+            'nearest' -- The value of pixel containing the location.
+            'bilinear' -- The bilinear interpolation of 2 x 2 neighbours.
+            'bicubic' -- The bicubic (cubic convolution) interpolation of 4 x 4 neighbours.
+        prefetch_depth <int> -- The number of blocks read ahead in 'block' mode (see 'prefetch_iter').
+            Default is None (PREFETCH_DEPTH).
+        prefetch_workers <int> -- The number of reader threads. Default is None (PREFETCH_WORKERS).
+
+    Return:
+        site_sample <dict> -- The columnar sampling result with keys:
+            'row' <numpy.ndarray> -- The line/row of pixel containing locations (int64).
+            'col' <numpy.ndarray> -- The pixel/column of pixel containing locations (int64).
+            'elevation' <numpy.ndarray> -- The elevation of locations (float64, NaN if invalid).
+            'inside' <numpy.ndarray> -- If locations are inside DEM (bool).
+            'valid' <numpy.ndarray> -- If locations are inside DEM and not nodata (bool).
+    '''
+    if epsg_in is not None:
+        x_geo, y_geo = transform_points(x_geo, y_geo, epsg_in, dem_data.GetProjection())
+
+    x_pixel, y_line = dem_geo_to_pixel(dem_data.GetGeoTransform(), x_geo, y_geo)
+    x_pixel, y_line = np.atleast_1d(x_pixel), np.atleast_1d(y_line)
+
+    if method not in ('nearest', 'bilinear', 'bicubic'):
+        raise ValueError('Unknown sampling method: %s' % method)
+
+    # The pixel/line containing the location (the pixel/line of GDAL is at the top-left corner of pixel).
+    finite = np.isfinite(x_pixel) & np.isfinite(y_line)
+    cols = np.floor(np.where(finite, x_pixel, -1)).astype(np.int64)
+    rows = np.floor(np.where(finite, y_line, -1)).astype(np.int64)
+
+    inside = finite & (cols >= 0) & (cols < dem_data.RasterXSize) & (rows >= 0) & (rows < dem_data.RasterYSize)
+    elevation = np.full(cols.shape, np.nan)
+    if np.any(inside) and method == 'nearest':
+        elevation[inside] = _read_dem_cells(dem_data, rows[inside], cols[inside], band=band, read_mode=read_mode,
+                                            block_cache=block_cache, prefetch_depth=prefetch_depth,
+                                            prefetch_workers=prefetch_workers)
+    elif np.any(inside):
+        elevation[inside] = _interpolate_dem_cells(dem_data, x_pixel[inside], y_line[inside], method=method,
+                                                   band=band, read_mode=read_mode, block_cache=block_cache,
+                                                   prefetch_depth=prefetch_depth, prefetch_workers=prefetch_workers)
+
+    site_sample = {
+        'row': rows,
+        'col': cols,
+        'elevation': elevation,
+        'inside': inside,
+        'valid': inside & ~np.isnan(elevation),
+    }
+
+    return site_sample
+
+
+def sample_elevation_tiles(catalog, x_geo, y_geo, band=1, read_mode='block', block_cache=None, epsg_in=None,
+                           method='nearest'):
+    '''Sample the elevation of a batch of locations from DEM tiles (routed by the tile catalog).
+
+    Only the tiles containing the locations are opened. Interpolated values near the edges of tiles use the
+    neighbours clamped inside the tile (as at the edges of DEM).
+
+    Parameters:
+        catalog <DEMTileCatalog> -- The catalog of DEM tiles (in the same GCS/PCS).
+        x_geo <numpy.ndarray> -- The X coordinates (longitude in GCS) of locations.
+        y_geo <numpy.ndarray> -- The Y coordinates (latitude in GCS) of locations.
+        band <int> -- The band of DEM for sampling. Default is 1.
+        read_mode <str> -- The mode of reading DEM ('block' or 'full'). Default is 'block'.
+        block_cache <DEMBlockCache> -- The block cache for 'block' mode. Default is None (DEM_BLOCK_CACHE).
+        epsg_in <int> -- The EPSG code of locations. Default is None (in the GCS/PCS of tiles).
+        method <str> -- The method of sampling ('nearest', 'bilinear' or 'bicubic'). Default is 'nearest'.
+
+    Return:
+        site_sample <dict> -- The columnar sampling result (see 'sample_elevation') with the additional key:
+            'tile' <numpy.ndarray> -- The index of tile in 'catalog.files' of locations (-1 if outside tiles).
+            The 'row' and 'col' are in the containing tile.
+    '''
+    x_geo = np.atleast_1d(np.asarray(x_geo, dtype=np.float64))
+    y_geo = np.atleast_1d(np.asarray(y_geo, dtype=np.float64))
+    if epsg_in is not None and len(catalog.files) > 0:
+        x_geo, y_geo = transform_points(x_geo, y_geo, epsg_in, catalog.records[catalog.files[0]]['proj'])
+
+    tile_ids = catalog.locate(x_geo, y_geo)
+    site_sample = {
+        'row': np.full(x_geo.shape, -1, dtype=np.int64),
+        'col': np.full(x_geo.shape, -1, dtype=np.int64),
+        'elevation': np.full(x_geo.shape, np.nan),
+        'inside': np.zeros(x_geo.shape, dtype=bool),
+        'valid': np.zeros(x_geo.shape, dtype=bool),
+        'tile': tile_ids,
+    }
+
+    order = np.argsort(tile_ids, kind='stable')
+    unique_ids, starts = np.unique(tile_ids[order], return_index=True)
+    ends = np.append(starts[1:], order.shape[0])
+    for tile_id, start, end in zip(unique_ids, starts, ends):
+        if tile_id < 0:
+            continue
+        idx = order[start:end]
+        dem_data = open_dem(catalog.files[tile_id])
+        tile_sample = sample_elevation(dem_data, x_geo[idx], y_geo[idx], band=band, read_mode=read_mode,
+                                       block_cache=block_cache, method=method)
+        for key in ('row', 'col', 'elevation', 'inside', 'valid'):
+            site_sample[key][idx] = tile_sample[key]
+        del dem_data
+
+    return site_sample
+
+
+def get_elevation(dem_gcs, site_latlng, read_mode='block', epsg_in=None, method='nearest'):
+    '''Get the elevation of given locations from DEM in GCS.
+
+    Parameters:
+        dem_gcs <osgeo.gdal.Dataset/RawDEM> -- The input DEM (in GCS, or in any GCS/PCS if 'epsg_in' is given).
+        site_latlng <numpy.ndarray> -- The latitude and longitude of given locations.
+        read_mode <str> -- The mode of reading DEM ('block' or 'full'). Default is 'block'.
+        epsg_in <int> -- The EPSG code of given locations (e.g., 4326). The locations are transformed to the
+            GCS/PCS of DEM before sampling. Default is None (in the GCS of DEM).
+        method <str> -- The method of sampling ('nearest', 'bilinear' or 'bicubic'). Default is 'nearest'.
+
+    Return:
+        site_ele <numpy.ndarray> -- The elevation and other information of given locations.
+            The elevation of locations outside DEM or at nodata is NaN.
+    '''
+    gt = dem_gcs.GetGeoTransform()
+    print('\nThe 6 GeoTransform parameters of DEM are:\n', gt)
+
+    N_site = site_latlng.shape[0]
+    Xgeo = site_latlng[:, 1]  # longitude
+    Ygeo = site_latlng[:, 0]  # latitude
+
+    site_sample = sample_elevation(dem_gcs, Xgeo, Ygeo, read_mode=read_mode, epsg_in=epsg_in, method=method)
+
+    site_ele = np.zeros((N_site, 6))
+    site_ele[:, 0] = np.arange(N_site)  # The serial number of locations.
+    site_ele[:, 1] = Ygeo  # latitude
+    site_ele[:, 2] = Xgeo  # longitude
+    site_ele[:, 3] = site_sample['row']  # row
+    site_ele[:, 4] = site_sample['col']  # column
+    site_ele[:, 5] = site_sample['elevation']  # The elevation of locations.
+
+    return site_ele
+
+
+def summed_area_tables(dem_array, shift=None):
+    '''Build the summed-area tables (integral images) of the valid elevation, squared elevation and count.
+
+    The sum of any rectangle of DEM is then given by 4 lookups (see 'window_sums'), regardless of its size.
+    The elevation is shifted (e.g., by its mean) before summing, so the variance is accurate for large arrays.
+
+    Parameters:
+        dem_array <numpy.ndarray> -- The DEM array (NaN for nodata).
+        shift <float> -- The value subtracted from elevation. Default is None (the mean of valid elevation).
+
+    Return:
+        tables <dict> -- The tables 'sum', 'sum2' and 'count' in shape [row + 1, col + 1] (float64, the first row
+            and column are zeros), and the 'shift' of elevation.
+    '''
+    valid = ~np.isnan(dem_array)
+    if shift is None:
+        shift = float(dem_array[valid].mean()) if np.any(valid) else 0.0
+    value = np.where(valid, dem_array - shift, 0.0)
+
+    tables = {'shift': shift}
+    for name, cells in (('sum', value), ('sum2', value * value), ('count', valid.astype(np.float64))):
+        table = np.zeros((dem_array.shape[0] + 1, dem_array.shape[1] + 1))
+        np.cumsum(cells, axis=0, out=table[1:, 1:])
+        np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+        tables[name] = table
+
+    return tables
+
+
+def window_sums(tables, row_0, col_0, row_1, col_1):
+    '''Get the count, sum and sum of squares of valid elevation in a batch of windows from summed-area tables.
+
+    Parameters:
+        tables <dict> -- The summed-area tables (see 'summed_area_tables').
+        row_0 <numpy.ndarray> -- The first rows of windows.
+        col_0 <numpy.ndarray> -- The first columns of windows.
+        row_1 <numpy.ndarray> -- The last rows (exclusive) of windows (row_1 >= row_0).
+        col_1 <numpy.ndarray> -- The last columns (exclusive) of windows (col_1 >= col_0).
+
+    Return:
+        count <numpy.ndarray> -- The number of valid cells in windows.
+        w_sum <numpy.ndarray> -- The sum of shifted elevation in windows.
+        w_sum2 <numpy.ndarray> -- The sum of squared shifted elevation in windows.
+    '''
+    sums = []
+    for name in ('count', 'sum', 'sum2'):
+        table = tables[name]
+        sums.append(table[row_1, col_1] - table[row_0, col_1] - table[row_1, col_0] + table[row_0, col_0])
+
+    return tuple(sums)
+
+
+def row_range_tables(dem_array, max_width):
+    '''Build the sparse tables of the min and max of elevation in row ranges of widths 1, 2, 4, ... (NaN ignored).
+
+    The min/max of any row range [col_0, col_1) is then given by 2 lookups of level k = floor(log2(col_1 - col_0)),
+    the min/max of a rectangle by 2 lookups per row.
+
+    Parameters:
+        dem_array <numpy.ndarray> -- The DEM array (NaN for nodata).
+        max_width <int> -- The maximum width of row ranges.
+
+    Return:
+        t_min <list> -- The tables of min, the k-th in shape [row, col - 2 ** k + 1] for the ranges [c, c + 2 ** k).
+        t_max <list> -- The tables of max (same as 't_min').
+    '''
+    t_min, t_max = [dem_array], [dem_array]
+    width = 1
+    while width * 2 <= min(max_width, dem_array.shape[1]):
+        t_min.append(np.fmin(t_min[-1][:, :-width], t_min[-1][:, width:]))
+        t_max.append(np.fmax(t_max[-1][:, :-width], t_max[-1][:, width:]))
+        width *= 2
+
+    return t_min, t_max
+
+
+def window_extrema(t_min, t_max, windows):
+    '''Get the min and max of elevation in a batch of groups of windows from the sparse tables of row ranges.
+
+    Parameters:
+        t_min <list> -- The tables of min (see 'row_range_tables').
+        t_max <list> -- The tables of max (see 'row_range_tables').
+        windows <numpy.ndarray> -- The windows (row_0, col_0, row_1, col_1) in shape [n_groups, n_windows, 4]
+            (end exclusive, empty windows are ignored).
+
+    Return:
+        w_min <numpy.ndarray> -- The min of each group of windows (NaN if empty or all nodata).
+        w_max <numpy.ndarray> -- The max of each group of windows (NaN if empty or all nodata).
+    '''
+    n_groups, n_windows = windows.shape[:2]
+    windows = windows.reshape(-1, 4)
+    width = windows[:, 3] - windows[:, 1]
+    height = np.where(width > 0, np.maximum(windows[:, 2] - windows[:, 0], 0), 0)
+
+    # One lookup per row of each window (the rows of a group are consecutive).
+    row_window = np.repeat(np.arange(windows.shape[0]), height)
+    rows = windows[row_window, 0] + np.arange(row_window.shape[0]) - np.repeat(np.cumsum(height) - height, height)
+    col_0, col_1 = windows[row_window, 1], windows[row_window, 3]
+    level = np.floor(np.log2(np.maximum(width[row_window], 1))).astype(np.int64)
+
+    r_min, r_max = np.empty(rows.shape[0]), np.empty(rows.shape[0])
+    for k in np.unique(level):
+        at = level == k
+        r, c_0, c_1 = rows[at], col_0[at], col_1[at] - 2 ** k
+        r_min[at] = np.fmin(t_min[k][r, c_0], t_min[k][r, c_1])
+        r_max[at] = np.fmax(t_max[k][r, c_0], t_max[k][r, c_1])
+
+    w_min, w_max = np.full(n_groups, np.nan), np.full(n_groups, np.nan)
+    if rows.shape[0] > 0:
+        group = row_window // n_windows
+        starts = np.flatnonzero(np.concatenate(([True], group[1:] != group[:-1])))
+        with np.errstate(invalid='ignore'):
+            w_min[group[starts]] = np.fmin.reduceat(r_min, starts)
+            w_max[group[starts]] = np.fmax.reduceat(r_max, starts)
+
+    return w_min, w_max
+
+
+# The mean radius of the Earth in meters (for the radii of buffers and distances in GCS).
+EARTH_RADIUS = 6371008.8
+
+
+def _is_geographic(dem_proj):
+    '''Check if the GCS/PCS information (WKT) of DEM is a GCS (False if unknown).'''
+    dem_srs = osr.SpatialReference()
+
+    return bool(dem_proj) and dem_srs.ImportFromWkt(dem_proj) == 0 and bool(dem_srs.IsGeographic())
+
+
+def _circle_strip_widths(n_strips):
+    '''Get the bounds and half-widths of horizontal strips approximating a unit circle with equal area.'''
+    t = np.linspace(-1.0, 1.0, n_strips + 1)
+    area = t * np.sqrt(1.0 - t * t) + np.arcsin(t)  # Twice the area under the circle from -1 to t.
+
+    return t, (area[1:] - area[:-1]) / (2.0 * (t[1:] - t[:-1]))
+
+
+def buffer_windows(x_pixel, y_line, radius_x, radius_y, d_row, d_col, shape='circle', n_strips=16):
+    '''Get the pixel windows of rectangular or approximately circular buffers around locations.
+
+    A circular buffer is approximated by horizontal strips with the same area as the circle in each strip,
+    so its statistics cost a fixed number of lookups of summed-area tables for any radius.
+
+    Parameters:
+        x_pixel <numpy.ndarray> -- The fractional pixel/column positions of locations.
+        y_line <numpy.ndarray> -- The fractional line/row positions of locations.
+        radius_x <numpy.ndarray> -- The radii of buffers in pixels (along rows).
+        radius_y <numpy.ndarray> -- The radii of buffers in lines (along columns).
+        d_row <int> -- The number of rows of DEM.
+        d_col <int> -- The number of columns of DEM.
+        shape <str> -- The shape of buffers ('circle' or 'square'). Default is 'circle'.
+        n_strips <int> -- The number of strips of circular buffers. Default is 16.
+
+    Return:
+        windows <numpy.ndarray> -- The windows (row_0, col_0, row_1, col_1) clipped to DEM in shape
+            [n_locations, n_strips, 4] (int64, end exclusive, empty if row_1 == row_0 or col_1 == col_0).
+    '''
+    if shape == 'circle':
+        t, half_width = _circle_strip_widths(n_strips)
+    elif shape == 'square':
+        t, half_width = np.array([-1.0, 1.0]), np.array([1.0])
+    else:
+        raise ValueError('Unknown buffer shape: %s' % shape)
+
+    x_pixel, y_line = np.asarray(x_pixel, dtype=np.float64)[:, None], np.asarray(y_line, dtype=np.float64)[:, None]
+    radius_x = np.broadcast_to(np.reshape(radius_x, (-1, 1)), x_pixel.shape)
+    radius_y = np.broadcast_to(np.reshape(radius_y, (-1, 1)), y_line.shape)
+
+    # The cells whose centres (row + 0.5, col + 0.5) are inside the strips, rows [row_0, row_1) of adjacent strips
+    # do not overlap.
+    row_edge = np.ceil(y_line + radius_y * t[None, :] - 0.5)
+    row_edge[:, -1] = np.floor(y_line[:, 0] + radius_y[:, 0] - 0.5) + 1
+    row_0, row_1 = row_edge[:, :-1], np.maximum(row_edge[:, 1:], row_edge[:, :-1])
+    col_0 = np.ceil(x_pixel - radius_x * half_width[None, :] - 0.5)
+    col_1 = np.maximum(np.floor(x_pixel + radius_x * half_width[None, :] - 0.5) + 1, col_0)
+
+    windows = np.stack((np.clip(row_0, 0, d_row), np.clip(col_0, 0, d_col),
+                        np.clip(row_1, 0, d_row), np.clip(col_1, 0, d_col)), axis=-1)
+    windows[~np.isfinite(windows)] = 0
+
+    return windows.astype(np.int64)
+
+
+def zonal_statistics(dem_data, x_geo, y_geo, radii, band=1, epsg_in=None, shape='circle', n_strips=16,
+                     if_extrema=True, mem_budget=None):
+    '''Get the statistics of valid elevation in buffers of given radii around a batch of locations.
+
+    The DEM is read in chunks (aligned to its blocks, with a halo of the largest radius), and only the chunks
+    containing locations are read. The summed-area tables of each chunk are built once for all locations and
+    radii, so the count, mean and std of each buffer cost a fixed number of lookups. The min and max can not
+    be given by summed-area tables, and are given by the sparse tables of row ranges of each chunk (2 lookups
+    per row of buffers, see 'row_range_tables', optional).
+
+    Parameters:
+        dem_data <osgeo.gdal.Dataset/RawDEM> -- The input DEM (north up).
+        x_geo <numpy.ndarray> -- The X coordinates (longitude in GCS) of locations.
+        y_geo <numpy.ndarray> -- The Y coordinates (latitude in GCS) of locations.
+        radii <list> -- The radii of buffers in meters (e.g., [100, 1000, 5000]). The radii are converted to
+            degrees (on a sphere) for DEM in GCS.
+        band <int> -- The band of DEM. Default is 1.
+        epsg_in <int> -- The EPSG code of locations. Default is None (in the GCS/PCS of DEM).
+        shape <str> -- The shape of buffers ('circle' or 'square', see 'buffer_windows'). Default is 'circle'.
+        n_strips <int> -- The number of strips of circular buffers. Default is 16.
+        if_extrema <bool> -- If get the min and max of elevation in buffers. Default is True.
+        mem_budget <int> -- The memory budget of a chunk in bytes. Default is None (DEM_CHUNK_BUDGET).
+
+    Return:
+        zone_stats <dict> -- The columnar statistics in shape [n_locations, n_radii] with keys:
+            'count' <numpy.ndarray> -- The number of valid cells in buffers (int64).
+            'nodata_count' <numpy.ndarray> -- The number of nodata cells in buffers (int64).
+            'mean', 'std', 'min', 'max' <numpy.ndarray> -- The statistics of valid elevation in buffers
+                (float64, NaN if no valid cells, 'min' and 'max' are NaN if 'if_extrema' is False).
+    '''
+    d_gt = dem_data.GetGeoTransform()
+    if d_gt[2] != 0 or d_gt[4] != 0:
+        raise ValueError('The DEM is not north up: %s' % dem_data.GetDescription())
+    d_row, d_col = dem_data.RasterYSize, dem_data.RasterXSize
+
+    if epsg_in is not None:
+        x_geo, y_geo = transform_points(x_geo, y_geo, epsg_in, dem_data.GetProjection())
+    x_pixel, y_line = dem_geo_to_pixel(d_gt, x_geo, y_geo)
+    x_pixel, y_line = np.atleast_1d(x_pixel), np.atleast_1d(y_line)
+    radii = np.atleast_1d(np.asarray(radii, dtype=np.float64))
+
+    # The radii in pixels of each location (the pixel width of DEM in GCS shrinks with latitude).
+    radius_y = np.broadcast_to(radii[None, :] / abs(d_gt[5]), (x_pixel.shape[0], radii.shape[0]))
+    radius_x = np.broadcast_to(radii[None, :] / abs(d_gt[1]), radius_y.shape)
+    if _is_geographic(dem_data.GetProjection()):
+        radius_deg = np.degrees(radii / EARTH_RADIUS)
+        cos_lat = np.maximum(np.cos(np.radians(np.asarray(y_geo, dtype=np.float64))), 1e-6)
+        radius_y = np.broadcast_to(radius_deg[None, :] / abs(d_gt[5]), radius_y.shape)
+        radius_x = radius_deg[None, :] / abs(d_gt[1]) / cos_lat.reshape(-1, 1)
+
+    n_points, n_radii = radius_x.shape
+    zone_stats = {name: np.full((n_points, n_radii), np.nan) for name in ('mean', 'std', 'min', 'max')}
+    zone_stats['count'] = np.zeros((n_points, n_radii), dtype=np.int64)
+    zone_stats['nodata_count'] = np.zeros((n_points, n_radii), dtype=np.int64)
+
+    # Assign locations to the chunks of DEM containing them (the buffers are within the halo of chunks).
+    finite = np.isfinite(x_pixel) & np.isfinite(y_line) & np.all(np.isfinite(radius_x), axis=1)
+    halo = int(np.ceil(max(radius_x[finite].max(initial=0.0), radius_y[finite].max(initial=0.0)))) + 1
+    # The summed-area tables (and the sparse tables of min and max) of a chunk are sized in the memory budget.
+    n_levels = int(np.log2(2 * halo + 1)) + 1 if if_extrema else 0
+    chunk_row, chunk_col = dem_chunk_shape(dem_data, band=band, halo=halo, mem_budget=mem_budget,
+                                           itemsize=(4 + 2 * n_levels) * 8)
+    cols = np.floor(np.where(finite, x_pixel, -1.0)).astype(np.int64)
+    rows = np.floor(np.where(finite, y_line, -1.0)).astype(np.int64)
+    near = finite & (cols >= -halo) & (cols < d_col + halo) & (rows >= -halo) & (rows < d_row + halo)
+    chunk_ids = np.full(n_points, -1, dtype=np.int64)
+    n_chunk_col = (d_col + chunk_col - 1) // chunk_col
+    chunk_ids[near] = (np.clip(rows[near], 0, d_row - 1) // chunk_row * n_chunk_col
+                       + np.clip(cols[near], 0, d_col - 1) // chunk_col)
+
+    # The windows of buffers [n_points, n_radii, n_strips, 4].
+    windows = np.stack([buffer_windows(x_pixel, y_line, radius_x[:, k], radius_y[:, k], d_row, d_col,
+                                       shape=shape, n_strips=n_strips) for k in range(n_radii)], axis=1)
+
+    chunk_reads = []
+    for chunk_id in np.unique(chunk_ids[chunk_ids >= 0]):
+        points = np.nonzero(chunk_ids == chunk_id)[0]
+        p_windows = windows[points]
+        spans = p_windows[..., 2:] > p_windows[..., :2]
+        nonempty = spans[..., 0] & spans[..., 1]
+        if not np.any(nonempty):
+            continue
+        # Read the bounding window of buffers of locations in the chunk.
+        r_y0, r_x0 = p_windows[..., 0][nonempty].min(), p_windows[..., 1][nonempty].min()
+        r_y1, r_x1 = p_windows[..., 2][nonempty].max(), p_windows[..., 3][nonempty].max()
+        chunk_reads.append(((int(r_x0), int(r_y0), int(r_x1 - r_x0), int(r_y1 - r_y0)), points))
+
+    dem_file = dem_data.GetDescription()
+    if isinstance(dem_data, RawDEM) or os.path.isfile(dem_file) is False:
+        prefetch_depth = 0
+
+        def read_chunk(chunk_read):
+            return read_dem_chunk(dem_data, chunk_read[0], band=band, if_nan=True)
+    else:
+        prefetch_depth = None
+
+        def read_chunk(chunk_read):
+            return read_dem_chunk(_thread_dem(dem_file), chunk_read[0], band=band, if_nan=True)
+
+    for ((r_x0, r_y0, r_col, r_row), points), chunk in prefetch_iter(chunk_reads, read_chunk,
+                                                                     depth=prefetch_depth):
+        tables = summed_area_tables(chunk)
+        p_windows = windows[points] - np.array([r_y0, r_x0, r_y0, r_x0])
+        p_windows = np.maximum(p_windows, 0)  # Empty windows outside the bounding window.
+        p_windows[..., 2:] = np.maximum(p_windows[..., 2:], p_windows[..., :2])
+
+        count, w_sum, w_sum2 = window_sums(tables, p_windows[..., 0], p_windows[..., 1], p_windows[..., 2],
+                                           p_windows[..., 3])
+        count, w_sum, w_sum2 = count.sum(axis=-1), w_sum.sum(axis=-1), w_sum2.sum(axis=-1)
+        n_cells = ((p_windows[..., 2] - p_windows[..., 0]) * (p_windows[..., 3] - p_windows[..., 1])).sum(axis=-1)
+
+        count = np.rint(count).astype(np.int64)
+        has_valid = count > 0
+        w_mean = np.where(has_valid, w_sum / np.maximum(count, 1), 0.0)
+        w_var = np.maximum(np.where(has_valid, w_sum2 / np.maximum(count, 1), 0.0) - w_mean ** 2, 0.0)
+        zone_stats['count'][points] = count
+        zone_stats['nodata_count'][points] = n_cells - count
+        zone_stats['mean'][points] = np.where(has_valid, w_mean + tables['shift'], np.nan)
+        zone_stats['std'][points] = np.where(has_valid, np.sqrt(w_var), np.nan)
+
+        if if_extrema:
+            t_min, t_max = row_range_tables(chunk, int(np.max(p_windows[..., 3] - p_windows[..., 1])))
+            w_min, w_max = window_extrema(t_min, t_max, p_windows.reshape(-1, p_windows.shape[-2], 4))
+            zone_stats['min'][points] = w_min.reshape(count.shape)
+            zone_stats['max'][points] = w_max.reshape(count.shape)
+
+    return zone_stats
+
+
+def _segment_lengths(x_geo, y_geo, if_geographic=False):
+    '''Get the lengths (in meters for GCS, great-circle) of segments between consecutive locations.'''
+    if if_geographic is False:
+        return np.hypot(np.diff(x_geo), np.diff(y_geo))
+    lng, lat = np.radians(x_geo), np.radians(y_geo)
+    a = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lng) / 2) ** 2
+
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def elevation_profile(dem_data, lines, band=1, epsg_in=None, step=1.0, method='bilinear', block_cache=None):
+    '''Sample the elevation profiles along a batch of polylines from DEM.
+
+    The vertices are transformed to the GCS/PCS of DEM, and each segment is stepped at the resolution of DEM
+    (in pixels). The samples of all polylines are read at once (only the blocks traversed by polylines are
+    read, see 'sample_elevation'), so thousands of profiles are sampled in one pass.
+
+    Parameters:
+        dem_data <osgeo.gdal.Dataset/RawDEM> -- The input DEM.
+        lines <list> -- The polylines, each a numpy.ndarray of the (X, Y) coordinates of vertices in shape [n, 2].
+        band <int> -- The band of DEM. Default is 1.
+        epsg_in <int> -- The EPSG code of vertices. Default is None (in the GCS/PCS of DEM).
+        step <float> -- The step along segments in pixels of DEM. Default is 1.
+        method <str> -- The method of sampling ('nearest', 'bilinear' or 'bicubic'). Default is 'bilinear'.
+        block_cache <DEMBlockCache> -- The block cache. Default is None (DEM_BLOCK_CACHE).
+
+    Return:
+        profile <dict> -- The columnar profiles (the samples of the i-th polyline are in
+            [offsets[i], offsets[i + 1])) with keys:
+            'offsets' <numpy.ndarray> -- The offsets of polylines in samples (int64, len(lines) + 1).
+            'line' <numpy.ndarray> -- The index of polyline of samples (int64).
+            'x', 'y' <numpy.ndarray> -- The coordinates of samples in the GCS/PCS of DEM.
+            'distance' <numpy.ndarray> -- The distance of samples from the start of polyline (in meters for
+                DEM in GCS, in the unit of PCS otherwise).
+            'elevation' <numpy.ndarray> -- The elevation of samples (NaN if outside DEM or nodata).
+    '''
+    d_gt = dem_data.GetGeoTransform()
+    n_vertices = np.array([len(line) for line in lines], dtype=np.int64)
+    vertices = np.concatenate([np.asarray(line, dtype=np.float64).reshape(-1, 2) for line in lines] or
+                              [np.zeros((0, 2))])
+    x_geo, y_geo = vertices[:, 0], vertices[:, 1]
+    if epsg_in is not None:
+        x_geo, y_geo = transform_points(x_geo, y_geo, epsg_in, dem_data.GetProjection())
+    x_pixel, y_line = dem_geo_to_pixel(d_gt, x_geo, y_geo)
+    x_pixel, y_line = np.atleast_1d(x_pixel), np.atleast_1d(y_line)
+
+    # The segments between consecutive vertices of the same polyline, each stepped 'seg_steps' times.
+    v_line = np.repeat(np.arange(len(lines)), n_vertices)
+    segments = np.nonzero(v_line[:-1] == v_line[1:])[0]
+    seg_dx, seg_dy = x_pixel[segments + 1] - x_pixel[segments], y_line[segments + 1] - y_line[segments]
+    seg_steps = np.maximum(np.ceil(np.maximum(np.abs(seg_dx), np.abs(seg_dy)) / step), 1)
+    seg_steps = np.where(np.isfinite(seg_steps), seg_steps, 1).astype(np.int64)
+
+    # Each polyline has the samples of its segments and its last vertex (or its only vertex).
+    n_samples = np.bincount(v_line[segments], weights=seg_steps, minlength=len(lines)).astype(np.int64)
+    n_samples += (n_vertices > 0)
+    offsets = np.concatenate(([0], np.cumsum(n_samples)))
+
+    # The first sample of each segment follows the samples of the previous segments of its polyline.
+    seg_line = v_line[segments]
+    seg_before = np.cumsum(seg_steps) - seg_steps
+    seg_first = offsets[seg_line] + seg_before - seg_before[np.searchsorted(seg_line, seg_line)]
+    sample_seg = np.repeat(np.arange(segments.shape[0]), seg_steps)
+    sample_k = np.arange(sample_seg.shape[0]) - seg_before[sample_seg]
+    sample_t = sample_k / seg_steps[sample_seg]
+
+    s_pixel, s_line = np.empty(offsets[-1]), np.empty(offsets[-1])
+    s_index = seg_first[sample_seg] + sample_k
+    s_pixel[s_index] = x_pixel[segments][sample_seg] + sample_t * seg_dx[sample_seg]
+    s_line[s_index] = y_line[segments][sample_seg] + sample_t * seg_dy[sample_seg]
+    last_vertex = np.cumsum(n_vertices)[n_vertices > 0] - 1
+    s_pixel[offsets[1:][n_vertices > 0] - 1] = x_pixel[last_vertex]
+    s_line[offsets[1:][n_vertices > 0] - 1] = y_line[last_vertex]
+
+    # The coordinates and distances of samples in the GCS/PCS of DEM.
+    s_x = d_gt[0] + s_pixel * d_gt[1] + s_line * d_gt[2]
+    s_y = d_gt[3] + s_pixel * d_gt[4] + s_line * d_gt[5]
+    s_lines = np.repeat(np.arange(len(lines)), n_samples)
+    seg_length = _segment_lengths(s_x, s_y, _is_geographic(dem_data.GetProjection()))
+    seg_length[s_lines[:-1] != s_lines[1:]] = 0.0
+    distance = np.concatenate(([0.0], np.cumsum(seg_length)))[:offsets[-1]]
+    distance -= distance[np.repeat(offsets[:-1], n_samples)]
+
+    site_sample = sample_elevation(dem_data, s_x, s_y, band=band, block_cache=block_cache, method=method)
+
+    profile = {
+        'offsets': offsets,
+        'line': s_lines,
+        'x': s_x,
+        'y': s_y,
+        'distance': distance,
+        'elevation': site_sample['elevation'],
+    }
+
+    return profile
+
+
+# The refraction coefficient of light (the effective radius of the Earth is EARTH_RADIUS / (1 - coefficient)).
+REFRACTION_COEFF = 0.13
+
+
+def line_of_sight(dem_data, x_from, y_from, x_to, y_to, h_from=2.0, h_to=0.0, band=1, epsg_in=None, step=1.0,
+                  method='bilinear', if_curvature=True, block_cache=None):
+    '''Check the line of sight between a batch of pairs of locations (e.g., stations and pollution sources) on DEM.
+
+    The profiles of all pairs are sampled in one pass (see 'elevation_profile'), and the terrain between each
+    pair is compared with the straight sight line between the observer and the target in a vectorized way.
+
+    Parameters:
+        dem_data <osgeo.gdal.Dataset/RawDEM> -- The input DEM (the elevation in meters).
+        x_from <numpy.ndarray> -- The X coordinates (longitude in GCS) of observers.
+        y_from <numpy.ndarray> -- The Y coordinates (latitude in GCS) of observers.
+        x_to <numpy.ndarray> -- The X coordinates (longitude in GCS) of targets.
+        y_to <numpy.ndarray> -- The Y coordinates (latitude in GCS) of targets.
+        h_from <float> -- The height of observers above the ground in meters. Default is 2.
+        h_to <float> -- The height of targets above the ground in meters. Default is 0.
+        band <int> -- The band of DEM. Default is 1.
+        epsg_in <int> -- The EPSG code of locations. Default is None (in the GCS/PCS of DEM).
+        step <float> -- The step along sight lines in pixels of DEM. Default is 1.
+        method <str> -- The method of sampling ('nearest', 'bilinear' or 'bicubic'). Default is 'bilinear'.
+        if_curvature <bool> -- If correct the terrain for the curvature of the Earth and refraction. Default is True.
+        block_cache <DEMBlockCache> -- The block cache. Default is None (DEM_BLOCK_CACHE).
+
+    Return:
+        site_los <dict> -- The columnar line of sight of pairs with keys:
+            'visible' <numpy.ndarray> -- If the target is visible from the observer (bool, False if the ground
+                of either location is outside DEM or nodata).
+            'clearance' <numpy.ndarray> -- The minimum height of sight line above the terrain between the pair
+                (negative if blocked, inf if no terrain in between, NaN if invalid).
+            'blocked_distance' <numpy.ndarray> -- The distance of the first obstruction from the observer
+                (NaN if visible).
+            'distance' <numpy.ndarray> -- The distance between the pair (see 'elevation_profile').
+            'profile' <dict> -- The elevation profiles of pairs (see 'elevation_profile').
+    '''
+    x_from, y_from = np.atleast_1d(np.asarray(x_from, dtype=np.float64)), np.atleast_1d(np.asarray(y_from))
+    x_to, y_to = np.atleast_1d(np.asarray(x_to, dtype=np.float64)), np.atleast_1d(np.asarray(y_to))
+    lines = np.stack((np.column_stack((x_from, y_from)), np.column_stack((x_to, y_to))), axis=1)
+    profile = elevation_profile(dem_data, list(lines), band=band, epsg_in=epsg_in, step=step, method=method,
+                                block_cache=block_cache)
+
+    # The samples of each pair are in [first, last], the observer and the target are not obstructions.
+    first, last = profile['offsets'][:-1], profile['offsets'][1:] - 1
+    s_lines, distance, elevation = profile['line'], profile['distance'], profile['elevation']
+    z_from, z_to, total = elevation[first] + h_from, elevation[last] + h_to, distance[last]
+
+    sight = z_from[s_lines] + (z_to - z_from)[s_lines] * distance / np.maximum(total[s_lines], 1e-9)
+    terrain = elevation
+    if if_curvature:
+        # The drop of terrain below the chord of the (effective) Earth between the pair.
+        terrain = elevation - distance * (total[s_lines] - distance) / (2 * EARTH_RADIUS / (1 - REFRACTION_COEFF))
+    clearance = sight - terrain
+
+    between = np.ones(s_lines.shape[0], dtype=bool)
+    between[first], between[last] = False, False
+    clearance = np.where(between & ~np.isnan(clearance), clearance, np.inf)  # Voids do not block the sight.
+    blocked = clearance < 0
+
+    valid = ~np.isnan(z_from) & ~np.isnan(z_to)
+    if s_lines.shape[0] > 0:
+        min_clearance = np.minimum.reduceat(clearance, first)
+        first_blocked = np.minimum.reduceat(np.where(blocked, np.arange(s_lines.shape[0]), s_lines.shape[0]), first)
+    else:
+        min_clearance, first_blocked = np.zeros(0), np.zeros(0, dtype=np.int64)
+    visible = valid & (min_clearance >= 0)
+
+    site_los = {
+        'visible': visible,
+        'clearance': np.where(valid, min_clearance, np.nan),
+        'blocked_distance': np.where(valid & ~visible, distance[np.minimum(first_blocked, len(distance) - 1)],
+                                     np.nan),
+        'distance': total,
+        'profile': profile,
+    }
+
+    return site_los
+
+
+def viewshed_array(dem_array, obs_row, obs_col, res_x, res_y, h_obs=2.0, h_tgt=0.0, max_dist=None,
+                   if_curvature=True, ray_batch=256):
+    '''Compute the viewshed of an observer on a DEM array by casting rays to its border (R2 algorithm).
+
+    The rays are sampled at each row/column along their major axis (interpolated across the minor axis), so
+    every cell is crossed by at least one ray. A cell is visible if its target is above the horizon of the
+    samples before it on any ray crossing it. The rays are processed in batches as 2D arrays, where the
+    horizon is the running maximum of elevation angles ('numpy.maximum.accumulate').
+
+    Parameters:
+        dem_array <numpy.ndarray> -- The DEM array in PCS (NaN for nodata, e.g., a region of interest).
+        obs_row <int> -- The row of observer in the array.
+        obs_col <int> -- The column of observer in the array.
+        res_x <float> -- The pixel width of DEM.
+        res_y <float> -- The pixel height of DEM (positive).
+        h_obs <float> -- The height of observer above the ground in meters. Default is 2.
+        h_tgt <float> -- The height of targets above the ground in meters. Default is 0.
+        max_dist <float> -- The maximum distance of visible cells. Default is None (no limit).
+        if_curvature <bool> -- If correct the terrain for the curvature of the Earth and refraction. Default is True.
+        ray_batch <int> -- The number of rays processed at a time (for bounding the memory). Default is 256.
+
+    Return:
+        visible <numpy.ndarray> -- If cells are visible from the observer (bool, False for nodata).
+    '''
+    d_row, d_col = dem_array.shape
+    visible = np.zeros((d_row, d_col), dtype=bool)
+    z_obs = dem_array[obs_row, obs_col] + h_obs
+    if np.isnan(z_obs):
+        return visible
+    visible[obs_row, obs_col] = True
+
+    # The rays from the observer to the cells on the border of array.
+    border_row = np.concatenate((np.zeros(d_col), np.full(d_col, d_row - 1), np.arange(1, d_row - 1),
+                                 np.arange(1, d_row - 1))).astype(np.int64)
+    border_col = np.concatenate((np.arange(d_col), np.arange(d_col), np.zeros(max(d_row - 2, 0)),
+                                 np.full(max(d_row - 2, 0), d_col - 1))).astype(np.int64)
+    ray_dr, ray_dc = border_row - obs_row, border_col - obs_col
+    ray_n = np.maximum(np.abs(ray_dr), np.abs(ray_dc))
+    ray_dr, ray_dc, ray_n = ray_dr[ray_n > 0], ray_dc[ray_n > 0], ray_n[ray_n > 0]
+    r_eff = EARTH_RADIUS / (1 - REFRACTION_COEFF)
+
+    for b in range(0, ray_n.shape[0], ray_batch):
+        dr, dc, n = ray_dr[b:b + ray_batch, None], ray_dc[b:b + ray_batch, None], ray_n[b:b + ray_batch, None]
+        k = np.minimum(np.arange(1, n.max() + 1)[None, :], n)  # The steps beyond the border repeat the last.
+        s_row, s_col = obs_row + (dr * k) / n, obs_col + (dc * k) / n
+
+        # The major axis is on the grid, so the elevation is interpolated across the minor axis only.
+        r_0, c_0 = np.floor(s_row).astype(np.int64), np.floor(s_col).astype(np.int64)
+        w_row, w_col = s_row - r_0, s_col - c_0
+        z_0 = dem_array[r_0, c_0]
+        z_1 = dem_array[np.minimum(r_0 + (w_row > 0), d_row - 1), np.minimum(c_0 + (w_col > 0), d_col - 1)]
+        weight = w_row + w_col
+        z = np.where(weight > 0, z_0 + (z_1 - z_0) * weight, z_0)
+
+        dist = np.hypot(dr * res_y, dc * res_x) * k / n
+        if if_curvature:
+            z = z - dist ** 2 / (2 * r_eff)
+        angle, angle_tgt = (z - z_obs) / dist, (z + h_tgt - z_obs) / dist
+
+        # The horizon before each sample is the running maximum of elevation angles of previous samples.
+        horizon = np.maximum.accumulate(np.where(np.isnan(angle), -np.inf, angle), axis=1)
+        horizon = np.concatenate((np.full((horizon.shape[0], 1), -np.inf), horizon[:, :-1]), axis=1)
+        s_visible = angle_tgt >= horizon
+        visible[np.rint(s_row[s_visible]).astype(np.int64), np.rint(s_col[s_visible]).astype(np.int64)] = True
+
+    if max_dist is not None:
+        rows, cols = np.ogrid[0:d_row, 0:d_col]
+        visible &= np.hypot((rows - obs_row) * res_y, (cols - obs_col) * res_x) <= max_dist
+
+    return visible
+
+
+def _viewshed_chunk(dem_file, window, obs_row, obs_col, res_x, res_y, h_obs, h_tgt, max_dist, if_curvature):
+    '''Compute the viewshed of an observer in its region of interest of DEM (in a worker process).'''
+    dem_roi = read_dem_chunk(_thread_dem(dem_file), window, if_nan=True)
+
+    return viewshed_array(dem_roi, obs_row, obs_col, res_x, res_y, h_obs=h_obs, h_tgt=h_tgt, max_dist=max_dist,
+                          if_curvature=if_curvature)
+
+
+def viewsheds(dem_file, x_geo, y_geo, radius, cumulative_out, h_obs=2.0, h_tgt=0.0, epsg_in=None,
+              visible_path=None, if_curvature=True, max_workers=None, d_options=None):
+    '''Compute the viewsheds of a batch of observers (e.g., candidate stations) on DEM in PCS with a process pool.
+
+    The viewshed of each observer is computed in its region of interest (the window of DEM within 'radius'),
+    at most two observers per worker are in flight. The cumulative viewshed (the number of observers seeing
+    each pixel) is held in memory over the union of regions (2 bytes per pixel).
+
+    Parameters:
+        dem_file <str> -- The path of DEM in PCS (north up, e.g., BNG or LAEA).
+        x_geo <numpy.ndarray> -- The X coordinates (longitude in GCS) of observers.
+        y_geo <numpy.ndarray> -- The Y coordinates (latitude in GCS) of observers.
+        radius <float> -- The radius of viewsheds in the unit of PCS (e.g., meters).
+        cumulative_out <str> -- The path of cumulative viewshed (UInt16, over the union of regions).
+        h_obs <float> -- The height of observers above the ground in meters. Default is 2.
+        h_tgt <float> -- The height of targets above the ground in meters. Default is 0.
+        epsg_in <int> -- The EPSG code of observers. Default is None (in the PCS of DEM).
+        visible_path <str> -- The folder of visibility DEMs of observers ('viewshed_<i>.tif' over the region of the
+            i-th observer, 1 for visible, 0 for invisible and 255 for nodata). Default is None (not saved).
+        if_curvature <bool> -- If correct the terrain for the curvature of the Earth and refraction. Default is True.
+        max_workers <int> -- The number of worker processes. Default is None (the number of CPUs).
+        d_options <list> -- The creation options of outputs. Default is None (tiled, compressed GeoTIFFs).
+
+    Return:
+        visible_count <numpy.ndarray> -- The number of visible pixels of observers (-1 if outside DEM or nodata).
+    '''
+    dem_data = gdal.Open(dem_file)
+    d_row, d_col, d_band, d_gt, d_proj = get_dem_info(dem_data)
+    if d_gt[2] != 0 or d_gt[4] != 0:
+        raise ValueError('The DEM is not north up: %s' % dem_file)
+    res_x, res_y = d_gt[1], -d_gt[5]
+
+    if epsg_in is not None:
+        x_geo, y_geo = transform_points(x_geo, y_geo, epsg_in, d_proj)
+    x_pixel, y_line = dem_geo_to_pixel(d_gt, x_geo, y_geo)
+    x_pixel, y_line = np.atleast_1d(x_pixel), np.atleast_1d(y_line)
+
+    # The observers are at the centres of pixels containing them.
+    finite = np.isfinite(x_pixel) & np.isfinite(y_line)
+    obs_cols = np.floor(np.where(finite, x_pixel, -1)).astype(np.int64)
+    obs_rows = np.floor(np.where(finite, y_line, -1)).astype(np.int64)
+    inside = (obs_cols >= 0) & (obs_cols < d_col) & (obs_rows >= 0) & (obs_rows < d_row)
+    visible_count = np.full(x_pixel.shape[0], -1, dtype=np.int64)
+    if not np.any(inside):
+        print('\n*==> No observers are inside DEM: %s' % dem_file)
+        return visible_count
+
+    # The regions of interest of observers (x_off, y_off, x_size, y_size), and their union.
+    r_col, r_row = int(np.ceil(radius / res_x)), int(np.ceil(radius / res_y))
+    x_0, y_0 = np.maximum(obs_cols - r_col, 0), np.maximum(obs_rows - r_row, 0)
+    x_1, y_1 = np.minimum(obs_cols + r_col + 1, d_col), np.minimum(obs_rows + r_row + 1, d_row)
+    u_x0, u_y0 = int(x_0[inside].min()), int(y_0[inside].min())
+    u_x1, u_y1 = int(x_1[inside].max()), int(y_1[inside].max())
+    u_gt = (d_gt[0] + u_x0 * d_gt[1], d_gt[1], 0.0, d_gt[3] + u_y0 * d_gt[5], 0.0, d_gt[5])
+    cumulative = np.zeros((u_y1 - u_y0, u_x1 - u_x0), dtype=np.uint16)
+    del dem_data
+
+    if visible_path is not None and os.path.exists(visible_path) is False:
+        os.makedirs(visible_path)
+    v_options = d_options if d_options is not None else dem_creation_options(gdal.GDT_Byte)
+
+    observers = ((i, (int(x_0[i]), int(y_0[i]), int(x_1[i] - x_0[i]), int(y_1[i] - y_0[i])))
+                 for i in np.nonzero(inside)[0])
+    n_workers = max_workers if max_workers is not None else os.cpu_count()
+    t_start = time.time()
+    with _worker_pool(max_workers) as pool, thread_dem_scope():
+        def submit_observer(observer):
+            i, window = observer
+            return pool.submit(_viewshed_chunk, dem_file, window, int(obs_rows[i] - y_0[i]), int(obs_cols[i] - x_0[i]),
+                               res_x, res_y, h_obs, h_tgt, radius, if_curvature)
+
+        for (i, (w_x, w_y, w_col, w_row)), visible in submit_iter(observers, submit_observer, 2 * n_workers):
+            if visible.any():
+                visible_count[i] = visible.sum()
+            cumulative[w_y - u_y0:w_y - u_y0 + w_row, w_x - u_x0:w_x - u_x0 + w_col] += visible
+
+            if visible_path is not None:
+                dem_roi = read_dem_chunk(_thread_dem(dem_file), (w_x, w_y, w_col, w_row), if_nan=True)
+                yy, xx = np.mgrid[w_y:w_y + w_row, w_x:w_x + w_col]
+                in_radius = np.hypot((xx - obs_cols[i]) * res_x, (yy - obs_rows[i]) * res_y) <= radius
+                v_array = np.where(np.isnan(dem_roi) | ~in_radius, 255, visible).astype(np.uint8)
+                v_gt = (d_gt[0] + w_x * d_gt[1], d_gt[1], 0.0, d_gt[3] + w_y * d_gt[5], 0.0, d_gt[5])
+                write_dem(os.path.join(visible_path, 'viewshed_%d.tif' % i), v_array, w_row, w_col, 1, v_gt,
+                          d_proj, d_type=gdal.GDT_Byte, d_nodata=255, d_options=v_options)
+
+    write_dem(cumulative_out, cumulative, cumulative.shape[0], cumulative.shape[1], 1, u_gt, d_proj,
+              d_type=gdal.GDT_UInt16,
+              d_options=d_options if d_options is not None else dem_creation_options(gdal.GDT_UInt16))
+
+    print('\n*==> The viewsheds of %d observers are computed in %.2f s' % (inside.sum(), time.time() - t_start))
+
+    return visible_count
+
+
+def _sample_points_chunk(x_geo, y_geo, dem_files, epsg_in=None, method='nearest'):
+    '''Sample the elevation of a chunk of locations from DEMs (in a worker process or thread).
+
+    The DEMs and block cache are kept per worker (thread-local) across chunks, and released when the worker ends.
+    '''
+    thread_state = _thread_state()
+    if thread_state.block_cache is None:
+        thread_state.block_cache = DEMBlockCache()
+    block_cache = thread_state.block_cache
+
+    elevations = []
+    for dem_file in dem_files:
+        site_sample = sample_elevation(_thread_dem(dem_file), x_geo, y_geo, block_cache=block_cache, epsg_in=epsg_in,
+                                       method=method)
+        elevations.append(site_sample['elevation'])
+
+    return elevations
+
+
+def _read_point_chunks(points_in, chunk_rows, columns=None):
+    '''Read a point file (CSV or Parquet) in chunks of <pandas.DataFrame>.'''
+    if points_in.endswith('.parquet'):
+        import pyarrow.parquet as pq  # Optional dependency for Parquet files.
+
+        for batch in pq.ParquetFile(points_in).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+    else:
+        from pandas import read_csv
+
+        for chunk in read_csv(points_in, chunksize=chunk_rows, usecols=columns):
+            yield chunk
+
+
+class _PointWriter(object):
+    '''Append chunks of <pandas.DataFrame> to a point file (CSV or Parquet).'''
+
+    def __init__(self, points_out):
+        self.points_out = points_out
+        self.parquet_writer = None
+        self.n_chunk = 0
+        if os.path.isfile(points_out):
+            os.remove(points_out)
+
+    def write(self, chunk):
+        if self.points_out.endswith('.parquet'):
+            import pyarrow as pa  # Optional dependency for Parquet files.
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.points_out, table.schema)
+            self.parquet_writer.write_table(table)
+        else:
+            chunk.to_csv(self.points_out, mode='a', header=(self.n_chunk == 0), index=False)
+        self.n_chunk += 1
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+
+
+def sample_points_file(points_in, points_out, dem_files, lat_col='Latitude', lng_col='Longitude', epsg_in=4326,
+                       method='nearest', ele_cols=None, columns=None, chunk_rows=1000000, max_workers=None,
+                       if_print=False):
+    '''Sample the elevation of locations in a large point file from DEMs by streaming chunks.
+
+    The point file is read in chunks, the chunks are sampled in parallel by worker processes (each keeps
+    the DEMs open), and the results are appended to the output in the order of input. At most two chunks
+    per worker are in flight, so the memory is constant regardless of the number of locations.
+
+    Parameters:
+        points_in <str> -- The path of input point file (CSV, or Parquet with '.parquet' extension).
+        points_out <str> -- The path of output point file (CSV, or Parquet with '.parquet' extension).
+        dem_files <list> -- The paths of DEMs (GDAL DEMs or raw DEMs in any GCS/PCS).
+        lat_col <str> -- The column of latitude (Y coordinate) of locations. Default is 'Latitude'.
+        lng_col <str> -- The column of longitude (X coordinate) of locations. Default is 'Longitude'.
+        epsg_in <int> -- The EPSG code of locations. Default is 4326 (WGS-84 GCS).
+        method <str> -- The method of sampling ('nearest', 'bilinear' or 'bicubic'). Default is 'nearest'.
+        ele_cols <list> -- The output columns of elevation of each DEM. Default is None ('elevation_<DEM name>').
+        columns <list> -- The input columns to read and keep. Default is None (all columns).
+        chunk_rows <int> -- The number of rows of chunks. Default is 1000000.
+        max_workers <int> -- The number of worker processes. Default is None (the number of CPUs).
+        if_print <bool> -- If print the progress of each chunk. Default is False (not print).
+
+    Return:
+        n_rows <int> -- The number of sampled locations.
+    '''
+    if ele_cols is None:
+        ele_cols = ['elevation_' + os.path.splitext(os.path.basename(dem_file))[0] for dem_file in dem_files]
+    if len(ele_cols) != len(dem_files):
+        raise ValueError('The number of elevation columns is different from the number of DEMs.')
+    if columns is not None:
+        columns = list(columns) + [col for col in (lat_col, lng_col) if col not in columns]
+
+    n_workers = max_workers if max_workers is not None else os.cpu_count()
+    n_rows = 0
+    writer = _PointWriter(points_out)
+    t_start = time.time()
+    with _worker_pool(max_workers) as pool:
+        def submit_chunk(chunk):
+            return pool.submit(_sample_points_chunk, chunk[lng_col].values.astype(np.float64),
+                               chunk[lat_col].values.astype(np.float64), dem_files, epsg_in=epsg_in, method=method)
+
+        # Keep the workers busy with a bounded number of chunks in flight, and write chunks in the order of input.
+        chunks = _read_point_chunks(points_in, chunk_rows, columns=columns)
+        for chunk, elevations in submit_iter(chunks, submit_chunk, 2 * n_workers):
+            for ele_col, elevation in zip(ele_cols, elevations):
+                chunk[ele_col] = elevation
+            writer.write(chunk)
+            n_rows += len(chunk)
+            if if_print:
+                t_total = time.time() - t_start
+                print('\n*==> The number of sampled locations is: %d (%.2f s, %.0f rows/s)' % (
+                    n_rows, t_total, n_rows / max(t_total, 1e-9)))
+    writer.close()
+
+    return n_rows
+
+
+def warp_dem(dem_in, epsg_in, dem_out, epsg_out, resample_alg='near', num_threads='ALL_CPUS', warp_memory=512,
+             cache_size=None, d_options=None, d_frmt='GTiff'):
+    '''Transform, project, or convert the coordinate system of DEM in process (GDAL Warp API).
+
+    Parameters:
+        dem_in <str/osgeo.gdal.Dataset> -- The path of input DEM or the input DEM (e.g., an in-memory DEM).
+        epsg_in <int> -- The EPSG code of input DEM.
+        dem_out <str> -- The path of output DEM ('' for d_frmt='MEM', or '/vsimem/...' for in-memory GTiff).
+        epsg_out <int> -- The EPSG code of output DEM.
+        resample_alg <str> -- The resampling kernel ('near', 'bilinear', 'cubic', 'average', ...). Default is 'near'.
+        num_threads <int/str> -- The number of warping threads. Default is 'ALL_CPUS'.
+        warp_memory <int> -- The working memory of warping in MB. Default is 512.
+        cache_size <int> -- The size of GDAL block cache in bytes while warping (restored after warping).
+            Default is None (not changed).
+        d_options <list> -- The creation options of output DEM (e.g., ['TILED=YES']). Default is None.
+        d_frmt <str> -- The data format of output DEM. Default is 'GTiff'.
+
+    Return:
+        dem_data <osgeo.gdal.Dataset> -- The output DEM (kept open, e.g., for chaining in-memory transforms).
+    '''
+    # Check if the output file exists. If so, delete it (and its external overviews) for overwriting.
+    if d_frmt != 'MEM' and os.path.isfile(dem_out) is True:
+        os.remove(dem_out)
+    if d_frmt != 'MEM' and os.path.isfile(dem_out + '.ovr') is True:
+        os.remove(dem_out + '.ovr')
+
+    warp_options = gdal.WarpOptions(format=d_frmt,
+                                    srcSRS='EPSG:' + str(epsg_in),
+                                    dstSRS='EPSG:' + str(epsg_out),
+                                    resampleAlg=resample_alg,
+                                    multithread=True,
+                                    warpOptions=['NUM_THREADS=' + str(num_threads)],
+                                    warpMemoryLimit=warp_memory,
+                                    creationOptions=d_options or [])
+
+    # The block cache is shared by the process, so its size is restored for the other functions.
+    cache_max = gdal.GetCacheMax()
+    if cache_size is not None:
+        gdal.SetCacheMax(cache_size)
+    try:
+        gdal.ErrorReset()
+        dem_data = gdal.Warp(dem_out, dem_in, options=warp_options)
+    finally:
+        if cache_size is not None:
+            gdal.SetCacheMax(cache_max)
+    if dem_data is None:
+        raise RuntimeError('Failed to warp DEM from EPSG:%s to EPSG:%s: %s' % (
+            epsg_in, epsg_out, gdal.GetLastErrorMsg()))
+
+    return dem_data
+
+
+def transprojcnvt_dem(dem_in, epsg_in, dem_out, epsg_out, **warp_kwargs):
+    '''Transform, project, or convert the coordinate system of DEM.
+
+    Parameters:
+        dem_in <str>   -- The path of input DEM.
+        epsg_in <int>  -- The EPSG code of input DEM.
+        dem_out <str>  -- The path of output DEM.
+        epsg_out <int> -- The EPSG code of output DEM.
+        warp_kwargs <dict> -- The options of warping passed to 'warp_dem' (e.g., resample_alg='bilinear').
+
+    Return:
+        0 <int> -- If transformation, projection, or conversion is completed.
+    '''
+    dem_data = warp_dem(dem_in, epsg_in, dem_out, epsg_out, **warp_kwargs)
+    del dem_data  # Flush and close the output DEM.
+
+    return 0
+
+
+def align_dem(dem_in, dem_ref, dem_out, resample_alg='bilinear'):
+    '''Align DEM to the grid (GCS/PCS, extent and resolution) of a reference DEM as a virtual warped DEM (VRT).
+
+    The VRT is warped on the fly when its windows are read, so aligning a huge DEM costs no disk space and
+    its windows can be read in parallel by worker processes.
+
+    Parameters:
+        dem_in <str> -- The path of input DEM (in any GCS/PCS).
+        dem_ref <str> -- The path of reference DEM.
+        dem_out <str> -- The path of aligned DEM (.vrt).
+        resample_alg <str> -- The resampling kernel ('near', 'bilinear', 'cubic', ...). Default is 'bilinear'.
+
+    Return:
+        0 <int> -- If aligning DEM is completed.
+    '''
+    ref_data = gdal.Open(dem_ref)
+    d_row, d_col, d_band, d_gt, d_proj = get_dem_info(ref_data)
+    del ref_data
+
+    if os.path.isfile(dem_out) is True:
+        os.remove(dem_out)
+
+    # The aligned DEM is Float32 with -9999 as nodata (also for the area outside input DEM).
+    d_bounds = (d_gt[0], d_gt[3] + d_row * d_gt[5], d_gt[0] + d_col * d_gt[1], d_gt[3])
+    warp_options = gdal.WarpOptions(format='VRT',
+                                    dstSRS=d_proj,
+                                    outputBounds=d_bounds,
+                                    width=d_col,
+                                    height=d_row,
+                                    resampleAlg=resample_alg,
+                                    outputType=gdal.GDT_Float32,
+                                    dstNodata=-9999.0)
+
+    gdal.ErrorReset()
+    dem_data = gdal.Warp(dem_out, dem_in, options=warp_options)
+    if dem_data is None:
+        raise RuntimeError('Failed to align DEM %s to %s: %s' % (dem_in, dem_ref, gdal.GetLastErrorMsg()))
+    del dem_data  # Flush and close the VRT.
+
+    return 0
+
+
+def histogram_percentiles(hist_counts, hist_edges, percentiles, under=0, over=0, v_min=None, v_max=None):
+    '''Get the approximate percentiles of values from their histogram (e.g., merged from chunks of a DEM).
+
+    The percentiles are linearly interpolated within bins, so the error is at most one bin width (the values
+    below/above the histogram range are given by 'v_min'/'v_max').
+
+    Parameters:
+        hist_counts <numpy.ndarray> -- The counts of bins.
+        hist_edges <numpy.ndarray> -- The edges of bins (len(hist_counts) + 1).
+        percentiles <list> -- The percentiles in [0, 100].
+        under <int> -- The number of values below the first edge. Default is 0.
+        over <int> -- The number of values above the last edge. Default is 0.
+        v_min <float> -- The minimum of values. Default is None (the first edge).
+        v_max <float> -- The maximum of values. Default is None (the last edge).
+
+    Return:
+        values <numpy.ndarray> -- The percentiles of values (NaN if there is no value).
+    '''
+    v_min = hist_edges[0] if v_min is None else v_min
+    v_max = hist_edges[-1] if v_max is None else v_max
+    cum_counts = under + np.concatenate(([0], np.cumsum(hist_counts)))  # The number of values below edges.
+    n_values = cum_counts[-1] + over
+
+    values = np.full(len(percentiles), np.nan)
+    if n_values == 0:
+        return values
+    for i, q in enumerate(percentiles):
+        rank = q / 100.0 * n_values
+        if rank <= under:
+            values[i] = v_min
+        elif rank >= cum_counts[-1]:
+            values[i] = v_max
+        else:
+            k = min(np.searchsorted(cum_counts, rank, side='right') - 1, len(hist_counts) - 1)
+            frac = (rank - cum_counts[k]) / max(hist_counts[k], 1)
+            values[i] = hist_edges[k] + frac * (hist_edges[k + 1] - hist_edges[k])
+
+    return np.clip(values, v_min, v_max)
+
+
+def _moment_stats(moments):
+    '''Get the error statistics (count, bias, std, RMSE, MAE, min and max) from the moments of differences.'''
+    count = int(moments[0])
+    if count == 0:
+        return {'count': 0, 'bias': np.nan, 'std': np.nan, 'rmse': np.nan, 'mae': np.nan, 'min': np.nan,
+                'max': np.nan}
+
+    return {
+        'count': count,
+        'bias': float(moments[1]),
+        'std': float(np.sqrt(moments[2] / count)),
+        'rmse': float(np.sqrt(moments[2] / count + moments[1] ** 2)),
+        'mae': float(moments[5] / count),
+        'min': float(moments[3]),
+        'max': float(moments[4]),
+    }
+
+
+def _diff_chunk(ref_file, cmp_file, window, tile_size, hist_edges):
+    '''Compute the differences of a chunk of two aligned DEMs and their statistics (in a worker process).'''
+    dem_diff = (read_dem_chunk(_thread_dem(cmp_file), window, if_nan=True)
+                - read_dem_chunk(_thread_dem(ref_file), window, if_nan=True))
+
+    # The moments of differences in each tile (tiles on the edges of chunks are merged later).
+    x_off, y_off, c_col, c_row = window
+    tile_moments = {}
+    for tile_y in range(y_off // tile_size, (y_off + c_row - 1) // tile_size + 1):
+        r_0, r_1 = max(tile_y * tile_size, y_off) - y_off, min((tile_y + 1) * tile_size, y_off + c_row) - y_off
+        for tile_x in range(x_off // tile_size, (x_off + c_col - 1) // tile_size + 1):
+            c_0, c_1 = max(tile_x * tile_size, x_off) - x_off, min((tile_x + 1) * tile_size, x_off + c_col) - x_off
+            values = dem_diff[r_0:r_1, c_0:c_1]
+            tile_moments[(tile_x, tile_y)] = _moments(values[~np.isnan(values)])
+
+    valid = dem_diff[~np.isnan(dem_diff)]
+    hist_counts = np.histogram(valid, bins=hist_edges)[0]
+    under, over = int((valid < hist_edges[0]).sum()), int((valid > hist_edges[-1]).sum())
+    nodata_count = dem_diff.size - valid.size
+
+    dem_diff[np.isnan(dem_diff)] = -9999.0
+
+    return dem_diff.astype(np.float32), tile_moments, hist_counts, under, over, nodata_count
+
+
+def compare_dems(dem_ref, dem_cmp, diff_out, stats_out=None, tile_size=1024, resample_alg='bilinear',
+                 hist_range=(-500.0, 500.0), hist_bin=0.1, percentiles=(1, 5, 25, 50, 75, 95, 99), mem_budget=None,
+                 max_workers=None, d_options=None):
+    '''Compare two DEMs (e.g., ASTER GDEM versus EU-DEM, or one DEM across a round trip of GCSs/PCSs) in chunks.
+
+    The compared DEM is aligned to the grid of reference DEM by a virtual warp (see 'align_dem') if the grids
+    are different. The chunks (aligned to the blocks of reference DEM) are differenced in a process pool with
+    at most two chunks per worker in flight, so the memory is bounded at any scale. The differences
+    (compared - reference) are written to a Float32 DEM, and the error statistics are merged from chunks:
+    the bias, std, RMSE, MAE, min and max (exact), and the percentiles (from a fixed-bin histogram).
+
+    Parameters:
+        dem_ref <str> -- The path of reference DEM.
+        dem_cmp <str> -- The path of compared DEM (in any GCS/PCS).
+        diff_out <str> -- The path of difference DEM (compared - reference, -9999 for nodata).
+        stats_out <str> -- The path of error statistics (.json). Default is None (not saved).
+        tile_size <int> -- The size of tiles (in pixels) for the error statistics per tile. Default is 1024.
+        resample_alg <str> -- The resampling kernel of aligning DEMs. Default is 'bilinear'.
+        hist_range <tuple> -- The range of differences in the histogram. Default is (-500, 500).
+        hist_bin <float> -- The bin width of histogram (the error of percentiles). Default is 0.1.
+        percentiles <tuple> -- The percentiles of differences. Default is (1, 5, 25, 50, 75, 95, 99).
+        mem_budget <int> -- The memory budget of a chunk in bytes. Default is None (DEM_CHUNK_BUDGET).
+        max_workers <int> -- The number of worker processes. Default is None (the number of CPUs).
+        d_options <list> -- The creation options of difference DEM. Default is None (tiled, compressed GeoTIFF).
+
+    Return:
+        diff_stats <dict> -- The error statistics with keys:
+            'global' <dict> -- The 'count', 'nodata_count', 'bias', 'std', 'rmse', 'mae', 'min', 'max' and
+                'percentiles' ({percentile: difference}) of all pixels.
+            'tiles' <list> -- The 'count', 'bias', 'std', 'rmse', 'mae', 'min' and 'max' of each tile with
+                'tile_x', 'tile_y' and its 'bounds' (x_min, y_min, x_max, y_max) in the GCS/PCS of reference DEM.
+    '''
+    ref_data = gdal.Open(dem_ref)
+    d_row, d_col, d_band, d_gt, d_proj = get_dem_info(ref_data)
+    cmp_data = gdal.Open(dem_cmp)
+    if (cmp_data.RasterYSize, cmp_data.RasterXSize, cmp_data.GetGeoTransform(), cmp_data.GetProjection()) != (
+            d_row, d_col, d_gt, d_proj):
+        cmp_file = os.path.splitext(diff_out)[0] + '_aligned.vrt'
+        align_dem(dem_cmp, dem_ref, cmp_file, resample_alg=resample_alg)
+        print('\n*==> The compared DEM is aligned to the reference DEM: %s' % cmp_file)
+    else:
+        cmp_file = dem_cmp
+    del cmp_data
+
+    # The chunks are aligned to the blocks of reference DEM, sized for the two DEMs and the differences (float64).
+    chunk_row, chunk_col = dem_chunk_shape(ref_data, mem_budget=mem_budget, itemsize=4 * 8)
+    windows = [(x_off, y_off, min(chunk_col, d_col - x_off), min(chunk_row, d_row - y_off))
+               for y_off in range(0, d_row, chunk_row) for x_off in range(0, d_col, chunk_col)]
+    del ref_data
+    print('\n*==> The number of chunks of DEMs is: %d ([%d, %d] per chunk)' % (len(windows), chunk_row, chunk_col))
+
+    if os.path.isfile(diff_out) is True:
+        os.remove(diff_out)
+    write_dem(diff_out, None, d_row, d_col, 1, d_gt, d_proj, d_type=gdal.GDT_Float32, d_nodata=-9999.0,
+              d_options=d_options if d_options is not None else dem_creation_options(gdal.GDT_Float32))
+    diff_data = gdal.Open(diff_out, gdal.GA_Update)
+
+    hist_edges = np.linspace(hist_range[0], hist_range[1], int(round((hist_range[1] - hist_range[0]) / hist_bin)) + 1)
+    hist_counts = np.zeros(hist_edges.shape[0] - 1, dtype=np.int64)
+    under, over, nodata_count = 0, 0, 0
+    moments = _moments(np.zeros(0))
+    tile_moments = {}
+
+    n_workers = max_workers if max_workers is not None else os.cpu_count()
+    t_start = time.time()
+    with _worker_pool(max_workers) as pool:
+        def submit_chunk(window):
+            return pool.submit(_diff_chunk, dem_ref, cmp_file, window, tile_size, hist_edges)
+
+        for (x_off, y_off, _, _), chunk_result in submit_iter(windows, submit_chunk, 2 * n_workers):
+            c_diff, c_tiles, c_hist, c_under, c_over, c_nodata = chunk_result
+            diff_data.GetRasterBand(1).WriteArray(c_diff, x_off, y_off)
+            hist_counts += c_hist
+            under, over, nodata_count = under + c_under, over + c_over, nodata_count + c_nodata
+            for tile_id, c_moments in c_tiles.items():
+                moments = _merge_moments(moments, c_moments)
+                if tile_id in tile_moments:
+                    c_moments = _merge_moments(tile_moments[tile_id], c_moments)
+                tile_moments[tile_id] = c_moments
+    diff_data.FlushCache()
+    del diff_data
+
+    diff_stats = {'reference': dem_ref, 'compared': dem_cmp, 'global': _moment_stats(moments), 'tiles': []}
+    diff_stats['global']['nodata_count'] = nodata_count
+    p_values = histogram_percentiles(hist_counts, hist_edges, percentiles, under=under, over=over,
+                                     v_min=diff_stats['global']['min'], v_max=diff_stats['global']['max'])
+    diff_stats['global']['percentiles'] = {str(q): float(v) for q, v in zip(percentiles, p_values)}
+
+    for (tile_x, tile_y), t_moments in sorted(tile_moments.items(), key=lambda item: (item[0][1], item[0][0])):
+        x_0, y_0 = tile_x * tile_size, tile_y * tile_size
+        x_1, y_1 = min(x_0 + tile_size, d_col), min(y_0 + tile_size, d_row)
+        tile_stats = {'tile_x': tile_x, 'tile_y': tile_y,
+                      'bounds': [d_gt[0] + x_0 * d_gt[1], d_gt[3] + y_1 * d_gt[5],
+                                 d_gt[0] + x_1 * d_gt[1], d_gt[3] + y_0 * d_gt[5]]}
+        tile_stats.update(_moment_stats(t_moments))
+        diff_stats['tiles'].append(tile_stats)
+
+    if stats_out is not None:
+        with open(stats_out, 'w') as f:
+            json.dump(diff_stats, f, indent=1)
+
+    g_stats = diff_stats['global']
+    print('\n*==> The differences are computed in %.2f s: bias %.2f, std %.2f, RMSE %.2f, MAE %.2f (%d pixels)' % (
+        time.time() - t_start, g_stats['bias'], g_stats['std'], g_stats['rmse'], g_stats['mae'], g_stats['count']))
+
+    return diff_stats
+
+
+def _path_bytes(paths):
+    '''Get the total size of files (and of all files in folders) in bytes.'''
+    n_bytes = 0
+    for path in paths:
+        if os.path.isdir(path):
+            n_bytes += sum(os.path.getsize(os.path.join(root, file))
+                           for root, dirs, files in os.walk(path) for file in files)
+        elif os.path.isfile(path):
+            n_bytes += os.path.getsize(path)
+
+    return n_bytes
+
+
+def _raster_shapes(paths):
+    '''Get the shape [row, col] of raster files (DEMs) in paths (other files and folders are ignored).'''
+    shapes = {}
+    for path in paths:
+        if os.path.isfile(path) and os.path.splitext(path)[1].lower() in ('.tif', '.tiff', '.vrt', '.npy'):
+            header = _read_tile_header(path)
+            shapes[path] = [header['row'], header['col']]
+
+    return shapes
+
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF):
+    '''Get the peak RSS of the current process (or of its terminated child processes) in MB.'''
+    peak_rss = resource.getrusage(who).ru_maxrss
+    return peak_rss / 1024.0 ** 2 if sys.platform == 'darwin' else peak_rss / 1024.0  # bytes (macOS) or KB
+
+
+def _proc_rss_mb(pid='self'):
+    '''Get the current RSS of a process from /proc in MB (None if not available, e.g., on macOS).'''
+    try:
+        with open('/proc/%s/status' % pid) as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+
+def _child_pids(pid='self'):
+    '''Get the pids of all descendant processes of a process from /proc (empty if not available).'''
+    pids = []
+    try:
+        tasks = os.listdir('/proc/%s/task' % pid)
+    except OSError:
+        return pids
+    for tid in tasks:
+        try:
+            with open('/proc/%s/task/%s/children' % (pid, tid)) as file:
+                children = file.read().split()
+        except OSError:
+            continue
+        for child in children:
+            pids += [child] + _child_pids(child)
+
+    return pids
+
+
+class _RSSSampler(object):
+    '''Sample the RSS of the current process and of its descendants in a thread while a stage runs.
+
+    The peaks are those of the stage itself (a reused pool worker reports the peak of its whole life in
+    'ru_maxrss'). Without /proc (e.g., on macOS), the peak falls back to the lifetime peak of the process.
+
+    Parameters:
+        interval <float> -- The sampling interval in seconds. Default is 0.05.
+    '''
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.rss_peak = _proc_rss_mb()
+        self.children_peak = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        '''Update the peaks with the current RSS of the process and the sum of RSS of its descendants.'''
+        if self.rss_peak is None:
+            return
+        self.rss_peak = max(self.rss_peak, _proc_rss_mb() or 0.0)
+        self.children_peak = max(self.children_peak, sum(_proc_rss_mb(pid) or 0.0 for pid in _child_pids()))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        if self.rss_peak is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.sample()
+        if self.rss_peak is None:
+            self.rss_peak = _peak_rss_mb()
+            self.children_peak = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+        return False
+
+
+def append_stage_trace(trace_path, stage_name, metrics):
+    '''Append the metrics of a stage to the trace file.
+
+    A '.jsonl' trace has one JSON object per stage. Other traces (e.g., '.json') are in the Trace Event Format
+    (JSON array, the closing bracket is optional) which can be loaded in 'chrome://tracing' or Perfetto.
+
+    Parameters:
+        trace_path <str> -- The path of trace file.
+        stage_name <str> -- The name of stage.
+        metrics <dict> -- The metrics of stage (see 'run_stage').
+
+    Return:
+        0 <int> -- If appending the trace is completed.
+    '''
+    if trace_path.endswith('.jsonl'):
+        line = json.dumps(dict(metrics, name=stage_name), sort_keys=True, default=str)
+    else:
+        event = {'name': stage_name, 'cat': 'stage', 'ph': 'X', 'pid': metrics.get('pid', 0),
+                 'tid': metrics.get('pid', 0), 'ts': metrics['start'] * 1e6, 'dur': metrics['wall'] * 1e6,
+                 'args': metrics}
+        line = ('[' if os.path.isfile(trace_path) is False else '') + json.dumps(event, default=str) + ','
+    with open(trace_path, 'a') as file:
+        file.write(line + '\n')
+
+    return 0
+
+
+def _run_stage(func, args, kwargs, profile_path=None):
+    '''Run the function of a pipeline stage and measure it (in the process running the stage).
+
+    The wall and CPU time, peak RSS, block cache counters and GDAL cache usage are measured. If 'profile_path'
+    is given, the function is run under cProfile and the statistics are saved to 'profile_path'.
+
+    The RSS is sampled while the stage runs (see '_RSSSampler'): 'rss_peak_mb' is the peak of the process and
+    'rss_children_peak_mb' the peak of the sum of its descendants (e.g., pool workers, shared pages are counted
+    in each) during the stage. 'rss_lifetime_peak_mb' is the peak of the process over its whole life.
+    '''
+    cache_start = (DEM_BLOCK_CACHE.hits, DEM_BLOCK_CACHE.misses, DEM_BLOCK_CACHE.bytes_read)
+    times_start = os.times()
+    t_start = time.time()
+    with _RSSSampler() as rss_sampler:
+        if profile_path is not None:
+            profiler = cProfile.Profile()
+            result = profiler.runcall(func, *args, **kwargs)
+            profiler.dump_stats(profile_path)
+        else:
+            result = func(*args, **kwargs)
+    t_end = time.time()
+    times_end = os.times()
+
+    metrics = {
+        'start': t_start,
+        'end': t_end,
+        'wall': t_end - t_start,
+        'cpu': (times_end.user - times_start.user) + (times_end.system - times_start.system),
+        'cpu_children': ((times_end.children_user - times_start.children_user) +
+                         (times_end.children_system - times_start.children_system)),
+        'rss_peak_mb': rss_sampler.rss_peak,
+        'rss_children_peak_mb': rss_sampler.children_peak,
+        'rss_lifetime_peak_mb': _peak_rss_mb(),
+        'block_cache_hits': DEM_BLOCK_CACHE.hits - cache_start[0],
+        'block_cache_misses': DEM_BLOCK_CACHE.misses - cache_start[1],
+        'block_cache_bytes_read': DEM_BLOCK_CACHE.bytes_read - cache_start[2],
+        'gdal_cache_used': gdal.GetCacheUsed(),
+        'pid': os.getpid(),
+    }
+
+    return result, t_start, t_end, metrics
+
+
+def _stage_io_metrics(inputs, outputs):
+    '''Get the bytes of inputs and outputs and the shapes of output rasters of a stage.'''
+    return {'bytes_read': _path_bytes(inputs), 'bytes_written': _path_bytes(outputs),
+            'shapes': _raster_shapes(outputs)}
+
+
+def run_stage(stage_name, func, args=(), kwargs=None, inputs=None, outputs=None, trace_path=None, profile=False):
+    '''Run a stage (e.g., sampling the elevation) in the current process with instrumentation.
+
+    Parameters:
+        stage_name <str> -- The name of stage.
+        func <function> -- The function of stage.
+        args <tuple> -- The positional arguments of function. Default is ().
+        kwargs <dict> -- The keyword arguments of function. Default is None.
+        inputs <list> -- The paths of input files/folders (for the bytes read). Default is None.
+        outputs <list> -- The paths of output files/folders (for the bytes written and raster shapes).
+            Default is None.
+        trace_path <str> -- The path of trace file (see 'append_stage_trace'). Default is None (no trace).
+        profile <bool> -- If run the stage under cProfile ('profile_<stage_name>.prof' beside the trace).
+            Default is False.
+
+    Return:
+        result -- The result of function.
+    '''
+    profile_path = None
+    if profile:
+        profile_path = os.path.join(os.path.dirname(trace_path or ''), 'profile_%s.prof' % stage_name)
+
+    result, t_start, t_end, metrics = _run_stage(func, tuple(args), dict(kwargs or {}), profile_path=profile_path)
+    metrics.update(_stage_io_metrics(inputs or [], outputs or []))
+    print('\n>>> Complete stage: %s (%.2f s, CPU %.2f s, peak RSS %.1f MB)' % (
+        stage_name, metrics['wall'], metrics['cpu'], metrics['rss_peak_mb']))
+    if trace_path is not None:
+        append_stage_trace(trace_path, stage_name, metrics)
+
+    return result
+
+
+def _stage_artifact(stage):
+    '''Get the inputs, outputs and options of a pipeline stage for the manifest.'''
+    params = {'func': stage['func'].__name__, 'args': stage.get('args', ()), 'kwargs': stage.get('kwargs', {})}
+
+    return stage.get('inputs', []), stage['outputs'], params
+
+
+def run_pipeline(stages, max_workers=None, executor='process', manifest=None, trace_path=None, profile_stage=None):
+    '''Run the stages of a processing pipeline concurrently in the order of their dependencies.
+
+    A stage is submitted as soon as all the stages it depends on are completed, so independent stages
+    (e.g., transforming the same merged DEM to different GCSs) run at the same time. The CPUs are shared by
+    the concurrent stages: a stage with 'workers_arg' gets the number of CPUs divided by the number of stages
+    running with it, so the pools (or warping threads) of stages do not oversubscribe the CPUs.
+
+    Parameters:
+        stages <list> -- The stages of pipeline. Each stage is a <dict> with keys:
+            'name' <str> -- The unique name of stage.
+            'func' <function> -- The function of stage (module-level, so that it can be pickled).
+            'args' <tuple> -- The positional arguments of function. Default is ().
+            'kwargs' <dict> -- The keyword arguments of function. Default is {}.
+            'deps' <list> -- The names of stages to be completed before this stage. Default is [].
+            'inputs' <list> -- The paths of input files/folders (for skipping unchanged stages).
+            'outputs' <list> -- The paths of output files/folders (for skipping unchanged stages).
+            'workers_arg' <str> -- The keyword argument of function receiving the number of workers of stage
+                (e.g., 'max_workers', or 'num_threads' of 'warp_dem'), unless given in 'kwargs'. Default is None.
+        max_workers <int> -- The number of workers (and CPUs shared by stages). Default is None (the number of CPUs).
+        executor <str> -- The type of workers ('process' or 'thread'). Default is 'process'.
+        manifest <DEMManifest> -- The manifest of artifacts. A stage with 'outputs' is skipped if its inputs
+            and arguments are unchanged since its last run. Default is None (run all stages).
+        trace_path <str> -- The path of trace file of stages ('.jsonl' for JSON lines, or '.json' for the
+            Trace Event Format of 'chrome://tracing' and Perfetto). Default is None (no trace).
+        profile_stage <str> -- The name of stage to run under cProfile (the statistics are saved to
+            'profile_<stage>.prof' beside the trace). Default is None (no profiling).
+
+    Return:
+        pipeline_info <dict> -- The information of pipeline with keys:
+            'stages' <dict> -- The 'result', 'start', 'end', 'time' (in seconds), 'skipped' and 'metrics' of each
+                stage. The metrics are the wall/CPU time, peak RSS, bytes read/written, shapes of output
+                rasters, block cache counters and GDAL cache usage.
+            'wall_time' <float> -- The wall time of pipeline in seconds.
+            'critical_time' <float> -- The time of the longest chain of dependent stages in seconds.
+            'critical_path' <list> -- The names of stages in the longest chain.
+    '''
+    stage_dict = OrderedDict()
+    for stage in stages:
+        if stage['name'] in stage_dict:
+            raise ValueError('The name of stage is not unique: %s' % stage['name'])
+        stage_dict[stage['name']] = stage
+    for name, stage in stage_dict.items():
+        for dep in stage.get('deps', []):
+            if dep not in stage_dict:
+                raise ValueError('The stage %s depends on an unknown stage: %s' % (name, dep))
+    if len(stage_dict) == 0:
+        return {'stages': {}, 'wall_time': 0.0, 'critical_time': 0.0, 'critical_path': []}
+
+    # The stages in the order of their dependencies.
+    stage_order = []
+    while len(stage_order) < len(stage_dict):
+        ready = [name for name, stage in stage_dict.items() if name not in stage_order and
+                 all(dep in stage_order for dep in stage.get('deps', []))]
+        if len(ready) == 0:
+            raise ValueError('The dependencies of stages are circular: %s' % (
+                ', '.join(name for name in stage_dict if name not in stage_order)))
+        stage_order += ready
+    n_cpus = max_workers if max_workers is not None else os.cpu_count()
+
+    if executor == 'process':
+        pool = ProcessPoolExecutor(max_workers=max_workers)
+    elif executor == 'thread':
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+    else:
+        raise ValueError('Unknown executor: %s' % executor)
+
+    stage_info = {}
+    running = {}
+    t_start = time.time()
+    with pool:
+        while len(stage_info) < len(stage_dict):
+            # Submit the stages whose dependencies are completed.
+            n_skip = 0
+            ready = []
+            for name, stage in stage_dict.items():
+                if name in stage_info or name in running.values():
+                    continue
+                if all(dep in stage_info for dep in stage.get('deps', [])):
+                    if manifest is not None and 'outputs' in stage and manifest.is_current(
+                            name, *_stage_artifact(stage)):
+                        print('\n>>> Skip stage (unchanged): %s' % name)
+                        t_skip = time.time() - t_start
+                        stage_info[name] = {'result': None, 'start': t_skip, 'end': t_skip, 'time': 0.0,
+                                            'skipped': True, 'metrics': None}
+                        n_skip += 1
+                        continue
+                    ready.append(name)
+
+            # The CPUs are divided by the stages running at the same time (at most 'n_cpus' stages).
+            n_workers = max(1, n_cpus // max(1, min(n_cpus, len(running) + len(ready))))
+            for name in ready:
+                stage = stage_dict[name]
+                kwargs = dict(stage.get('kwargs', {}))
+                if stage.get('workers_arg') is not None and stage['workers_arg'] not in kwargs:
+                    kwargs[stage['workers_arg']] = n_workers
+                print('\n>>> Start stage: %s' % name)
+                profile_path = None
+                if name == profile_stage:
+                    profile_path = os.path.join(os.path.dirname(trace_path or ''), 'profile_%s.prof' % name)
+                future = pool.submit(_run_stage, stage['func'], tuple(stage.get('args', ())), kwargs,
+                                     profile_path=profile_path)
+                running[future] = name
+
+            if len(running) == 0:
+                if n_skip > 0:
+                    continue  # Check the stages depending on the skipped stages.
+                raise ValueError('The dependencies of stages are circular: %s' % (
+                    ', '.join(name for name in stage_dict if name not in stage_info)))
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    result, s_start, s_end, metrics = future.result()
+                except Exception as error:
+                    for pending in running:
+                        pending.cancel()
+                    raise RuntimeError('The stage %s failed: %s' % (name, error)) from error
+                metrics.update(_stage_io_metrics(stage_dict[name].get('inputs', []),
+                                                 stage_dict[name].get('outputs', [])))
+                stage_info[name] = {'result': result, 'start': s_start - t_start, 'end': s_end - t_start,
+                                    'time': s_end - s_start, 'skipped': False, 'metrics': metrics}
+                if trace_path is not None:
+                    append_stage_trace(trace_path, name, metrics)
+                if manifest is not None and 'outputs' in stage_dict[name]:
+                    manifest.update(name, *_stage_artifact(stage_dict[name]))
+                    manifest.save()
+                print('\n>>> Complete stage: %s (%.2f s, CPU %.2f s, peak RSS %.1f MB)' % (
+                    name, s_end - s_start, metrics['cpu'], metrics['rss_peak_mb']))
+    wall_time = time.time() - t_start
+
+    # The critical path is the chain of dependent stages with the longest total time.
+    critical = {}
+    for name in stage_order:
+        deps = stage_dict[name].get('deps', [])
+        prev = max(deps, key=lambda dep: critical[dep][0]) if len(deps) > 0 else None
+        critical[name] = (stage_info[name]['time'] + (critical[prev][0] if prev is not None else 0.0), prev)
+
+    name = max(critical, key=lambda name: critical[name][0])
+    critical_time = critical[name][0]
+    critical_path = []
+    while name is not None:
+        critical_path.insert(0, name)
+        name = critical[name][1]
+
+    print('\n*==> The time of stages is:')
+    for name in stage_dict:
+        print('%s: %.2f s (start %.2f s, end %.2f s)' % (
+            name, stage_info[name]['time'], stage_info[name]['start'], stage_info[name]['end']))
+    print('\n*==> The wall time of pipeline is: %.2f s' % wall_time)
+    print('*==> The critical path time is: %.2f s (%s)' % (critical_time, ' -> '.join(critical_path)))
+
+    pipeline_info = {
+        'stages': stage_info,
+        'wall_time': wall_time,
+        'critical_time': critical_time,
+        'critical_path': critical_path,
+    }
+
+    return pipeline_info
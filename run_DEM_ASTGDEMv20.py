@@ -5,9 +5,7 @@ Date: 16th March 2019 (Update: 20th April 2019)
 Contact: hz298@exeter.ac.uk zhangheupc@126.com
 
 Copyright (c) 2019 He Zhang
-'''
 
-'''
 DEM Data:
     ASTGDEMv20  -  ASTER-GDEMv2.0
     Download Link: https://earthexplorer.usgs.gov/
@@ -43,10 +41,18 @@ Functions:
     Display 2D DEM image in BNG PCS.
     Display 2D DEM image in LAEA PCS.
 
+    Compute the slope, aspect and hillshade of DEM in BNG PCS.
+
+    Compare DEM in LAEA PCS with EU-DEM in LAEA PCS (difference DEM and error statistics).
+
     Get the elevation from DEM in WGS-84 GCS.
     Get the elevation from DEM in OSGB-36 GCS.
     Get the elevation from DEM in ETRS-89 GCS.
 
+    Get the statistics of elevation in buffers around locations from DEM in BNG PCS.
+    Check the line of sight between locations on DEM in BNG PCS.
+    Compute the viewsheds (and the cumulative viewshed) of locations on DEM in BNG PCS.
+
 ******************** Important Information of Code Usage ********************
 - Use 'GDAL.GetProjection()' to check the GCS/PCS information of DEM (in TIF format).
 - Use 'GDAL.GetGeoTransform()' to check the resolution of DEMs.
@@ -58,14 +64,18 @@ Functions:
 - You can not display DEM in GCS as 2D image (e.g., WGS-84 -> 2D image is wrong).
 - You can not project DEM in GCS to the unrelated PCS (e.g., WGS-84 -> BNG is wrong).
 - You can not project DEM between different PCSs (e.g., Pseudo Mercator <-> BNG is wrong).
+- The locations (in WGS-84 GCS) are transformed to the GCS/PCS of DEM before getting the elevation.
 * Use 'gdalwarp' command to transform/project DEM to different GCSs/PCSs might be correct.
+- The stages of processing DEMs are run concurrently in the order of their dependencies.
+- The time, memory and bytes of stages are appended to the trace file ('PATH_TRACE').
+- The slope, aspect and hillshade are computed from DEM in PCS only (the pixel size must be in meters).
+- The raw DEM (.npy with a .json sidecar) is memory-mapped, so it is opened and sampled without decoding.
 '''
 
 # Python 3.7
 
 import os
-import re
-import shutil
+# import shutil
 # import subprocess
 
 # import matplotlib.pyplot as plt
@@ -73,12 +83,25 @@ import numpy as np
 from osgeo import gdal
 from pandas import read_csv
 
+from pyDEM_function import DEMManifest
+from pyDEM_function import compare_dems
+from pyDEM_function import dem_creation_options
+from pyDEM_function import dem_derivatives
+from pyDEM_function import export_raw_dem
 from pyDEM_function import get_dem_info
 from pyDEM_function import get_elevation
 from pyDEM_function import get_file_names
+from pyDEM_function import line_of_sight
+from pyDEM_function import merge_dem_folder
+from pyDEM_function import open_dem
+from pyDEM_function import reform_dem_tiles
+from pyDEM_function import render_xyz_tiles
+from pyDEM_function import run_pipeline
+from pyDEM_function import run_stage
 from pyDEM_function import show_2d_dem
 from pyDEM_function import transprojcnvt_dem
-from pyDEM_function import write_dem
+from pyDEM_function import viewsheds
+from pyDEM_function import zonal_statistics
 
 
 # Specify user settings.
@@ -99,8 +122,14 @@ PATH_ASTGDEM = 'DATA/DATA_ASTGDEMv20/'
 PATH_ASTGDEM_SOURCE = 'DATA/DATA_ASTGDEMv20/EPSG4326_s/'  # The folder of source DEMs must exist.
 PATH_ASTGDEM_REFORM = 'DATA/DATA_ASTGDEMv20/EPSG4326_r/'  # The folder of reformed DEMs.
 
+# Set the mode of merging DEMs.
+#     'tif' - Write the merged DEM (from the reformed DEMs) to GeoTIFF.
+#     'vrt' - Build a virtual mosaic (VRT) over the reformed DEMs.
+#     'vrt_source' - Build a virtual mosaic (VRT) over the source DEMs (reforming DEMs is skipped).
+MERGE_MODE = 'tif'
+
 # Set the name of DEMs in GCSs.
-ASTGDEM_GCS_WD = 'ASTGDEMv20_EPSG4326.tif'
+ASTGDEM_GCS_WD = 'ASTGDEMv20_EPSG4326.tif' if MERGE_MODE == 'tif' else 'ASTGDEMv20_EPSG4326.vrt'
 ASTGDEM_GCS_UK = 'ASTGDEMv20_EPSG4277.tif'
 ASTGDEM_GCS_EU = 'ASTGDEMv20_EPSG4258.tif'
 
@@ -109,317 +138,332 @@ ASTGDEM_PCS_WD = 'ASTGDEMv20_EPSG3857.tif'
 ASTGDEM_PCS_UK = 'ASTGDEMv20_EPSG27700.tif'
 ASTGDEM_PCS_EU = 'ASTGDEMv20_EPSG3035.tif'
 
+# Set the name of terrain derivatives (slope, aspect and hillshade) of DEM in BNG PCS.
+ASTGDEM_DERIVATIVES_UK = {'slope': 'ASTGDEMv20_EPSG27700_slope.tif',
+                          'aspect': 'ASTGDEMv20_EPSG27700_aspect.tif',
+                          'hillshade': 'ASTGDEMv20_EPSG27700_hillshade.tif'}
+
+# Set if DEM in LAEA PCS is compared with EU-DEM (the source DEM of EUDEMv11 in LAEA PCS is the reference).
+COMPARE_EUDEM = False
+PATH_EUDEM_REF = 'DATA/DATA_EUDEMv11/EUDEMv11_EPSG3035.tif'
+ASTGDEM_DIFF_EU = 'ASTGDEMv20_EPSG3035_diff_EUDEMv11.tif'
+ASTGDEM_DIFF_STATS_EU = 'ASTGDEMv20_EPSG3035_diff_EUDEMv11.json'
+
 # Set the path for saving 2D DEM images.
 IMG_PATH_ASTGDEM = 'IMG_ASTGDEMv20/'
-if os.path.exists(IMG_PATH_ASTGDEM):
-    shutil.rmtree(IMG_PATH_ASTGDEM)
-os.mkdir(IMG_PATH_ASTGDEM)
 
 # Set the name of 2D DEM images.
 IMG_NAME_ASTGDEM_WD = 'LD_ASTGDEMv20_EPSG3857'
 IMG_NAME_ASTGDEM_UK = 'LD_ASTGDEMv20_EPSG27700'
 IMG_NAME_ASTGDEM_EU = 'LD_ASTGDEMv20_EPSG3035'
 
-# Set the path of location data file.
-PATH_LD_STATION_DATA = 'DATA/DATA_LD_AirQuality/London_AirQuality_Stations.csv'
-
-
-# <ASTGDEMv20> Remove the overlapped elements of DEMs in WGS-84 GCS.
-
-print('\n>>> <ASTGDEMv20> Remove the overlapped elements of DEMs in WGS-84 GCS.')
-
-file_names = get_file_names(PATH_ASTGDEM_SOURCE, DEM_FORMAT)
-file_names.sort(reverse=True)  # W -> E
-
-for i, file_name in enumerate(file_names):
-    print('\n>>> Process the %d-th DEM: %s' % (i + 1, file_name))
-
-    gdal_data = gdal.Open(PATH_ASTGDEM_SOURCE + file_name)
-    i_row, i_col, i_band, i_gt, i_proj = get_dem_info(gdal_data, if_print=True)
-    print('\n*==> The shape of DEM is: [%d, %d]' % (i_row, i_col))
-
-    gdal_array = gdal_data.ReadAsArray().astype(np.float)
-    gdal_band = gdal_data.GetRasterBand(1)
-    nodataval = gdal_band.GetNoDataValue()
-    if np.any(gdal_array == nodataval):
-        gdal_array[gdal_array == nodataval] = np.nan
-
-    # Remove the overlapped elements of DEM.
-    dem_reform = gdal_array
-    dem_reform = np.delete(dem_reform, -1, axis=0)  # Delete the last/bottom row of DEM.
-    dem_reform = np.delete(dem_reform, -1, axis=1)  # Delete the last/right column of DEM.
-    print('\n*==> The shape of the reformed DEM is: [%d, %d]' % (dem_reform.shape[0], dem_reform.shape[1]))
-
-    print('\n>>> Write the reformed DEM to:', file_name)
-    path = PATH_ASTGDEM_REFORM
-    if os.path.exists(path) is False:
-        os.mkdir(path)
-    if os.path.isfile(path + file_name) is True:
-        os.remove(path + file_name)
-    write_dem(path + file_name, dem_reform, dem_reform.shape[0], dem_reform.shape[1], i_band, i_gt, i_proj)
-
-print('\n>>> Complete!\n')
-
-
-# <ASTGDEMv20> Merge the reformed DEMs in WGS-84 GCS.
-
-print('\n>>> <ASTGDEMv20> Merge the reformed DEMs in WGS-84 GCS.')
-
-dem_merge = []
-dem_out = ASTGDEM_GCS_WD
-
-file_names = get_file_names(PATH_ASTGDEM_REFORM, DEM_FORMAT)
-file_names.sort(reverse=True)  # W -> E
-
-for i, file_name in enumerate(file_names):
-    if 'ASTGTM2' in file_name:
-        print('\n>>> Read the %d-th DEM: %s' % (i + 1, file_name))
-
-        gdal_data = gdal.Open(PATH_ASTGDEM_REFORM + file_name)
-        i_row, i_col, i_band, i_gt, i_proj = get_dem_info(gdal_data, if_print=True)
-        print('\n*==> The shape of DEM is: [%d, %d]' % (i_row, i_col))
-
-        gdal_array = gdal_data.ReadAsArray().astype(np.float)
-        gdal_band = gdal_data.GetRasterBand(1)
-        nodataval = gdal_band.GetNoDataValue()
-        if np.any(gdal_array == nodataval):
-            gdal_array[gdal_array == nodataval] = np.nan
-
-        # Merge the reformed DEMs. - Not perfect.
-        name_lat = re.findall(r'-?\d+\.?\d*', file_name)[1]
-        name_log = re.findall(r'-?\d+\.?\d*', file_name)[2]
-        if name_lat == '51':
-            if name_log == '001':
-                dem_merge = gdal_array
-            else:
-                dem_merge = np.concatenate((dem_merge, gdal_array), axis=1)
-
-print('\n*==> The shape of the merged DEM is: [%d, %d]' % (dem_merge.shape[0], dem_merge.shape[1]))
-
-# Get the GeoTransform parameters of the merged DEM from the left-top DEM ('file_names[0]').
-gdal_data = gdal.Open(PATH_ASTGDEM_REFORM + file_names[0])
-lt_row, lt_col, lt_band, lt_gt, lt_proj = get_dem_info(gdal_data, if_print=False)
-
-print('\n>>> Write the merged DEM to:', dem_out)
-path = PATH_ASTGDEM
-if os.path.exists(path) is False:
-    os.mkdir(path)
-if os.path.isfile(path + dem_out) is True:
-        os.remove(path + dem_out)
-write_dem(path + dem_out, dem_merge, dem_merge.shape[0], dem_merge.shape[1], lt_band, lt_gt, lt_proj)
-
-print('\n>>> Complete!\n')
-
+# Set the path and zoom levels of XYZ web tiles (rendered from DEM in Pseudo Mercator PCS).
+PATH_XYZ_ASTGDEM = 'IMG_ASTGDEMv20/XYZ_EPSG3857/'
+XYZ_ZOOMS = [8, 9, 10, 11]
 
-# <ASTGDEMv20> Transform the merged DEM from WGS-84 GCS to OSGB-36 GCS.
+# Set if the merged DEM in WGS-84 GCS is exported to the raw store (memory-mapped .npy for sampling).
+RAW_EXPORT = False
+ASTGDEM_GCS_WD_RAW = 'ASTGDEMv20_EPSG4326.npy'
 
-print('\n>>> <ASTGDEMv20> Transform the merged DEM from WGS-84 GCS to OSGB-36 GCS.')
-
-path = PATH_ASTGDEM
-dem_in = path + ASTGDEM_GCS_WD
-dem_out = path + ASTGDEM_GCS_UK
-
-epsg_in = EPSG_WGS84
-epsg_out = EPSG_OSGB36
-
-transprojcnvt_dem(dem_in, epsg_in, dem_out, epsg_out)
-
-data = gdal.Open(dem_in)
-get_dem_info(data, if_print=True)
-data = gdal.Open(dem_out)
-get_dem_info(data, if_print=True)
-
-print('\n>>> Complete!\n')
-
-
-# <ASTGDEMv20> Transform the merged DEM from WGS-84 GCS to ETRS-89 GCS.
-
-print('\n>>> <ASTGDEMv20> Transform the merged DEM from WGS-84 GCS to ETRS-89 GCS.')
-
-path = PATH_ASTGDEM
-dem_in = path + ASTGDEM_GCS_WD
-dem_out = path + ASTGDEM_GCS_EU
-
-epsg_in = EPSG_WGS84
-epsg_out = EPSG_ETRS89
-
-transprojcnvt_dem(dem_in, epsg_in, dem_out, epsg_out)
-
-data = gdal.Open(dem_in)
-get_dem_info(data, if_print=True)
-data = gdal.Open(dem_out)
-get_dem_info(data, if_print=True)
-
-print('\n>>> Complete!\n')
-
-
-# <ASTGDEMv20> Project DEM from WGS-84 GCS to Pseudo Mercator PCS.
-
-print('\n>>> <ASTGDEMv20> Project DEM from WGS-84 GCS to Pseudo Mercator PCS.')
-
-path = PATH_ASTGDEM
-dem_in = path + ASTGDEM_GCS_WD
-dem_out = path + ASTGDEM_PCS_WD
-
-epsg_in = EPSG_WGS84
-epsg_out = EPSG_MERC
-
-transprojcnvt_dem(dem_in, epsg_in, dem_out, epsg_out)
-
-data = gdal.Open(dem_in)
-get_dem_info(data, if_print=True)
-data = gdal.Open(dem_out)
-get_dem_info(data, if_print=True)
-
-print('\n>>> Complete!\n')
-
-
-# <ASTGDEMv20> Project DEM from OSGB-36 GCS to BNG PCS.
-
-print('\n>>> <ASTGDEMv20> Project DEM from OSGB-36 GCS to BNG PCS.')
-
-path = PATH_ASTGDEM
-dem_in = path + ASTGDEM_GCS_UK
-dem_out = path + ASTGDEM_PCS_UK
-
-epsg_in = EPSG_OSGB36
-epsg_out = EPSG_BNG
-
-transprojcnvt_dem(dem_in, epsg_in, dem_out, epsg_out)
-
-data = gdal.Open(dem_in)
-get_dem_info(data, if_print=True)
-data = gdal.Open(dem_out)
-get_dem_info(data, if_print=True)
-
-print('\n>>> Complete!\n')
-
-
-# <ASTGDEMv20> Project DEM from ETRS-89 GCS to LAEA PCS.
+# Set the path of location data file.
+PATH_LD_STATION_DATA = 'DATA/DATA_LD_AirQuality/London_AirQuality_Stations.csv'
 
-print('\n>>> <ASTGDEMv20> Project DEM from ETRS-89 GCS to LAEA PCS.')
+# Set the radii (in meters) of circular buffers around stations for the statistics of elevation.
+ZONE_RADII = [100, 500, 1000, 5000]
+
+# Set the heights (in meters) of observer and target stations above the ground for the line of sight.
+LOS_HEIGHTS = (2.0, 2.0)
+
+# Set the radius (in meters) of viewsheds of stations, and the paths of viewsheds and cumulative viewshed.
+VIEWSHED_RADIUS = 5000
+PATH_VIEWSHED = 'DATA/DATA_ASTGDEMv20/VIEWSHED_EPSG27700/'
+ASTGDEM_VIEWSHED_UK = 'ASTGDEMv20_EPSG27700_viewshed_stations.tif'
+
+# Set the creation options of merged and transformed DEMs (tiled, compressed GeoTIFF).
+DEM_OPTIONS = dem_creation_options(gdal.GDT_Int16)
+
+# Set the number of workers for running independent stages concurrently (shared by the pools of stages).
+PIPELINE_WORKERS = 4
+
+# Set the number of chunks read ahead and the number of reader threads when reforming and merging DEMs
+# (e.g., deeper queues for network filesystems, more threads for NVMe disks).
+PREFETCH_DEPTH = 4
+PREFETCH_WORKERS = 2
+
+# Set the path of manifests. Stages and tiles with unchanged inputs and options are skipped in re-runs.
+PATH_MANIFEST = 'DATA/DATA_ASTGDEMv20/manifest_pipeline.json'
+PATH_MANIFEST_REFORM = 'DATA/DATA_ASTGDEMv20/manifest_reform.json'
+
+# Set the path of trace file of stages ('.jsonl' for JSON lines, '.json' for 'chrome://tracing' and Perfetto),
+# and the name of stage to run under cProfile (None for no profiling).
+PATH_TRACE = 'DATA/DATA_ASTGDEMv20/trace_stages.jsonl'
+PROFILE_STAGE = None
+
+# Set the path of tile catalog (bounds and headers of tiles, only new and changed tiles are opened in re-runs).
+PATH_CATALOG = 'DATA/DATA_ASTGDEMv20/catalog_tiles.json'
+
+
+# <ASTGDEMv20> Define the stages of processing pipeline.
+#
+# reform -> merge -> wgs2osgb -> osgb2bng -> show_bng
+#                                         -> terrain_bng
+#                 -> raw_wgs (optional)
+#                 -> wgs2etrs -> etrs2laea -> show_laea
+#                                          -> compare_eudem (optional)
+#                 -> wgs2merc -> show_merc -> xyz_merc
+
+stages = []
+
+# Remove the overlapped elements of DEMs in WGS-84 GCS.
+if MERGE_MODE != 'vrt_source':
+    file_names = get_file_names(PATH_ASTGDEM_SOURCE, DEM_FORMAT)
+    file_names.sort(reverse=True)  # W -> E
+    stages.append({'name': 'reform', 'func': reform_dem_tiles,
+                   'args': (PATH_ASTGDEM_SOURCE, file_names, PATH_ASTGDEM_REFORM),
+                   'kwargs': {'manifest_path': PATH_MANIFEST_REFORM,
+                              'prefetch_depth': PREFETCH_DEPTH, 'prefetch_workers': PREFETCH_WORKERS},
+                   'workers_arg': 'max_workers',
+                   'inputs': [PATH_ASTGDEM_SOURCE], 'outputs': [PATH_ASTGDEM_REFORM]})
+
+# Merge the DEMs in WGS-84 GCS. The GeoTransform parameters are computed from all DEMs.
+# Note: The reformed DEMs are listed when the stage runs, so this stage is a function of the folder.
+if MERGE_MODE == 'tif':
+    stages.append({'name': 'merge', 'func': merge_dem_folder, 'deps': ['reform'],
+                   'args': (PATH_ASTGDEM_REFORM, DEM_FORMAT, PATH_ASTGDEM + ASTGDEM_GCS_WD),
+                   'kwargs': {'d_options': DEM_OPTIONS, 'catalog_path': PATH_CATALOG,
+                              'prefetch_depth': PREFETCH_DEPTH, 'prefetch_workers': PREFETCH_WORKERS},
+                   'inputs': [PATH_ASTGDEM_REFORM], 'outputs': [PATH_ASTGDEM + ASTGDEM_GCS_WD]})
+elif MERGE_MODE == 'vrt':
+    stages.append({'name': 'merge', 'func': merge_dem_folder, 'deps': ['reform'],
+                   'args': (PATH_ASTGDEM_REFORM, DEM_FORMAT, PATH_ASTGDEM + ASTGDEM_GCS_WD),
+                   'kwargs': {'if_vrt': True, 'catalog_path': PATH_CATALOG},
+                   'inputs': [PATH_ASTGDEM_REFORM], 'outputs': [PATH_ASTGDEM + ASTGDEM_GCS_WD]})
+else:
+    # Exclude the overlapped elements of source DEMs.
+    stages.append({'name': 'merge', 'func': merge_dem_folder,
+                   'args': (PATH_ASTGDEM_SOURCE, DEM_FORMAT, PATH_ASTGDEM + ASTGDEM_GCS_WD),
+                   'kwargs': {'if_vrt': True, 'trim': 1, 'catalog_path': PATH_CATALOG},
+                   'inputs': [PATH_ASTGDEM_SOURCE], 'outputs': [PATH_ASTGDEM + ASTGDEM_GCS_WD]})
+
+# Export the merged DEM in WGS-84 GCS to the raw store (shared by processes through the page cache).
+if RAW_EXPORT:
+    stages.append({'name': 'raw_wgs', 'func': export_raw_dem, 'deps': ['merge'],
+                   'args': (PATH_ASTGDEM + ASTGDEM_GCS_WD, PATH_ASTGDEM + ASTGDEM_GCS_WD_RAW),
+                   'inputs': [PATH_ASTGDEM + ASTGDEM_GCS_WD],
+                   'outputs': [PATH_ASTGDEM + ASTGDEM_GCS_WD_RAW, PATH_ASTGDEM + ASTGDEM_GCS_WD_RAW + '.json']})
+
+# Transform the merged DEM from WGS-84 GCS to OSGB-36 GCS and ETRS-89 GCS.
+stages.append({'name': 'wgs2osgb', 'func': transprojcnvt_dem, 'deps': ['merge'],
+               'args': (PATH_ASTGDEM + ASTGDEM_GCS_WD, EPSG_WGS84, PATH_ASTGDEM + ASTGDEM_GCS_UK, EPSG_OSGB36),
+               'kwargs': {'d_options': DEM_OPTIONS}, 'workers_arg': 'num_threads',
+               'inputs': [PATH_ASTGDEM + ASTGDEM_GCS_WD], 'outputs': [PATH_ASTGDEM + ASTGDEM_GCS_UK]})
+stages.append({'name': 'wgs2etrs', 'func': transprojcnvt_dem, 'deps': ['merge'],
+               'args': (PATH_ASTGDEM + ASTGDEM_GCS_WD, EPSG_WGS84, PATH_ASTGDEM + ASTGDEM_GCS_EU, EPSG_ETRS89),
+               'kwargs': {'d_options': DEM_OPTIONS}, 'workers_arg': 'num_threads',
+               'inputs': [PATH_ASTGDEM + ASTGDEM_GCS_WD], 'outputs': [PATH_ASTGDEM + ASTGDEM_GCS_EU]})
+
+# Project DEM from WGS-84 GCS to Pseudo Mercator PCS.
+stages.append({'name': 'wgs2merc', 'func': transprojcnvt_dem, 'deps': ['merge'],
+               'args': (PATH_ASTGDEM + ASTGDEM_GCS_WD, EPSG_WGS84, PATH_ASTGDEM + ASTGDEM_PCS_WD, EPSG_MERC),
+               'kwargs': {'d_options': DEM_OPTIONS}, 'workers_arg': 'num_threads',
+               'inputs': [PATH_ASTGDEM + ASTGDEM_GCS_WD], 'outputs': [PATH_ASTGDEM + ASTGDEM_PCS_WD]})
+
+# Project DEM from OSGB-36 GCS to BNG PCS.
+stages.append({'name': 'osgb2bng', 'func': transprojcnvt_dem, 'deps': ['wgs2osgb'],
+               'args': (PATH_ASTGDEM + ASTGDEM_GCS_UK, EPSG_OSGB36, PATH_ASTGDEM + ASTGDEM_PCS_UK, EPSG_BNG),
+               'kwargs': {'d_options': DEM_OPTIONS}, 'workers_arg': 'num_threads',
+               'inputs': [PATH_ASTGDEM + ASTGDEM_GCS_UK], 'outputs': [PATH_ASTGDEM + ASTGDEM_PCS_UK]})
+
+# Project DEM from ETRS-89 GCS to LAEA PCS.
+stages.append({'name': 'etrs2laea', 'func': transprojcnvt_dem, 'deps': ['wgs2etrs'],
+               'args': (PATH_ASTGDEM + ASTGDEM_GCS_EU, EPSG_ETRS89, PATH_ASTGDEM + ASTGDEM_PCS_EU, EPSG_LAEA),
+               'kwargs': {'d_options': DEM_OPTIONS}, 'workers_arg': 'num_threads',
+               'inputs': [PATH_ASTGDEM + ASTGDEM_GCS_EU], 'outputs': [PATH_ASTGDEM + ASTGDEM_PCS_EU]})
+
+# Display 2D DEM images in Pseudo Mercator PCS, BNG PCS and LAEA PCS (save images without display).
+stages.append({'name': 'show_merc', 'func': show_2d_dem, 'deps': ['wgs2merc'],
+               'args': (PATH_ASTGDEM, ASTGDEM_PCS_WD, IMG_PATH_ASTGDEM, IMG_NAME_ASTGDEM_WD),
+               'kwargs': {'img_show': False},
+               'inputs': [PATH_ASTGDEM + ASTGDEM_PCS_WD], 'outputs': [IMG_PATH_ASTGDEM + IMG_NAME_ASTGDEM_WD + '.png']})
+stages.append({'name': 'show_bng', 'func': show_2d_dem, 'deps': ['osgb2bng'],
+               'args': (PATH_ASTGDEM, ASTGDEM_PCS_UK, IMG_PATH_ASTGDEM, IMG_NAME_ASTGDEM_UK),
+               'kwargs': {'img_show': False},
+               'inputs': [PATH_ASTGDEM + ASTGDEM_PCS_UK], 'outputs': [IMG_PATH_ASTGDEM + IMG_NAME_ASTGDEM_UK + '.png']})
+stages.append({'name': 'show_laea', 'func': show_2d_dem, 'deps': ['etrs2laea'],
+               'args': (PATH_ASTGDEM, ASTGDEM_PCS_EU, IMG_PATH_ASTGDEM, IMG_NAME_ASTGDEM_EU),
+               'kwargs': {'img_show': False},
+               'inputs': [PATH_ASTGDEM + ASTGDEM_PCS_EU], 'outputs': [IMG_PATH_ASTGDEM + IMG_NAME_ASTGDEM_EU + '.png']})
+
+# Compute the slope, aspect and hillshade of DEM in BNG PCS.
+stages.append({'name': 'terrain_bng', 'func': dem_derivatives, 'deps': ['osgb2bng'],
+               'args': (PATH_ASTGDEM + ASTGDEM_PCS_UK,
+                        {k: PATH_ASTGDEM + v for k, v in ASTGDEM_DERIVATIVES_UK.items()}),
+               'workers_arg': 'max_workers',
+               'inputs': [PATH_ASTGDEM + ASTGDEM_PCS_UK],
+               'outputs': [PATH_ASTGDEM + v for v in ASTGDEM_DERIVATIVES_UK.values()]})
+
+# Compare DEM in LAEA PCS with EU-DEM in LAEA PCS (ASTER GDEM - EU-DEM on the grid of EU-DEM).
+if COMPARE_EUDEM:
+    stages.append({'name': 'compare_eudem', 'func': compare_dems, 'deps': ['etrs2laea'],
+                   'args': (PATH_EUDEM_REF, PATH_ASTGDEM + ASTGDEM_PCS_EU, PATH_ASTGDEM + ASTGDEM_DIFF_EU),
+                   'kwargs': {'stats_out': PATH_ASTGDEM + ASTGDEM_DIFF_STATS_EU}, 'workers_arg': 'max_workers',
+                   'inputs': [PATH_EUDEM_REF, PATH_ASTGDEM + ASTGDEM_PCS_EU],
+                   'outputs': [PATH_ASTGDEM + ASTGDEM_DIFF_EU, PATH_ASTGDEM + ASTGDEM_DIFF_STATS_EU]})
+
+# Render XYZ web tiles (with hillshade) from DEM in Pseudo Mercator PCS.
+# The tiles are read from the overviews built by 'show_merc', so they are rendered after it.
+stages.append({'name': 'xyz_merc', 'func': render_xyz_tiles, 'deps': ['show_merc'],
+               'args': (PATH_ASTGDEM + ASTGDEM_PCS_WD, PATH_XYZ_ASTGDEM, XYZ_ZOOMS),
+               'kwargs': {'if_hillshade': True}, 'workers_arg': 'max_workers',
+               'inputs': [PATH_ASTGDEM + ASTGDEM_PCS_WD], 'outputs': [PATH_XYZ_ASTGDEM]})
+
+if __name__ == '__main__':
+
+    # <ASTGDEMv20> Run the processing pipeline.
+
+    print('\n>>> <ASTGDEMv20> Run the processing pipeline.')
+
+    if os.path.exists(IMG_PATH_ASTGDEM) is False:
+        os.mkdir(IMG_PATH_ASTGDEM)
+
+    manifest = DEMManifest(PATH_MANIFEST)
+    run_pipeline(stages, max_workers=PIPELINE_WORKERS, manifest=manifest, trace_path=PATH_TRACE,
+                 profile_stage=PROFILE_STAGE)
 
-path = PATH_ASTGDEM
-dem_in = path + ASTGDEM_GCS_EU
-dem_out = path + ASTGDEM_PCS_EU
+    for dem_name in [ASTGDEM_GCS_WD, ASTGDEM_GCS_UK, ASTGDEM_GCS_EU, ASTGDEM_PCS_WD, ASTGDEM_PCS_UK, ASTGDEM_PCS_EU]:
+        print('\n>>> The information of DEM:', dem_name)
+        data = gdal.Open(PATH_ASTGDEM + dem_name)
+        get_dem_info(data, if_print=True)
 
-epsg_in = EPSG_ETRS89
-epsg_out = EPSG_LAEA
+    print('\n>>> Complete!\n')
 
-transprojcnvt_dem(dem_in, epsg_in, dem_out, epsg_out)
+    # Read London air quality monitoring station data file.
 
-data = gdal.Open(dem_in)
-get_dem_info(data, if_print=True)
-data = gdal.Open(dem_out)
-get_dem_info(data, if_print=True)
+    print('\n>>> Read London air quality monitoring station data file.')
 
-print('\n>>> Complete!\n')
+    site_data = read_csv(PATH_LD_STATION_DATA)
+    print(site_data.head(3))
 
+    site_num = site_data['SiteName'].count()
+    print('\n*==> The number of stations is: %d' % site_num)
 
-# <ASTGDEMv20> Display DEM in PCS as a 2D image.
+    # Get the latitude and longitude of stations.
+    site_latlng = np.zeros((site_num, 2))
+    site_latlng[:, 0] = site_data['Latitude']  # The 0-th column - Latitude.
+    site_latlng[:, 1] = site_data['Longitude']  # The 1-th column - Longitude.
 
-dem_path = PATH_ASTGDEM
-img_path = IMG_PATH_ASTGDEM
-# Create the path for saving 2D DEM images.
-if os.path.exists(img_path) is False:
-    os.mkdir(img_path)
+    np.set_printoptions(suppress=True)  # Print numbers without scientific notation.
+    print('\n*==> The location (lat, lng) of stations are:\n', site_latlng)
 
-# Display 2D DEM image in Pseudo Mercator PCS.
-print('\n>>> <ASTGDEMv20> Display 2D DEM image in Pseudo Mercator PCS.')
-dem_name = ASTGDEM_PCS_WD
-img_name = IMG_NAME_ASTGDEM_WD
-show_2d_dem(dem_path, dem_name, img_path, img_name)
+    print('\n>>> Complete!\n')
 
-# Display 2D DEM image in BNG PCS.
-print('\n>>> <ASTGDEMv20> Display 2D DEM image in BNG PCS.')
-dem_name = ASTGDEM_PCS_UK
-img_name = IMG_NAME_ASTGDEM_UK
-show_2d_dem(dem_path, dem_name, img_path, img_name)
+    # <ASTGDEMv20> Get the elevation from DEM in WGS-84 GCS.
 
-# Display 2D DEM image in LAEA PCS.
-print('\n>>> <ASTGDEMv20> Display 2D DEM image in LAEA PCS.')
-dem_name = ASTGDEM_PCS_EU
-img_name = IMG_NAME_ASTGDEM_EU
-show_2d_dem(dem_path, dem_name, img_path, img_name)
+    print('\n>>> <ASTGDEMv20> Get the elevation from DEM in WGS-84 GCS.')
 
-print('\n>>> Complete!\n')
+    dem_gcs = open_dem(PATH_ASTGDEM + (ASTGDEM_GCS_WD_RAW if RAW_EXPORT else ASTGDEM_GCS_WD))
+    get_dem_info(dem_gcs, if_print=True)
 
+    site_ele_astgdem_wgs = run_stage('sample_wgs', get_elevation, (dem_gcs, site_latlng), {'epsg_in': EPSG_WGS84},
+                                     trace_path=PATH_TRACE, profile=(PROFILE_STAGE == 'sample_wgs'))
+    np.set_printoptions(suppress=True)
 
-# Read London air quality monitoring station data file.
+    print('\n*==> The elevation information of stations is:\n', site_ele_astgdem_wgs)
+    print('\n*==> The elevation value of stations is:\n', site_ele_astgdem_wgs[:, 5].astype(int))
 
-print('\n>>> Read London air quality monitoring station data file.')
+    print('\n>>> Complete!\n')
 
-site_data = read_csv(PATH_LD_STATION_DATA)
-print(site_data.head(3))
+    # <ASTGDEMv20> Get the elevation from DEM in OSGB-36 GCS.
 
-site_num = site_data['SiteName'].count()
-print('\n*==> The number of stations is: %d' % site_num)
+    print('\n>>> <ASTGDEMv20> Get the elevation from DEM in OSGB-36 GCS.')
 
-# Get the latitude and longitude of stations.
-site_latlng = np.zeros((site_num, 2))
-site_latlng[:, 0] = site_data['Latitude']  # The 0-th column - Latitude.
-site_latlng[:, 1] = site_data['Longitude']  # The 1-th column - Longitude.
+    dem_gcs = gdal.Open(PATH_ASTGDEM + ASTGDEM_GCS_UK)
+    get_dem_info(dem_gcs, if_print=True)
 
-np.set_printoptions(suppress=True)  # Print numbers without scientific notation.
-print('\n*==> The location (lat, lng) of stations are:\n', site_latlng)
+    site_ele_astgdem_osgb = run_stage('sample_osgb', get_elevation, (dem_gcs, site_latlng), {'epsg_in': EPSG_WGS84},
+                                      trace_path=PATH_TRACE, profile=(PROFILE_STAGE == 'sample_osgb'))
+    np.set_printoptions(suppress=True)
 
-print('\n>>> Complete!\n')
+    print('\n*==> The elevation information of stations is:\n', site_ele_astgdem_osgb)
+    print('\n*==> The elevation value of stations is:\n', site_ele_astgdem_osgb[:, 5].astype(int))
 
+    print('\n>>> Complete!\n')
 
-# <ASTGDEMv20> Get the elevation from DEM in WGS-84 GCS.
+    # <ASTGDEMv20> Get the elevation from DEM in ETRS-89 GCS.
 
-print('\n>>> <ASTGDEMv20> Get the elevation from DEM in WGS-84 GCS.')
+    print('\n>>> <ASTGDEMv20> Get the elevation from DEM in ETRS-89 GCS.')
 
-dem_gcs = gdal.Open(PATH_ASTGDEM + ASTGDEM_GCS_WD)
-get_dem_info(dem_gcs, if_print=True)
+    dem_gcs = gdal.Open(PATH_ASTGDEM + ASTGDEM_GCS_EU)
+    get_dem_info(dem_gcs, if_print=True)
 
-site_ele_astgdem_wgs = get_elevation(dem_gcs, site_latlng)
-np.set_printoptions(suppress=True)
+    site_ele_astgdem_etrs = run_stage('sample_etrs', get_elevation, (dem_gcs, site_latlng), {'epsg_in': EPSG_WGS84},
+                                      trace_path=PATH_TRACE, profile=(PROFILE_STAGE == 'sample_etrs'))
+    np.set_printoptions(suppress=True)
 
-print('\n*==> The elevation information of stations is:\n', site_ele_astgdem_wgs)
-print('\n*==> The elevation value of stations is:\n', site_ele_astgdem_wgs[:, 5].astype(int))
+    print('\n*==> The elevation information of stations is:\n', site_ele_astgdem_etrs)
+    print('\n*==> The elevation value of stations is:\n', site_ele_astgdem_etrs[:, 5].astype(int))
 
-print('\n>>> Complete!\n')
+    print('\n>>> Complete!\n')
 
+    # Compare the elevation obtained from different DEMs.
 
-# <ASTGDEMv20> Get the elevation from DEM in OSGB-36 GCS.
+    print('\n>>> Compare the elevation obtained from different DEMs.')
 
-print('\n>>> <ASTGDEMv20> Get the elevation from DEM in OSGB-36 GCS.')
+    print('\nASTGDEMv20_WD', site_ele_astgdem_wgs[:, 5].astype(int))
+    print('\nASTGDEMv20_UK', site_ele_astgdem_osgb[:, 5].astype(int))
+    print('\nASTGDEMv20_EU', site_ele_astgdem_etrs[:, 5].astype(int))
 
-dem_gcs = gdal.Open(PATH_ASTGDEM + ASTGDEM_GCS_UK)
-get_dem_info(dem_gcs, if_print=True)
+    print('\n>>> Complete!\n')
 
-site_ele_astgdem_osgb = get_elevation(dem_gcs, site_latlng)
-np.set_printoptions(suppress=True)
+    # <ASTGDEMv20> Get the statistics of elevation in buffers around stations from DEM in BNG PCS.
 
-print('\n*==> The elevation information of stations is:\n', site_ele_astgdem_osgb)
-print('\n*==> The elevation value of stations is:\n', site_ele_astgdem_osgb[:, 5].astype(int))
+    print('\n>>> <ASTGDEMv20> Get the statistics of elevation in buffers around stations from DEM in BNG PCS.')
 
-print('\n>>> Complete!\n')
+    dem_pcs = gdal.Open(PATH_ASTGDEM + ASTGDEM_PCS_UK)
+    site_zone_astgdem_bng = run_stage('zonal_bng', zonal_statistics,
+                                      (dem_pcs, site_latlng[:, 1], site_latlng[:, 0], ZONE_RADII),
+                                      {'epsg_in': EPSG_WGS84}, trace_path=PATH_TRACE,
+                                      profile=(PROFILE_STAGE == 'zonal_bng'))
 
+    for k, radius in enumerate(ZONE_RADII):
+        print('\n*==> The mean/std/min/max of elevation within %d m of stations are:' % radius)
+        print(np.column_stack([site_zone_astgdem_bng[name][:, k] for name in ('mean', 'std', 'min', 'max')]))
 
-# <ASTGDEMv20> Get the elevation from DEM in ETRS-89 GCS.
+    print('\n>>> Complete!\n')
 
-print('\n>>> <ASTGDEMv20> Get the elevation from DEM in ETRS-89 GCS.')
+    # <ASTGDEMv20> Check the line of sight between stations on DEM in BNG PCS.
 
-dem_gcs = gdal.Open(PATH_ASTGDEM + ASTGDEM_GCS_EU)
-get_dem_info(dem_gcs, if_print=True)
+    print('\n>>> <ASTGDEMv20> Check the line of sight between stations on DEM in BNG PCS.')
 
-site_ele_astgdem_etrs = get_elevation(dem_gcs, site_latlng)
-np.set_printoptions(suppress=True)
+    # The pairs of each station and the following stations.
+    pair_from, pair_to = np.triu_indices(site_num, k=1)
+    site_los_astgdem_bng = run_stage('los_bng', line_of_sight,
+                                     (dem_pcs, site_latlng[pair_from, 1], site_latlng[pair_from, 0],
+                                      site_latlng[pair_to, 1], site_latlng[pair_to, 0]),
+                                     {'h_from': LOS_HEIGHTS[0], 'h_to': LOS_HEIGHTS[1], 'epsg_in': EPSG_WGS84},
+                                     trace_path=PATH_TRACE, profile=(PROFILE_STAGE == 'los_bng'))
 
-print('\n*==> The elevation information of stations is:\n', site_ele_astgdem_etrs)
-print('\n*==> The elevation value of stations is:\n', site_ele_astgdem_etrs[:, 5].astype(int))
+    print('\n*==> The number of pairs of stations is: %d (%d visible)' % (
+        pair_from.shape[0], site_los_astgdem_bng['visible'].sum()))
+    print('\n*==> The visible pairs (station, station, distance) are:\n', np.column_stack(
+        (pair_from, pair_to, site_los_astgdem_bng['distance']))[site_los_astgdem_bng['visible']])
 
-print('\n>>> Complete!\n')
+    print('\n>>> Complete!\n')
 
+    # <ASTGDEMv20> Compute the viewsheds of stations on DEM in BNG PCS.
 
-# Compare the elevation obtained from different DEMs.
+    print('\n>>> <ASTGDEMv20> Compute the viewsheds of stations on DEM in BNG PCS.')
 
-print('\n>>> Compare the elevation obtained from different DEMs.')
+    site_view_astgdem_bng = run_stage('viewshed_bng', viewsheds,
+                                      (PATH_ASTGDEM + ASTGDEM_PCS_UK, site_latlng[:, 1], site_latlng[:, 0],
+                                       VIEWSHED_RADIUS, PATH_ASTGDEM + ASTGDEM_VIEWSHED_UK),
+                                      {'h_obs': LOS_HEIGHTS[0], 'h_tgt': LOS_HEIGHTS[1], 'epsg_in': EPSG_WGS84,
+                                       'visible_path': PATH_VIEWSHED, 'max_workers': PIPELINE_WORKERS},
+                                      inputs=[PATH_ASTGDEM + ASTGDEM_PCS_UK],
+                                      outputs=[PATH_ASTGDEM + ASTGDEM_VIEWSHED_UK],
+                                      trace_path=PATH_TRACE, profile=(PROFILE_STAGE == 'viewshed_bng'))
 
-print('\nASTGDEMv20_WD', site_ele_astgdem_wgs[:, 5].astype(int))
-print('\nASTGDEMv20_UK', site_ele_astgdem_osgb[:, 5].astype(int))
-print('\nASTGDEMv20_EU', site_ele_astgdem_etrs[:, 5].astype(int))
+    print('\n*==> The number of visible pixels within %d m of stations is:\n' % VIEWSHED_RADIUS,
+          site_view_astgdem_bng)
 
-print('\n>>> Complete!\n')
+    print('\n>>> Complete!\n')
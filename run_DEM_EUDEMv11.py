@@ -5,9 +5,7 @@ Date: 16th March 2019 (Update: 20th April 2019)
 Contact: hz298@exeter.ac.uk zhangheupc@126.com
 
 Copyright (c) 2019 He Zhang
-'''
 
-'''
 DEM Data:
     EUDEMv11  -  EU-DEMv1.1
     Download Link: https://land.copernicus.eu/imagery-in-situ/eu-dem/eu-dem-v1.1
@@ -34,9 +32,14 @@ Functions:
     Transform DEM from ETRS-89 GCS to WGS-84 GCS.
     Transform DEM from ETRS-89 GCS to OSGB-36 GCS.
 
+    Compute the slope, aspect and hillshade of source DEM in LAEA PCS.
+
+    Compare DEM in ETRS-89 GCS with source DEM in LAEA PCS (the error of the round trip of LAEA -> ETRS-89 -> LAEA).
+
     Get the elevation from DEM in WGS-84 GCS.
     Get the elevation from DEM in OSGB-36 GCS.
     Get the elevation from DEM in ETRS-89 GCS.
+    Get the elevation from source DEM in LAEA PCS (the locations are transformed instead of the DEM).
 
 ******************** Important Information of Code Usage ********************
 - Use 'GDAL.GetProjection()' to check the GCS/PCS information of DEM (in TIF format).
@@ -49,7 +52,11 @@ Functions:
 - You can not display DEM in GCS as 2D image (e.g., WGS-84 -> 2D image is wrong).
 - You can not project DEM in GCS to the unrelated PCS (e.g., WGS-84 -> BNG is wrong).
 - You can not project DEM between different PCSs (e.g., Pseudo Mercator <-> BNG is wrong).
+- The locations (in WGS-84 GCS) are transformed to the GCS/PCS of DEM before getting the elevation.
 * Use 'gdalwarp' command to transform/project DEM to different GCSs/PCSs might be correct.
+- The stages of processing DEMs are run concurrently in the order of their dependencies.
+- The time, memory and bytes of stages are appended to the trace file ('PATH_TRACE').
+- The slope, aspect and hillshade are computed from DEM in PCS only (the pixel size must be in meters).
 '''
 
 # Python 3.7
@@ -64,9 +71,15 @@ import numpy as np
 from osgeo import gdal
 from pandas import read_csv
 
+from pyDEM_function import DEMManifest
+from pyDEM_function import compare_dems
+from pyDEM_function import dem_creation_options
+from pyDEM_function import dem_derivatives
 from pyDEM_function import get_dem_info
 from pyDEM_function import get_elevation
 # from pyDEM_function import get_file_names
+from pyDEM_function import run_pipeline
+from pyDEM_function import run_stage
 # from pyDEM_function import show_2d_dem
 from pyDEM_function import transprojcnvt_dem
 # from pyDEM_function import write_dem
@@ -97,148 +110,181 @@ EUDEM_PCS_WD = 'EUDEMv11_EPSG3857.tif'
 EUDEM_PCS_UK = 'EUDEMv11_EPSG27700.tif'
 EUDEM_PCS_EU = 'EUDEMv11_EPSG3035.tif'
 
-# Set the path of location data file.
-PATH_LD_STATION_DATA = 'DATA/DATA_LD_AirQuality/London_AirQuality_Stations.csv'
+# Set the name of terrain derivatives (slope, aspect and hillshade) of source DEM in LAEA PCS.
+EUDEM_DERIVATIVES_EU = {'slope': 'EUDEMv11_EPSG3035_slope.tif',
+                        'aspect': 'EUDEMv11_EPSG3035_aspect.tif',
+                        'hillshade': 'EUDEMv11_EPSG3035_hillshade.tif'}
 
+# Set the name of difference DEM and error statistics of the round trip of LAEA PCS -> ETRS-89 GCS -> LAEA PCS.
+EUDEM_DIFF_EU = 'EUDEMv11_EPSG4258_diff_EPSG3035.tif'
+EUDEM_DIFF_STATS_EU = 'EUDEMv11_EPSG4258_diff_EPSG3035.json'
 
-# <EUDEMv11> Convert DEM from LAEA PCS to ETRS-89 GCS.
-
-print('\n>>> <EUDEMv11> Convert DEM from LAEA PCS to ETRS-89 GCS.')
-
-path = PATH_EUDEM
-dem_in = path + EUDEM_PCS_EU
-dem_out = path + EUDEM_GCS_EU
-
-epsg_in = EPSG_LAEA
-epsg_out = EPSG_ETRS89
+# Set the path of location data file.
+PATH_LD_STATION_DATA = 'DATA/DATA_LD_AirQuality/London_AirQuality_Stations.csv'
 
-transprojcnvt_dem(dem_in, epsg_in, dem_out, epsg_out)
+# Set the creation options of merged and transformed DEMs (tiled, compressed GeoTIFF).
+DEM_OPTIONS = dem_creation_options(gdal.GDT_Float32)
 
-data = gdal.Open(dem_in)
-get_dem_info(data, if_print=True)
-data = gdal.Open(dem_out)
-get_dem_info(data, if_print=True)
+# Set the number of workers for running independent stages concurrently (shared by the pools of stages).
+PIPELINE_WORKERS = 4
 
-print('\n>>> Complete!\n')
+# Set the path of manifest. Stages with unchanged inputs and options are skipped in re-runs.
+PATH_MANIFEST = 'DATA/DATA_EUDEMv11/manifest_pipeline.json'
 
+# Set the path of trace file of stages ('.jsonl' for JSON lines, '.json' for 'chrome://tracing' and Perfetto),
+# and the name of stage to run under cProfile (None for no profiling).
+PATH_TRACE = 'DATA/DATA_EUDEMv11/trace_stages.jsonl'
+PROFILE_STAGE = None
 
-# <EUDEMv11> Transform DEM from ETRS-89 GCS to WGS-84 GCS.
 
-print('\n>>> <EUDEMv11> Transform DEM from ETRS-89 GCS to WGS-84 GCS.')
+# <EUDEMv11> Define the stages of processing pipeline.
+#
+# laea2etrs -> etrs2wgs
+#           -> etrs2osgb
+#           -> compare_roundtrip
+# terrain_laea
 
-path = PATH_EUDEM
-dem_in = path + EUDEM_GCS_EU
-dem_out = path + EUDEM_GCS_WD
+stages = []
 
-epsg_in = EPSG_ETRS89
-epsg_out = EPSG_WGS84
+# Convert DEM from LAEA PCS to ETRS-89 GCS.
+stages.append({'name': 'laea2etrs', 'func': transprojcnvt_dem,
+               'args': (PATH_EUDEM + EUDEM_PCS_EU, EPSG_LAEA, PATH_EUDEM + EUDEM_GCS_EU, EPSG_ETRS89),
+               'kwargs': {'d_options': DEM_OPTIONS}, 'workers_arg': 'num_threads',
+               'inputs': [PATH_EUDEM + EUDEM_PCS_EU], 'outputs': [PATH_EUDEM + EUDEM_GCS_EU]})
 
-transprojcnvt_dem(dem_in, epsg_in, dem_out, epsg_out)
+# Transform DEM from ETRS-89 GCS to WGS-84 GCS and OSGB-36 GCS.
+stages.append({'name': 'etrs2wgs', 'func': transprojcnvt_dem, 'deps': ['laea2etrs'],
+               'args': (PATH_EUDEM + EUDEM_GCS_EU, EPSG_ETRS89, PATH_EUDEM + EUDEM_GCS_WD, EPSG_WGS84),
+               'kwargs': {'d_options': DEM_OPTIONS}, 'workers_arg': 'num_threads',
+               'inputs': [PATH_EUDEM + EUDEM_GCS_EU], 'outputs': [PATH_EUDEM + EUDEM_GCS_WD]})
+stages.append({'name': 'etrs2osgb', 'func': transprojcnvt_dem, 'deps': ['laea2etrs'],
+               'args': (PATH_EUDEM + EUDEM_GCS_EU, EPSG_ETRS89, PATH_EUDEM + EUDEM_GCS_UK, EPSG_OSGB36),
+               'kwargs': {'d_options': DEM_OPTIONS}, 'workers_arg': 'num_threads',
+               'inputs': [PATH_EUDEM + EUDEM_GCS_EU], 'outputs': [PATH_EUDEM + EUDEM_GCS_UK]})
 
-data = gdal.Open(dem_in)
-get_dem_info(data, if_print=True)
-data = gdal.Open(dem_out)
-get_dem_info(data, if_print=True)
+# Compare DEM in ETRS-89 GCS (aligned back to LAEA PCS) with source DEM in LAEA PCS.
+stages.append({'name': 'compare_roundtrip', 'func': compare_dems, 'deps': ['laea2etrs'],
+               'args': (PATH_EUDEM + EUDEM_PCS_EU, PATH_EUDEM + EUDEM_GCS_EU, PATH_EUDEM + EUDEM_DIFF_EU),
+               'kwargs': {'stats_out': PATH_EUDEM + EUDEM_DIFF_STATS_EU}, 'workers_arg': 'max_workers',
+               'inputs': [PATH_EUDEM + EUDEM_PCS_EU, PATH_EUDEM + EUDEM_GCS_EU],
+               'outputs': [PATH_EUDEM + EUDEM_DIFF_EU, PATH_EUDEM + EUDEM_DIFF_STATS_EU]})
 
-print('\n>>> Complete!\n')
+# Compute the slope, aspect and hillshade of source DEM in LAEA PCS.
+stages.append({'name': 'terrain_laea', 'func': dem_derivatives,
+               'args': (PATH_EUDEM + EUDEM_PCS_EU, {k: PATH_EUDEM + v for k, v in EUDEM_DERIVATIVES_EU.items()}),
+               'workers_arg': 'max_workers',
+               'inputs': [PATH_EUDEM + EUDEM_PCS_EU],
+               'outputs': [PATH_EUDEM + v for v in EUDEM_DERIVATIVES_EU.values()]})
 
 
-# <EUDEMv11> Transform DEM from ETRS-89 GCS to OSGB-36 GCS.
+if __name__ == '__main__':
 
-print('\n>>> <EUDEMv11> Transform DEM from ETRS-89 GCS to OSGB-36 GCS.')
+    # <EUDEMv11> Run the processing pipeline.
 
-path = PATH_EUDEM
-dem_in = path + EUDEM_GCS_EU
-dem_out = path + EUDEM_GCS_UK
+    print('\n>>> <EUDEMv11> Run the processing pipeline.')
 
-epsg_in = EPSG_ETRS89
-epsg_out = EPSG_OSGB36
+    manifest = DEMManifest(PATH_MANIFEST)
+    run_pipeline(stages, max_workers=PIPELINE_WORKERS, manifest=manifest, trace_path=PATH_TRACE,
+                 profile_stage=PROFILE_STAGE)
 
-transprojcnvt_dem(dem_in, epsg_in, dem_out, epsg_out)
+    for dem_name in [EUDEM_PCS_EU, EUDEM_GCS_EU, EUDEM_GCS_WD, EUDEM_GCS_UK]:
+        print('\n>>> The information of DEM:', dem_name)
+        data = gdal.Open(PATH_EUDEM + dem_name)
+        get_dem_info(data, if_print=True)
 
-data = gdal.Open(dem_in)
-get_dem_info(data, if_print=True)
-data = gdal.Open(dem_out)
-get_dem_info(data, if_print=True)
+    print('\n>>> Complete!\n')
 
-print('\n>>> Complete!\n')
+    # Read London air quality monitoring station data file.
 
+    print('\n>>> Read London air quality monitoring station data file.')
 
-# Read London air quality monitoring station data file.
+    site_data = read_csv(PATH_LD_STATION_DATA)
+    print(site_data.head(3))
 
-print('\n>>> Read London air quality monitoring station data file.')
+    site_num = site_data['SiteName'].count()
+    print('\n*==> The number of stations is: %d' % site_num)
 
-site_data = read_csv(PATH_LD_STATION_DATA)
-print(site_data.head(3))
+    # Get the latitude and longitude of stations.
+    site_latlng = np.zeros((site_num, 2))
+    site_latlng[:, 0] = site_data['Latitude']  # The 0-th column - Latitude.
+    site_latlng[:, 1] = site_data['Longitude']  # The 1-th column - Longitude.
 
-site_num = site_data['SiteName'].count()
-print('\n*==> The number of stations is: %d' % site_num)
+    np.set_printoptions(suppress=True)  # Print numbers without scientific notation.
+    print('\n*==> The location (lat, lng) of stations are:\n', site_latlng)
 
-# Get the latitude and longitude of stations.
-site_latlng = np.zeros((site_num, 2))
-site_latlng[:, 0] = site_data['Latitude']  # The 0-th column - Latitude.
-site_latlng[:, 1] = site_data['Longitude']  # The 1-th column - Longitude.
+    print('\n>>> Complete!\n')
 
-np.set_printoptions(suppress=True)  # Print numbers without scientific notation.
-print('\n*==> The location (lat, lng) of stations are:\n', site_latlng)
+    # <EUDEMv11> Get the elevation from DEM in WGS-84 GCS.
 
-print('\n>>> Complete!\n')
+    print('\n>>> <EUDEMv11> Get the elevation from DEM in WGS-84 GCS.')
 
+    dem_gcs = gdal.Open(PATH_EUDEM + EUDEM_GCS_WD)
+    get_dem_info(dem_gcs, if_print=True)
 
-# <EUDEMv11> Get the elevation from DEM in WGS-84 GCS.
+    site_ele_eudem_wgs = run_stage('sample_wgs', get_elevation, (dem_gcs, site_latlng), {'epsg_in': EPSG_WGS84},
+                                   trace_path=PATH_TRACE, profile=(PROFILE_STAGE == 'sample_wgs'))
+    np.set_printoptions(suppress=True)
 
-print('\n>>> <EUDEMv11> Get the elevation from DEM in WGS-84 GCS.')
+    print('\n*==> The elevation information of stations is:\n', site_ele_eudem_wgs)
+    print('\n*==> The elevation value of stations is:\n', site_ele_eudem_wgs[:, 5].astype(int))
 
-dem_gcs = gdal.Open(PATH_EUDEM + EUDEM_GCS_WD)
-get_dem_info(dem_gcs, if_print=True)
+    print('\n>>> Complete!\n')
 
-site_ele_eudem_wgs = get_elevation(dem_gcs, site_latlng)
-np.set_printoptions(suppress=True)
+    # <EUDEMv11> Get the elevation from DEM in OSGB-36 GCS.
 
-print('\n*==> The elevation information of stations is:\n', site_ele_eudem_wgs)
-print('\n*==> The elevation value of stations is:\n', site_ele_eudem_wgs[:, 5].astype(int))
+    print('\n>>> <EUDEMv11> Get the elevation from DEM in OSGB-36 GCS.')
 
-print('\n>>> Complete!\n')
+    dem_gcs = gdal.Open(PATH_EUDEM + EUDEM_GCS_UK)
+    get_dem_info(dem_gcs, if_print=True)
 
+    site_ele_eudem_osgb = run_stage('sample_osgb', get_elevation, (dem_gcs, site_latlng), {'epsg_in': EPSG_WGS84},
+                                    trace_path=PATH_TRACE, profile=(PROFILE_STAGE == 'sample_osgb'))
+    np.set_printoptions(suppress=True)
 
-# <EUDEMv11> Get the elevation from DEM in OSGB-36 GCS.
+    print('\n*==> The elevation information of stations is:\n', site_ele_eudem_osgb)
+    print('\n*==> The elevation value of stations is:\n', site_ele_eudem_osgb[:, 5].astype(int))
 
-print('\n>>> <EUDEMv11> Get the elevation from DEM in OSGB-36 GCS.')
+    print('\n>>> Complete!\n')
 
-dem_gcs = gdal.Open(PATH_EUDEM + EUDEM_GCS_UK)
-get_dem_info(dem_gcs, if_print=True)
+    # <EUDEMv11> Get the elevation from DEM in ETRS-89 GCS.
 
-site_ele_eudem_osgb = get_elevation(dem_gcs, site_latlng)
-np.set_printoptions(suppress=True)
+    print('\n>>> <EUDEMv11> Get the elevation from DEM in ETRS-89 GCS.')
 
-print('\n*==> The elevation information of stations is:\n', site_ele_eudem_osgb)
-print('\n*==> The elevation value of stations is:\n', site_ele_eudem_osgb[:, 5].astype(int))
+    dem_gcs = gdal.Open(PATH_EUDEM + EUDEM_GCS_EU)
+    get_dem_info(dem_gcs, if_print=True)
 
-print('\n>>> Complete!\n')
+    site_ele_eudem_etrs = run_stage('sample_etrs', get_elevation, (dem_gcs, site_latlng), {'epsg_in': EPSG_WGS84},
+                                    trace_path=PATH_TRACE, profile=(PROFILE_STAGE == 'sample_etrs'))
+    np.set_printoptions(suppress=True)
 
+    print('\n*==> The elevation information of stations is:\n', site_ele_eudem_etrs)
+    print('\n*==> The elevation value of stations is:\n', site_ele_eudem_etrs[:, 5].astype(int))
 
-# <EUDEMv11> Get the elevation from DEM in ETRS-89 GCS.
+    print('\n>>> Complete!\n')
 
-print('\n>>> <EUDEMv11> Get the elevation from DEM in ETRS-89 GCS.')
+    # <EUDEMv11> Get the elevation from source DEM in LAEA PCS.
 
-dem_gcs = gdal.Open(PATH_EUDEM + EUDEM_GCS_EU)
-get_dem_info(dem_gcs, if_print=True)
+    print('\n>>> <EUDEMv11> Get the elevation from source DEM in LAEA PCS.')
 
-site_ele_eudem_etrs = get_elevation(dem_gcs, site_latlng)
-np.set_printoptions(suppress=True)
+    dem_pcs = gdal.Open(PATH_EUDEM + EUDEM_PCS_EU)
+    get_dem_info(dem_pcs, if_print=True)
 
-print('\n*==> The elevation information of stations is:\n', site_ele_eudem_etrs)
-print('\n*==> The elevation value of stations is:\n', site_ele_eudem_etrs[:, 5].astype(int))
+    site_ele_eudem_laea = run_stage('sample_laea', get_elevation, (dem_pcs, site_latlng), {'epsg_in': EPSG_WGS84},
+                                    trace_path=PATH_TRACE, profile=(PROFILE_STAGE == 'sample_laea'))
+    np.set_printoptions(suppress=True)
 
-print('\n>>> Complete!\n')
+    print('\n*==> The elevation information of stations is:\n', site_ele_eudem_laea)
+    print('\n*==> The elevation value of stations is:\n', site_ele_eudem_laea[:, 5].astype(int))
 
+    print('\n>>> Complete!\n')
 
-# Compare the elevation obtained from different DEMs.
+    # Compare the elevation obtained from different DEMs.
 
-print('\n>>> Compare the elevation obtained from different DEMs.')
+    print('\n>>> Compare the elevation obtained from different DEMs.')
 
-print('\nEUDEMv11_WD', site_ele_eudem_wgs[:, 5].astype(int))
-print('\nEUDEMv11_UK', site_ele_eudem_osgb[:, 5].astype(int))
-print('\nEUDEMv11_EU', site_ele_eudem_etrs[:, 5].astype(int))
+    print('\nEUDEMv11_WD', site_ele_eudem_wgs[:, 5].astype(int))
+    print('\nEUDEMv11_UK', site_ele_eudem_osgb[:, 5].astype(int))
+    print('\nEUDEMv11_EU', site_ele_eudem_etrs[:, 5].astype(int))
+    print('\nEUDEMv11_LAEA', site_ele_eudem_laea[:, 5].astype(int))
 
-print('\n>>> Complete!\n')
+    print('\n>>> Complete!\n')
@@ -0,0 +1,406 @@
+'''Python for Processing Digital Elevation Models (DEMs).
+
+Benchmark of processing DEMs with synthetic DEM tiles.
+
+Copyright (c) 2019 He Zhang
+
+Benchmarks:
+    Write DEM ('write_dem').
+    Remove the overlapped elements of DEM tiles ('reform_dem_tiles').
+    Merge the reformed DEM tiles ('merge_dem_folder').
+    Project the merged DEM from WGS-84 GCS to Pseudo Mercator PCS ('transprojcnvt_dem').
+    Display 2D DEM image in Pseudo Mercator PCS ('show_2d_dem').
+    Get the elevation of locations from the merged DEM ('get_elevation').
+
+    Sample the elevation with the per-location loop (previous 'get_elevation').
+    Sample the elevation with the vectorized batch sampler ('sample_elevation').
+    Sample the elevation with the block-cached batch sampler (repeated queries on the same DEM).
+    Sample the elevation with the nearest, bilinear and bicubic interpolation.
+
+******************** Important Information of Code Usage ********************
+- Synthetic DEM tiles (named as ASTER-GDEM tiles, with the one-pixel overlap) are written to 'BENCH_PATH',
+  no DEM data is required.
+- Each benchmark is run in a new process, so its peak RSS (resident memory) is measured separately.
+- The peak RSS of worker processes of a benchmark (e.g., the process pool of 'reform_dem_tiles') is the peak of
+  the largest worker ('rss_children_mb'), the total memory of parallel benchmarks is up to 'rss_mb' plus
+  'rss_children_mb' times the number of workers.
+- A benchmark failing (or killed, e.g., by the OOM killer) is reported as an error instead of hanging.
+- The wall time, peak RSS and throughput (pixels/s or pts/s) of benchmarks are saved to 'BENCH_RESULTS'.
+- The wall time is compared with the baseline ('BENCH_BASELINE') if it exists, and the benchmarks slower
+  than the baseline by 'BENCH_TOLERANCE' are reported as regressions.
+- Set 'BENCH_SAVE_BASELINE = True' to save the results as the baseline.
+'''
+
+# Python 3.7
+
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import shutil
+import time
+import traceback
+
+import numpy as np
+from osgeo import gdal
+
+from pyDEM_function import DEMBlockCache
+from pyDEM_function import _peak_rss_mb
+from pyDEM_function import dem_creation_options
+from pyDEM_function import get_elevation
+from pyDEM_function import merge_dem_folder
+from pyDEM_function import reform_dem_tiles
+from pyDEM_function import sample_elevation
+from pyDEM_function import show_2d_dem
+from pyDEM_function import transprojcnvt_dem
+from pyDEM_function import write_dem
+
+
+# Specify user settings.
+
+# Set the EPSG code.
+EPSG_WGS84 = 4326
+EPSG_MERC = 3857
+
+# Set the path of synthetic DEMs and images.
+BENCH_PATH = 'BENCH/'
+
+# Set the size of synthetic DEM tiles (with the one-pixel overlap, e.g., 3601 for ASTER-GDEM tiles).
+BENCH_TILE_SIZES = [601, 1201, 3601]
+
+# Set the grid of synthetic DEM tiles [lat, lng] and the latitude/longitude of the lower-left tile.
+BENCH_TILE_GRID = [2, 2]
+BENCH_TILE_LATLNG = [51, -1]
+
+# Set the data type, nodata value and nodata fraction of synthetic DEM tiles.
+BENCH_DEM_TYPE = gdal.GDT_Int16
+BENCH_DEM_NODATA = -9999
+BENCH_NODATA_FRACTION = 0.01
+
+# Set the number of sampled locations.
+BENCH_POINT_NUM = 1000000
+
+# Set the number of workers.
+BENCH_WORKERS = 4
+
+# Set the path of results and baseline, and the tolerance of regressions (ratio of wall time).
+BENCH_RESULTS = 'BENCH/benchmark_results.json'
+BENCH_BASELINE = 'BENCH_baseline.json'
+BENCH_SAVE_BASELINE = False
+BENCH_TOLERANCE = 1.2
+
+# Set the random seed.
+BENCH_SEED = 0
+
+# Set the size and path of synthetic DEM and the number of locations (sampling benchmarks).
+BENCH_DEM_ROW = 3600
+BENCH_DEM_COL = 3600
+BENCH_DEM_GT = (-1.0, 1.0 / 3600, 0.0, 52.0, 0.0, -1.0 / 3600)
+BENCH_SAMPLE_DEM = BENCH_PATH + 'bench_sample_dem.tif'
+BENCH_POINT_NUMS = [1000, 10000, 100000, 1000000]
+
+
+def synthetic_dem(d_row, d_col, d_lat, d_lng, nodata_fraction=0.0, nodata=-9999, seed=0):
+    '''Create a synthetic DEM (smooth terrain with noise) of the tile with the lower-left corner (lat, lng).'''
+    rng = np.random.RandomState(seed)
+    lat = d_lat + 1 - np.arange(d_row)[:, np.newaxis] / (d_row - 1.0)
+    lng = d_lng + np.arange(d_col)[np.newaxis, :] / (d_col - 1.0)
+    dem_array = (300 + 200 * np.sin(3 * lat) * np.cos(5 * lng) + 80 * np.sin(17 * lat + 11 * lng) +
+                 rng.normal(0, 5, (d_row, d_col)))
+    dem_array = dem_array.astype(np.int16)
+    dem_array[rng.rand(d_row, d_col) < nodata_fraction] = nodata
+
+    return dem_array
+
+
+def create_synthetic_tiles(tile_path, tile_size, tile_grid, tile_latlng, d_type=gdal.GDT_Int16, nodata=-9999,
+                           nodata_fraction=0.0, seed=0):
+    '''Write synthetic DEM tiles in WGS-84 GCS (named and overlapped as ASTER-GDEM tiles).'''
+    if os.path.exists(tile_path) is False:
+        os.makedirs(tile_path)
+
+    srs_wkt = 'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563]],PRIMEM["Greenwich",0],' \
+              'UNIT["degree",0.0174532925199433],AUTHORITY["EPSG","4326"]]'
+    res = 1.0 / (tile_size - 1)
+
+    tile_names = []
+    for i in range(tile_grid[0]):
+        for j in range(tile_grid[1]):
+            t_lat, t_lng = tile_latlng[0] + i, tile_latlng[1] + j
+            tile_name = 'ASTGTM2_%s%02d%s%03d_dem.tif' % ('N' if t_lat >= 0 else 'S', abs(t_lat),
+                                                          'E' if t_lng >= 0 else 'W', abs(t_lng))
+            dem_array = synthetic_dem(tile_size, tile_size, t_lat, t_lng, nodata_fraction, nodata,
+                                      seed + i * tile_grid[1] + j)
+            t_gt = (t_lng - 0.5 * res, res, 0.0, t_lat + 1 + 0.5 * res, 0.0, -res)
+            write_dem(tile_path + tile_name, dem_array, tile_size, tile_size, 1, t_gt, srs_wkt, d_type=d_type,
+                      d_nodata=nodata)
+            tile_names.append(tile_name)
+
+    return tile_names
+
+
+def bench_write_dem(dem_file, d_size, seed=0):
+    '''Write a synthetic DEM (the data is created before timing).'''
+    dem_array = synthetic_dem(d_size, d_size, 51, -1, seed=seed)
+    t_start = time.perf_counter()
+    write_dem(dem_file, dem_array, d_size, d_size, 1, (-1.0, 1.0 / d_size, 0.0, 52.0, 0.0, -1.0 / d_size), '',
+              d_type=gdal.GDT_Int16)
+
+    return time.perf_counter() - t_start
+
+
+def bench_get_elevation(dem_file, point_num, seed=0):
+    '''Get the elevation of random locations inside DEM (the locations are created before timing).'''
+    dem_data = gdal.Open(dem_file)
+    gt = dem_data.GetGeoTransform()
+    rng = np.random.RandomState(seed)
+    site_latlng = np.zeros((point_num, 2))
+    site_latlng[:, 0] = gt[3] + rng.uniform(0, dem_data.RasterYSize, point_num) * gt[5]
+    site_latlng[:, 1] = gt[0] + rng.uniform(0, dem_data.RasterXSize, point_num) * gt[1]
+
+    t_start = time.perf_counter()
+    get_elevation(dem_data, site_latlng)
+
+    return time.perf_counter() - t_start
+
+
+def _bench_worker(func, args, kwargs, result_queue):
+    try:
+        t_start = time.perf_counter()
+        t_func = func(*args, **kwargs)
+        t_wall = time.perf_counter() - t_start
+    except BaseException:
+        result_queue.put(('error', traceback.format_exc()))
+        raise
+    # The functions returning their own timing exclude the preparation of data.
+    result_queue.put(('ok', (t_func if isinstance(t_func, float) else t_wall, _peak_rss_mb(),
+                             _peak_rss_mb(resource.RUSAGE_CHILDREN))))
+
+
+def run_benchmark(bench_name, func, args=(), kwargs=None, n_items=0):
+    '''Run a benchmark in a new process and get its wall time, peak RSS and throughput.
+
+    Parameters:
+        bench_name <str> -- The name of benchmark.
+        func <function> -- The benchmarked function (returning its own wall time in float, or anything else).
+        args <tuple> -- The positional arguments of function. Default is ().
+        kwargs <dict> -- The keyword arguments of function. Default is None.
+        n_items <int> -- The number of items (pixels or locations) processed. Default is 0.
+
+    Return:
+        result <dict> -- The wall time (s), peak RSS (MB) of the benchmark process and of its largest worker
+            process, and throughput (items/s) of benchmark.
+    '''
+    result_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_bench_worker, args=(func, args, kwargs or {}, result_queue))
+    process.start()
+
+    # Wait for the result while the benchmark process is alive (it puts nothing if it is killed).
+    while True:
+        try:
+            status, value = result_queue.get(timeout=1.0)
+            break
+        except queue.Empty:
+            if process.is_alive() is False:
+                try:
+                    status, value = result_queue.get(timeout=1.0)
+                    break
+                except queue.Empty:
+                    raise RuntimeError('The benchmark %s exited with code %s without a result' % (
+                        bench_name, process.exitcode))
+    process.join()
+    if status == 'error':
+        raise RuntimeError('The benchmark %s failed:\n%s' % (bench_name, value))
+
+    t_wall, rss_mb, rss_children_mb = value
+    result = {'wall': t_wall, 'rss_mb': rss_mb, 'rss_children_mb': rss_children_mb,
+              'throughput': n_items / max(t_wall, 1e-9)}
+    print('\n*==> %-28s %8.3f s %8.1f MB %14.0f items/s' % (bench_name, t_wall, rss_mb, result['throughput']))
+
+    return result
+
+
+def compare_baseline(results, baseline, tolerance=1.2):
+    '''Compare the wall time of benchmarks with the baseline.
+
+    Return:
+        regressions <list> -- The name of benchmarks slower than the baseline by 'tolerance'.
+    '''
+    regressions = []
+    for bench_name in sorted(results):
+        if bench_name not in baseline:
+            print('%-34s %8.3f s (no baseline)' % (bench_name, results[bench_name]['wall']))
+            continue
+        ratio = results[bench_name]['wall'] / max(baseline[bench_name]['wall'], 1e-9)
+        flag = 'REGRESSION' if ratio > tolerance else ''
+        print('%-34s %8.3f s vs %8.3f s (x%.2f) %s' % (
+            bench_name, results[bench_name]['wall'], baseline[bench_name]['wall'], ratio, flag))
+        if flag:
+            regressions.append(bench_name)
+
+    return regressions
+
+
+def sample_elevation_loop(dem_data, x_geo, y_geo):
+    '''Sample the elevation with the per-location loop (reference for benchmark).'''
+    gdal_array = dem_data.ReadAsArray().astype(np.float64)
+    nodataval = dem_data.GetRasterBand(1).GetNoDataValue()
+    if np.any(gdal_array == nodataval):
+        gdal_array[gdal_array == nodataval] = np.nan
+
+    gt = dem_data.GetGeoTransform()
+    site_ele = np.zeros((x_geo.shape[0], 6))
+    for i in range(x_geo.shape[0]):
+        Xpixel = int(np.floor((x_geo[i] - gt[0]) / gt[1]))
+        Yline = int(np.floor((y_geo[i] - gt[3]) / gt[5]))
+
+        site_ele[i, 0] = int(i)
+        site_ele[i, 1] = y_geo[i]
+        site_ele[i, 2] = x_geo[i]
+        site_ele[i, 3] = Yline
+        site_ele[i, 4] = Xpixel
+        site_ele[i, 5] = gdal_array[Yline, Xpixel]
+
+    return site_ele
+
+
+if __name__ == '__main__':
+
+    # Benchmark the processing of synthetic DEM tiles.
+
+    print('\n>>> Benchmark the processing of synthetic DEM tiles.')
+
+    results = {}
+    for tile_size in BENCH_TILE_SIZES:
+        size_path = BENCH_PATH + 'SIZE%d/' % tile_size
+        if os.path.exists(size_path):
+            shutil.rmtree(size_path)
+        path_source = size_path + 'EPSG4326_s/'
+        path_reform = size_path + 'EPSG4326_r/'
+        dem_gcs = size_path + 'BENCH_EPSG4326.tif'
+        dem_pcs = size_path + 'BENCH_EPSG3857.tif'
+
+        print('\n>>> Create the synthetic DEM tiles: %d x [%d, %d]' % (
+            BENCH_TILE_GRID[0] * BENCH_TILE_GRID[1], tile_size, tile_size))
+        tile_names = create_synthetic_tiles(path_source, tile_size, BENCH_TILE_GRID, BENCH_TILE_LATLNG,
+                                            d_type=BENCH_DEM_TYPE, nodata=BENCH_DEM_NODATA,
+                                            nodata_fraction=BENCH_NODATA_FRACTION, seed=BENCH_SEED)
+        tile_pixels = len(tile_names) * tile_size * tile_size
+        merged_pixels = len(tile_names) * (tile_size - 1) * (tile_size - 1)
+
+        benchmarks = [
+            ('write_dem', bench_write_dem, (size_path + 'BENCH_write.tif', tile_size, BENCH_SEED), {},
+             tile_size * tile_size),
+            ('reform', reform_dem_tiles, (path_source, tile_names, path_reform), {'max_workers': BENCH_WORKERS},
+             tile_pixels),
+            ('merge', merge_dem_folder, (path_reform, '.tif', dem_gcs), {}, merged_pixels),
+            ('wgs2merc', transprojcnvt_dem, (dem_gcs, EPSG_WGS84, dem_pcs, EPSG_MERC), {}, merged_pixels),
+            ('show_merc', show_2d_dem, (size_path, 'BENCH_EPSG3857.tif', size_path, 'BENCH_EPSG3857'),
+             {'img_show': False}, merged_pixels),
+            ('get_elevation', bench_get_elevation, (dem_gcs, BENCH_POINT_NUM, BENCH_SEED), {}, BENCH_POINT_NUM),
+        ]
+        for bench_name, func, args, kwargs, n_items in benchmarks:
+            results['%s@%d' % (bench_name, tile_size)] = run_benchmark(
+                '%s@%d' % (bench_name, tile_size), func, args, kwargs, n_items)
+
+    with open(BENCH_RESULTS, 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+
+    print('\n>>> Complete!\n')
+
+    # Compare the benchmarks with the baseline.
+
+    print('\n>>> Compare the benchmarks with the baseline.\n')
+
+    if os.path.isfile(BENCH_BASELINE):
+        with open(BENCH_BASELINE, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_baseline(results, baseline, tolerance=BENCH_TOLERANCE)
+        print('\n*==> The number of regressions is: %d' % len(regressions))
+    else:
+        print('*==> The baseline does not exist: %s' % BENCH_BASELINE)
+
+    if BENCH_SAVE_BASELINE:
+        shutil.copyfile(BENCH_RESULTS, BENCH_BASELINE)
+        print('\n*==> Save the results as the baseline: %s' % BENCH_BASELINE)
+
+    print('\n>>> Complete!\n')
+
+    # Create the synthetic DEM.
+
+    print('\n>>> Create the synthetic DEM: [%d, %d]' % (BENCH_DEM_ROW, BENCH_DEM_COL))
+
+    rng = np.random.RandomState(BENCH_SEED)
+    dem_array = rng.randint(-100, 1000, size=(BENCH_DEM_ROW, BENCH_DEM_COL)).astype(np.int16)
+    dem_array[rng.rand(BENCH_DEM_ROW, BENCH_DEM_COL) < 0.01] = BENCH_DEM_NODATA
+
+    # The DEM is written to a tiled GeoTIFF, so the block reads (and the block cache) are of a DEM file.
+    if os.path.exists(BENCH_PATH) is False:
+        os.makedirs(BENCH_PATH)
+    write_dem(BENCH_SAMPLE_DEM, dem_array, BENCH_DEM_ROW, BENCH_DEM_COL, 1, BENCH_DEM_GT, '', d_type=gdal.GDT_Int16,
+              d_nodata=BENCH_DEM_NODATA, d_options=dem_creation_options(gdal.GDT_Int16))
+    dem_data = gdal.Open(BENCH_SAMPLE_DEM)
+
+    print('\n>>> Complete!\n')
+
+    # Benchmark the per-location loop and the vectorized batch sampler.
+
+    print('\n>>> Benchmark the per-location loop and the vectorized batch sampler.')
+
+    gt = BENCH_DEM_GT
+    for point_num in BENCH_POINT_NUMS:
+        # Keep locations inside DEM, since the per-location loop does not check bounds.
+        x_geo = gt[0] + rng.uniform(0, BENCH_DEM_COL - 1, point_num) * gt[1]
+        y_geo = gt[3] + rng.uniform(0, BENCH_DEM_ROW - 1, point_num) * gt[5]
+
+        t_start = time.perf_counter()
+        site_ele = sample_elevation_loop(dem_data, x_geo, y_geo)
+        t_loop = time.perf_counter() - t_start
+
+        t_start = time.perf_counter()
+        site_sample = sample_elevation(dem_data, x_geo, y_geo, read_mode='full')
+        t_batch = time.perf_counter() - t_start
+
+        assert np.array_equal(site_ele[:, 5], site_sample['elevation'], equal_nan=True)
+
+        # The first query reads the touched blocks, the repeated query is served by the block cache.
+        block_cache = DEMBlockCache()
+        t_start = time.perf_counter()
+        sample_elevation(dem_data, x_geo, y_geo, read_mode='block', block_cache=block_cache)
+        t_block = time.perf_counter() - t_start
+        bytes_read = block_cache.bytes_read
+
+        t_start = time.perf_counter()
+        site_sample = sample_elevation(dem_data, x_geo, y_geo, read_mode='block', block_cache=block_cache)
+        t_cached = time.perf_counter() - t_start
+
+        assert np.array_equal(site_ele[:, 5], site_sample['elevation'], equal_nan=True)
+
+        print('\n*==> The number of locations is: %d' % point_num)
+        print('Loop:   %.3f s, %.0f pts/s' % (t_loop, point_num / t_loop))
+        print('Batch:  %.3f s, %.0f pts/s (x%.1f)' % (t_batch, point_num / t_batch, t_loop / t_batch))
+        print('Block:  %.3f s, %.0f pts/s, %d bytes read' % (t_block, point_num / t_block, bytes_read))
+        print('Cached: %.3f s, %.0f pts/s, %d bytes read' % (t_cached, point_num / t_cached,
+                                                             block_cache.bytes_read - bytes_read))
+
+    print('\n>>> Complete!\n')
+
+    # Benchmark the interpolation methods of the batch sampler.
+
+    print('\n>>> Benchmark the interpolation methods of the batch sampler.')
+
+    point_num = BENCH_POINT_NUMS[-1]
+    x_geo = gt[0] + rng.uniform(0, BENCH_DEM_COL - 1, point_num) * gt[1]
+    y_geo = gt[3] + rng.uniform(0, BENCH_DEM_ROW - 1, point_num) * gt[5]
+
+    print('\n*==> The number of locations is: %d' % point_num)
+    for method in ['nearest', 'bilinear', 'bicubic']:
+        block_cache = DEMBlockCache()
+        sample_elevation(dem_data, x_geo, y_geo, block_cache=block_cache, method=method)
+        t_start = time.perf_counter()
+        sample_elevation(dem_data, x_geo, y_geo, block_cache=block_cache, method=method)
+        t_method = time.perf_counter() - t_start
+        print('%s: %.3f s, %.0f pts/s' % (method.capitalize(), t_method, point_num / t_method))
+
+    print('\n>>> Complete!\n')
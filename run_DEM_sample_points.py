@@ -0,0 +1,82 @@
+'''Python for Processing Digital Elevation Models (DEMs).
+
+Sample the elevation of locations in large point files (e.g., GPS fixes) from DEMs.
+
+Copyright (c) 2019 He Zhang
+
+Functions:
+    Read the point file (CSV or Parquet) in chunks.
+    Sample the elevation of locations in each chunk from one or more DEMs (in parallel).
+    Append the chunks with elevation to the output file (CSV or Parquet) in the order of input.
+
+Usage:
+    python run_DEM_sample_points.py points.csv points_ele.parquet DEM_1.tif DEM_2.vrt [options]
+    python run_DEM_sample_points.py --help
+
+******************** Important Information of Code Usage ********************
+- The locations are in WGS-84 GCS by default, and transformed to the GCS/PCS of each DEM before sampling.
+- The memory is constant regardless of the number of locations (bounded by the chunks in flight).
+- Reading and writing Parquet files requires 'pyarrow'.
+- The DEMs can be GDAL DEMs (e.g., TIF or VRT) or raw DEMs (.npy, see 'export_raw_dem').
+'''
+
+# Python 3.7
+
+import argparse
+import time
+
+from pyDEM_function import sample_points_file
+
+
+# Specify user settings (the default values of command line options).
+
+# Set the columns of latitude and longitude of locations.
+POINT_LAT_COL = 'Latitude'
+POINT_LNG_COL = 'Longitude'
+
+# Set the EPSG code of locations.
+POINT_EPSG = 4326
+
+# Set the method of sampling ('nearest', 'bilinear' or 'bicubic').
+SAMPLE_METHOD = 'nearest'
+
+# Set the number of rows of chunks and the number of worker processes.
+CHUNK_ROWS = 1000000
+SAMPLE_WORKERS = 4
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Sample the elevation of locations in a point file from DEMs.')
+    parser.add_argument('points_in', help='The input point file (.csv or .parquet).')
+    parser.add_argument('points_out', help='The output point file (.csv or .parquet).')
+    parser.add_argument('dem_files', nargs='+', help='The DEMs (e.g., .tif, .vrt or .npy).')
+    parser.add_argument('--lat-col', default=POINT_LAT_COL, help='The column of latitude (Y coordinate).')
+    parser.add_argument('--lng-col', default=POINT_LNG_COL, help='The column of longitude (X coordinate).')
+    parser.add_argument('--epsg', type=int, default=POINT_EPSG,
+                        help='The EPSG code of locations (0 if in the GCS/PCS of DEMs).')
+    parser.add_argument('--method', default=SAMPLE_METHOD, choices=['nearest', 'bilinear', 'bicubic'],
+                        help='The method of sampling.')
+    parser.add_argument('--ele-cols', nargs='+', default=None, help='The output columns of elevation (per DEM).')
+    parser.add_argument('--columns', nargs='+', default=None, help='The input columns to keep (default all).')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='The number of rows of chunks.')
+    parser.add_argument('--workers', type=int, default=SAMPLE_WORKERS, help='The number of worker processes.')
+    parser.add_argument('--progress', action='store_true', help='Print the progress of each chunk.')
+    args = parser.parse_args()
+
+    # Sample the elevation of locations from DEMs.
+
+    print('\n>>> Sample the elevation of locations in %s from %d DEM(s).' % (args.points_in, len(args.dem_files)))
+
+    t_start = time.time()
+    n_rows = sample_points_file(args.points_in, args.points_out, args.dem_files, lat_col=args.lat_col,
+                                lng_col=args.lng_col, epsg_in=args.epsg or None, method=args.method,
+                                ele_cols=args.ele_cols, columns=args.columns, chunk_rows=args.chunk_rows,
+                                max_workers=args.workers, if_print=args.progress)
+    t_total = time.time() - t_start
+
+    print('\n*==> The number of sampled locations is: %d (%.2f s, %.0f rows/s)' % (
+        n_rows, t_total, n_rows / max(t_total, 1e-9)))
+    print('*==> The output file is: %s' % args.points_out)
+
+    print('\n>>> Complete!\n')
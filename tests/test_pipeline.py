@@ -0,0 +1,121 @@
+'''Tests of the pipeline scheduler (dependencies, critical path, worker budget and skipping unchanged stages).'''
+
+import os
+import time
+
+import pytest
+
+pytest.importorskip('osgeo.gdal')
+
+from pyDEM_function import DEMManifest  # noqa: E402
+from pyDEM_function import run_pipeline  # noqa: E402
+
+CALLS = []
+
+
+def sleep_stage(name, t_sleep, max_workers=None):
+    '''Sleep and return the number of workers given to the stage.'''
+    CALLS.append(name)
+    time.sleep(t_sleep)
+
+    return max_workers
+
+
+def copy_stage(name, file_in, file_out):
+    '''Copy a text file with the name of stage appended.'''
+    CALLS.append(name)
+    with open(file_in, 'r') as f:
+        text = f.read()
+    with open(file_out, 'w') as f:
+        f.write(text + name)
+
+
+@pytest.fixture(autouse=True)
+def clear_calls():
+    del CALLS[:]
+
+
+def test_empty_pipeline():
+    pipeline_info = run_pipeline([], executor='thread')
+
+    assert pipeline_info == {'stages': {}, 'wall_time': 0.0, 'critical_time': 0.0, 'critical_path': []}
+
+
+def test_unknown_and_circular_dependencies():
+    with pytest.raises(ValueError, match='unknown stage'):
+        run_pipeline([{'name': 'a', 'func': sleep_stage, 'args': ('a', 0), 'deps': ['b']}], executor='thread')
+
+    with pytest.raises(ValueError, match='circular'):
+        run_pipeline([{'name': 'a', 'func': sleep_stage, 'args': ('a', 0), 'deps': ['b']},
+                      {'name': 'b', 'func': sleep_stage, 'args': ('b', 0), 'deps': ['a']}], executor='thread')
+    assert CALLS == []
+
+
+def test_critical_path_and_dependencies():
+    # a -> b -> d
+    #   -> c ->
+    stages = [{'name': 'd', 'func': sleep_stage, 'args': ('d', 0.05), 'deps': ['b', 'c']},
+              {'name': 'a', 'func': sleep_stage, 'args': ('a', 0.05)},
+              {'name': 'b', 'func': sleep_stage, 'args': ('b', 0.05), 'deps': ['a']},
+              {'name': 'c', 'func': sleep_stage, 'args': ('c', 0.3), 'deps': ['a']}]
+
+    pipeline_info = run_pipeline(stages, max_workers=4, executor='thread')
+
+    assert CALLS[0] == 'a' and CALLS[-1] == 'd'
+    assert pipeline_info['critical_path'] == ['a', 'c', 'd']
+    info = pipeline_info['stages']
+    assert info['b']['start'] >= info['a']['end'] and info['c']['start'] >= info['a']['end']
+    assert info['d']['start'] >= max(info['b']['end'], info['c']['end'])
+    assert pipeline_info['critical_time'] <= pipeline_info['wall_time'] + 1e-6
+
+
+def test_workers_are_shared_by_concurrent_stages():
+    stages = [{'name': 'a', 'func': sleep_stage, 'args': ('a', 0), 'workers_arg': 'max_workers'},
+              {'name': 'b', 'func': sleep_stage, 'args': ('b', 0.1), 'deps': ['a'], 'workers_arg': 'max_workers'},
+              {'name': 'c', 'func': sleep_stage, 'args': ('c', 0.1), 'deps': ['a'], 'workers_arg': 'max_workers'},
+              {'name': 'd', 'func': sleep_stage, 'args': ('d', 0.1), 'deps': ['a'], 'kwargs': {'max_workers': 3},
+               'workers_arg': 'max_workers'}]
+
+    pipeline_info = run_pipeline(stages, max_workers=8, executor='thread')
+
+    results = {name: info['result'] for name, info in pipeline_info['stages'].items()}
+    assert results == {'a': 8, 'b': 2, 'c': 2, 'd': 3}
+
+
+def test_unchanged_stages_are_skipped(tmp_path):
+    file_in, file_a, file_b = str(tmp_path / 'in.txt'), str(tmp_path / 'a.txt'), str(tmp_path / 'b.txt')
+    with open(file_in, 'w') as f:
+        f.write('in-')
+    stages = [{'name': 'a', 'func': copy_stage, 'args': ('a', file_in, file_a), 'inputs': [file_in],
+               'outputs': [file_a]},
+              {'name': 'b', 'func': copy_stage, 'args': ('b', file_a, file_b), 'deps': ['a'], 'inputs': [file_a],
+               'outputs': [file_b]}]
+    manifest_path = str(tmp_path / 'manifest.json')
+
+    run_pipeline(stages, executor='thread', manifest=DEMManifest(manifest_path))
+    assert CALLS == ['a', 'b']
+
+    # Nothing is changed, all stages are skipped (the critical path is still computed).
+    pipeline_info = run_pipeline(stages, executor='thread', manifest=DEMManifest(manifest_path))
+    assert CALLS == ['a', 'b']
+    assert all(info['skipped'] for info in pipeline_info['stages'].values())
+    assert pipeline_info['critical_time'] == 0.0
+
+    # The output of 'b' is removed, only 'b' is rebuilt (after the skipped 'a').
+    os.remove(file_b)
+    pipeline_info = run_pipeline(stages, executor='thread', manifest=DEMManifest(manifest_path))
+    assert CALLS == ['a', 'b', 'b']
+    assert pipeline_info['stages']['a']['skipped'] and not pipeline_info['stages']['b']['skipped']
+
+    # The input is changed, both stages are rebuilt.
+    with open(file_in, 'w') as f:
+        f.write('new-input-')
+    run_pipeline(stages, executor='thread', manifest=DEMManifest(manifest_path))
+    assert CALLS == ['a', 'b', 'b', 'a', 'b']
+    with open(file_b, 'r') as f:
+        assert f.read() == 'new-input-ab'
+
+    # The arguments of 'b' are changed, only 'b' is rebuilt.
+    stages[1]['args'] = ('b2', file_a, file_b)
+    run_pipeline(stages, executor='thread', manifest=DEMManifest(manifest_path))
+    assert CALLS == ['a', 'b', 'b', 'a', 'b', 'b2']
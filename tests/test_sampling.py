@@ -0,0 +1,136 @@
+'''Tests of the batch sampler and the block cache on synthetic DEMs.'''
+
+import os
+
+import numpy as np
+import pytest
+
+gdal = pytest.importorskip('osgeo.gdal')
+
+from pyDEM_function import DEMBlockCache  # noqa: E402
+from pyDEM_function import dem_creation_options  # noqa: E402
+from pyDEM_function import sample_elevation  # noqa: E402
+from pyDEM_function import write_dem  # noqa: E402
+
+NODATA = -9999
+GT = (100.0, 10.0, 0.0, 500.0, 0.0, -10.0)  # 10 m pixels, the top-left corner at (100, 500).
+
+
+def mem_dem(dem_array, gt=GT, nodata=NODATA):
+    '''Create an in-memory DEM (Float32).'''
+    dem_data = gdal.GetDriverByName('MEM').Create('', dem_array.shape[1], dem_array.shape[0], 1, gdal.GDT_Float32)
+    dem_data.SetGeoTransform(gt)
+    dem_data.GetRasterBand(1).SetNoDataValue(nodata)
+    dem_data.GetRasterBand(1).WriteArray(dem_array)
+
+    return dem_data
+
+
+def pixel_to_geo(col, row, gt=GT):
+    '''Get the coordinates of fractional pixel/line positions.'''
+    return gt[0] + np.asarray(col, dtype=np.float64) * gt[1], gt[3] + np.asarray(row, dtype=np.float64) * gt[5]
+
+
+def test_nearest_samples_containing_pixel():
+    dem_array = np.arange(40 * 70, dtype=np.float32).reshape(40, 70)
+    x_geo, y_geo = pixel_to_geo([69.9, 3.6, 0.0, 0.4], [0.1, 2.6, 39.99, 0.5])
+
+    site_sample = sample_elevation(mem_dem(dem_array), x_geo, y_geo)
+
+    assert site_sample['inside'].all()
+    np.testing.assert_array_equal(site_sample['row'], [0, 2, 39, 0])
+    np.testing.assert_array_equal(site_sample['col'], [69, 3, 0, 0])
+    np.testing.assert_array_equal(site_sample['elevation'], dem_array[[0, 2, 39, 0], [69, 3, 0, 0]])
+
+
+def test_outside_and_nodata_are_nan():
+    dem_array = np.ones((10, 10), dtype=np.float32)
+    dem_array[4, 5] = NODATA
+    x_geo, y_geo = pixel_to_geo([-0.1, 10.0, 5.5, 5.5, np.nan], [5.0, 5.0, 4.5, 10.0, 5.0])
+
+    site_sample = sample_elevation(mem_dem(dem_array), x_geo, y_geo)
+
+    np.testing.assert_array_equal(site_sample['inside'], [False, False, True, False, False])
+    assert not site_sample['valid'].any()
+    assert np.isnan(site_sample['elevation']).all()
+
+
+@pytest.mark.parametrize('method', ['bilinear', 'bicubic'])
+def test_interpolation_reproduces_plane(method):
+    rows, cols = np.mgrid[0:30, 0:40]
+    dem_array = (2.0 * cols + 3.0 * rows).astype(np.float32)
+    rng = np.random.RandomState(0)
+    x_pixel, y_line = rng.uniform(1.5, 38.5, 200), rng.uniform(1.5, 28.5, 200)
+
+    site_sample = sample_elevation(mem_dem(dem_array), *pixel_to_geo(x_pixel, y_line), method=method)
+
+    # The values are at the centres of pixels.
+    np.testing.assert_allclose(site_sample['elevation'], 2.0 * (x_pixel - 0.5) + 3.0 * (y_line - 0.5), atol=1e-6)
+    np.testing.assert_array_equal(site_sample['col'], np.floor(x_pixel))
+
+
+def test_bilinear_skips_nodata_neighbours():
+    dem_array = np.full((4, 4), 5.0, dtype=np.float32)
+    dem_array[1, 2] = NODATA
+    # The neighbours of (1.9, 1.9) are the pixels [1:3, 1:3], the pixel [1, 2] is nodata.
+    x_geo, y_geo = pixel_to_geo([1.9, 2.5], [1.9, 1.5])
+
+    site_sample = sample_elevation(mem_dem(dem_array), x_geo, y_geo, method='bilinear')
+
+    assert site_sample['elevation'][0] == pytest.approx(5.0)
+    assert np.isnan(site_sample['elevation'][1])  # The containing pixel is nodata.
+
+
+def test_block_and_full_reads_agree():
+    rng = np.random.RandomState(1)
+    dem_array = rng.uniform(0, 1000, (300, 500)).astype(np.float32)
+    dem_array[rng.rand(300, 500) < 0.05] = NODATA
+    dem_data = mem_dem(dem_array)
+    x_geo, y_geo = pixel_to_geo(rng.uniform(-5, 505, 1000), rng.uniform(-5, 305, 1000))
+
+    for method in ['nearest', 'bilinear', 'bicubic']:
+        full = sample_elevation(dem_data, x_geo, y_geo, read_mode='full', method=method)
+        block = sample_elevation(dem_data, x_geo, y_geo, read_mode='block', block_cache=DEMBlockCache(),
+                                 method=method)
+        np.testing.assert_array_equal(full['elevation'], block['elevation'])
+
+
+def test_block_cache_serves_repeated_queries_of_in_memory_dem():
+    dem_a = mem_dem(np.zeros((200, 200), dtype=np.float32))
+    dem_b = mem_dem(np.ones((200, 200), dtype=np.float32))
+    x_geo, y_geo = pixel_to_geo(np.linspace(0, 199, 50), np.linspace(0, 199, 50))
+    block_cache = DEMBlockCache()
+
+    sample_elevation(dem_a, x_geo, y_geo, block_cache=block_cache)
+    misses, bytes_read = block_cache.misses, block_cache.bytes_read
+    assert misses > 0
+
+    site_sample = sample_elevation(dem_a, x_geo, y_geo, block_cache=block_cache)
+    assert (block_cache.misses, block_cache.bytes_read) == (misses, bytes_read)
+    assert block_cache.hits == misses
+    np.testing.assert_array_equal(site_sample['elevation'], 0.0)
+
+    # Another in-memory DEM (with the same empty description) is not served by the blocks of the first.
+    site_sample = sample_elevation(dem_b, x_geo, y_geo, block_cache=block_cache)
+    np.testing.assert_array_equal(site_sample['elevation'], 1.0)
+
+
+def test_block_cache_drops_blocks_of_rewritten_file(tmp_path):
+    dem_file = str(tmp_path / 'dem.tif')
+    d_options = dem_creation_options(gdal.GDT_Float32, block_size=64)
+    x_geo, y_geo = pixel_to_geo(np.linspace(0, 255, 100), np.linspace(0, 255, 100))
+    block_cache = DEMBlockCache()
+
+    write_dem(dem_file, np.zeros((256, 256), dtype=np.float32), 256, 256, 1, GT, '', d_type=gdal.GDT_Float32,
+              d_options=d_options)
+    site_sample = sample_elevation(gdal.Open(dem_file), x_geo, y_geo, block_cache=block_cache)
+    np.testing.assert_array_equal(site_sample['elevation'], 0.0)
+    cached_bytes = block_cache.cached_bytes
+
+    write_dem(dem_file, np.full((256, 256), 7.0, dtype=np.float32), 256, 256, 1, GT, '', d_type=gdal.GDT_Float32,
+              d_options=d_options)
+    file_stat = os.stat(dem_file)
+    os.utime(dem_file, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + 10 ** 9))  # A distinct modification time.
+    site_sample = sample_elevation(gdal.Open(dem_file), x_geo, y_geo, block_cache=block_cache)
+    np.testing.assert_array_equal(site_sample['elevation'], 7.0)
+    assert block_cache.cached_bytes == cached_bytes
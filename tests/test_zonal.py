@@ -0,0 +1,84 @@
+'''Tests of the zonal statistics (summed-area tables and sparse tables of extrema) on synthetic DEMs.'''
+
+import numpy as np
+import pytest
+
+gdal = pytest.importorskip('osgeo.gdal')
+
+from pyDEM_function import buffer_windows  # noqa: E402
+from pyDEM_function import dem_geo_to_pixel  # noqa: E402
+from pyDEM_function import summed_area_tables  # noqa: E402
+from pyDEM_function import window_sums  # noqa: E402
+from pyDEM_function import zonal_statistics  # noqa: E402
+
+NODATA = -9999
+GT = (0.0, 30.0, 0.0, 0.0, 0.0, -30.0)  # 30 m pixels in a PCS.
+
+
+def mem_dem(dem_array, gt=GT, nodata=NODATA):
+    '''Create an in-memory DEM (Float32).'''
+    dem_data = gdal.GetDriverByName('MEM').Create('', dem_array.shape[1], dem_array.shape[0], 1, gdal.GDT_Float32)
+    dem_data.SetGeoTransform(gt)
+    dem_data.GetRasterBand(1).SetNoDataValue(nodata)
+    dem_data.GetRasterBand(1).WriteArray(dem_array)
+
+    return dem_data
+
+
+def test_window_sums_match_slices():
+    rng = np.random.RandomState(0)
+    dem_array = rng.uniform(-10, 10, (50, 60))
+    dem_array[rng.rand(50, 60) < 0.1] = np.nan
+    tables = summed_area_tables(dem_array, shift=0.0)
+
+    row_0, col_0 = rng.randint(0, 50, 100), rng.randint(0, 60, 100)
+    row_1, col_1 = row_0 + rng.randint(0, 50 - row_0 + 1), col_0 + rng.randint(0, 60 - col_0 + 1)
+    count, w_sum, w_sum2 = window_sums(tables, row_0, col_0, row_1, col_1)
+
+    windows = [dem_array[r0:r1, c0:c1] for r0, c0, r1, c1 in zip(row_0, col_0, row_1, col_1)]
+    np.testing.assert_array_equal(count, [np.count_nonzero(~np.isnan(w)) for w in windows])
+    np.testing.assert_allclose(w_sum, [np.nansum(w) for w in windows], atol=1e-9)
+    np.testing.assert_allclose(w_sum2, [np.nansum(w * w) for w in windows], atol=1e-9)
+
+
+@pytest.mark.parametrize('shape', ['square', 'circle'])
+@pytest.mark.parametrize('mem_budget', [None, 300000])
+def test_zonal_statistics_match_brute_force(shape, mem_budget):
+    rng = np.random.RandomState(1)
+    dem_array = rng.uniform(1000, 1100, (300, 200)).astype(np.float32)
+    dem_array[50:90, 20:120] = NODATA
+    d_row, d_col = dem_array.shape
+    n_points, radii = 60, [100.0, 1000.0, 2500.0]
+    x_geo = rng.uniform(-500, d_col * 30 + 500, n_points)
+    y_geo = -rng.uniform(-500, d_row * 30 + 500, n_points)
+
+    zone_stats = zonal_statistics(mem_dem(dem_array), x_geo, y_geo, radii, shape=shape, mem_budget=mem_budget)
+
+    # The cells of buffers are the cells of their windows (see 'buffer_windows').
+    values = np.where(dem_array == NODATA, np.nan, dem_array.astype(np.float64))
+    x_pixel, y_line = dem_geo_to_pixel(GT, x_geo, y_geo)
+    for k, radius in enumerate(radii):
+        windows = buffer_windows(x_pixel, y_line, radius / 30, radius / 30, d_row, d_col, shape=shape)
+        for i in range(n_points):
+            cells = np.concatenate([values[w[0]:w[2], w[1]:w[3]].ravel() for w in windows[i]])
+            valid = cells[~np.isnan(cells)]
+            assert zone_stats['count'][i, k] == valid.size
+            assert zone_stats['nodata_count'][i, k] == cells.size - valid.size
+            if valid.size == 0:
+                assert np.isnan(zone_stats['mean'][i, k]) and np.isnan(zone_stats['max'][i, k])
+                continue
+            assert zone_stats['mean'][i, k] == pytest.approx(valid.mean(), abs=1e-6)
+            assert zone_stats['std'][i, k] == pytest.approx(valid.std(), abs=1e-6)
+            assert zone_stats['min'][i, k] == valid.min()
+            assert zone_stats['max'][i, k] == valid.max()
+
+
+def test_square_buffers_contain_cell_centres():
+    dem_array = np.ones((100, 100), dtype=np.float32)
+    x_geo, y_geo = np.array([50 * 30.0 + 7.0]), np.array([-50 * 30.0 - 11.0])
+
+    zone_stats = zonal_statistics(mem_dem(dem_array), x_geo, y_geo, [95.0], shape='square')
+
+    rows, cols = np.mgrid[0:100, 0:100]
+    inside = (np.abs((cols + 0.5) * 30 - x_geo[0]) <= 95.0) & (np.abs(-(rows + 0.5) * 30 - y_geo[0]) <= 95.0)
+    assert zone_stats['count'][0, 0] == inside.sum()